@@ -0,0 +1,57 @@
+"""Throughput with a fixed number of requests in flight vs. the adaptive (AIMD) limit.
+
+The mock server generates --parallel requests at once and queues the rest; with
+--contention, each extra stream also slows the others, like batching on one GPU. Too few
+requests in flight leave slots idle, too many only queue and push the time to first token
+towards the timeout. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_adaptive.py --requests 60 --parallel 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_analyzer.client import OllamaClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_ollama  # noqa: E402
+
+
+def run(client, requests, submitters):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=submitters) as pool:
+        results = list(pool.map(lambda _: client.generate(b"image", "describe", "llava"), range(requests)))
+    wall = time.perf_counter() - start
+    ttft = [r.first_token_seconds for r in results if r.first_token_seconds is not None]
+    return wall, statistics.median(ttft), max(ttft)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=60, help="Requests per case (default: 60).")
+    parser.add_argument("--ceiling", type=int, default=16,
+                        help="Requests submitted at once, and the adaptive limit's maximum (default: 16).")
+    mock_ollama.add_arguments(parser)
+    parser.set_defaults(tokens=40, tokens_per_second=200.0, first_token_seconds=0.1, parallel=4, contention=0.15)
+    args = parser.parse_args()
+    config = mock_ollama.config_from_args(args)
+
+    print(f"{args.requests} requests, server runs {config.parallel} at once, contention {config.contention}")
+    print(f"{'case':<18} {'wall s':>8} {'img/s':>7} {'ttft p50':>9} {'ttft max':>9}")
+    cases = [(f"fixed {n}", n, None) for n in sorted({1, config.parallel, args.ceiling})]
+    cases.append(("adaptive", args.ceiling, args.ceiling))
+    for name, in_flight, adaptive_limit in cases:
+        with mock_ollama.MockOllamaServer(config) as server:
+            with OllamaClient(server.url, pool_size=in_flight, adaptive_limit=adaptive_limit) as client:
+                wall, ttft_p50, ttft_max = run(client, args.requests, in_flight)
+                summary = client.limiter.summary() if client.limiter is not None else None
+        print(f"{name:<18} {wall:8.2f} {args.requests / wall:7.2f} {ttft_p50:9.2f} {ttft_max:9.2f}")
+        if summary:
+            print(f"  {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Model loads for a mixed-model workload, sent in arrival order vs. through the ModelScheduler.
+
+Requests alternate between models and are submitted from several threads at once, like
+batches for different models sharing one server. The mock server keeps one model loaded
+and charges --load-seconds for every switch. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_model_swaps.py --requests 24 --load-seconds 1
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_analyzer.client import OllamaClient
+from photo_analyzer.photo_analyzer import MODEL_OPTIONS
+from photo_analyzer.scheduler import ModelScheduler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_ollama  # noqa: E402
+
+
+def run(client, requests, submitters):
+    models = [MODEL_OPTIONS[i % len(MODEL_OPTIONS)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=submitters) as pool:
+        results = list(pool.map(lambda model: client.generate(b"image", "describe", model), models))
+    wall = time.perf_counter() - start
+    load = sum((r.stats.load_duration or 0) for r in results) / 1e9
+    return wall, load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=24, help="Requests per case (default: 24).")
+    parser.add_argument("--submitters", type=int, default=8,
+                        help="Threads submitting requests at once (default: 8).")
+    mock_ollama.add_arguments(parser)
+    parser.set_defaults(tokens=20, tokens_per_second=200.0, first_token_seconds=0.05, load_seconds=1.0,
+                        max_loaded_models=1)
+    args = parser.parse_args()
+    config = mock_ollama.config_from_args(args)
+
+    print(f"{args.requests} requests alternating {', '.join(MODEL_OPTIONS)}, {args.submitters} submitters, "
+          f"{config.parallel} parallel, load {config.load_seconds}s, {config.max_loaded_models} model(s) loaded")
+    print(f"{'case':<24} {'wall s':>8} {'loads':>6} {'load s':>8}")
+    for name in ("arrival order (before)", "scheduler (after)"):
+        with mock_ollama.MockOllamaServer(config) as server:
+            client = OllamaClient(server.url, pool_size=args.submitters)
+            if name.startswith("scheduler"):
+                client = ModelScheduler(client, slots=config.parallel, max_loaded_models=config.max_loaded_models)
+            with client:
+                wall, load = run(client, args.requests, args.submitters)
+            print(f"{name:<24} {wall:8.2f} {server.loads:6d} {load:8.2f}")
+            if name.startswith("scheduler"):
+                print(client.report())
+
+
+if __name__ == "__main__":
+    main()
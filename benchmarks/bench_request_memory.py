@@ -0,0 +1,69 @@
+"""Peak memory needed to build one /api/generate request body, before and after streaming.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_request_memory.py --size-mb 25
+"""
+import argparse
+import base64
+import json
+import os
+import tempfile
+import tracemalloc
+
+from photo_analyzer.client import GenerateRequestBody
+
+# urllib3 pulls request bodies in blocks of this size
+SEND_BLOCK_SIZE = 16384
+
+
+def build_eager(image_bytes):
+    # What the original load_image + requests.post(json=payload) did
+    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+    payload = {"model": "llava", "prompt": "Describe this photo.", "images": [image_b64]}
+    return len(json.dumps(payload).encode("utf-8"))
+
+
+def build_streaming(image):
+    body = GenerateRequestBody({"model": "llava", "prompt": "Describe this photo."}, image)
+    sent = 0
+    for block in iter(lambda: body.read(SEND_BLOCK_SIZE), b""):
+        sent += len(block)
+    return sent
+
+
+def measure(fn, arg):
+    tracemalloc.start()
+    try:
+        size = fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=25.0, help="Size of the synthetic image (default: 25).")
+    args = parser.parse_args()
+
+    image_bytes = os.urandom(int(args.size_mb * 1024 * 1024))
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(image_bytes)
+    try:
+        cases = [
+            ("eager json= (before)", build_eager, image_bytes),
+            ("streamed from bytes", build_streaming, image_bytes),
+            ("streamed from file", build_streaming, f.name),
+        ]
+        print(f"Image: {len(image_bytes) / 1e6:.1f} MB")
+        print(f"{'case':<24} {'body MB':>9} {'peak MB':>9} {'peak / image':>13}")
+        for name, fn, arg in cases:
+            size, peak = measure(fn, arg)
+            print(f"{name:<24} {size / 1e6:9.1f} {peak / 1e6:9.1f} {peak / len(image_bytes):12.2f}x")
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main()
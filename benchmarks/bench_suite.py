@@ -0,0 +1,323 @@
+"""Benchmark suite: image loading, request encoding, stream parsing and end-to-end batches.
+
+End-to-end cases run against benchmarks/mock_ollama.py in a separate process, so the
+client's CPU time and memory are measured on their own. Results are saved as JSON for
+comparison across commits. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_suite.py
+    PYTHONPATH=src python benchmarks/bench_suite.py --cr3 IMG_0001.CR3 --compare benchmarks/results/<older>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from photo_analyzer.client import GenerateRequestBody, OllamaClient, StreamParser
+from photo_analyzer.metrics import quantile
+from photo_analyzer.photo_analyzer import PreprocessOptions, analyze_paths, load_image, rawpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_ollama  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# --- Constants ---
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MODEL = "llava"
+PROMPT = "Generate an Instagram caption and hashtags for this photo."
+# urllib3 pulls request bodies in blocks of this size
+SEND_BLOCK_SIZE = 16384
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+# Describe the workload rather than measure it; never compared
+DESCRIPTIVE_METRICS = {"source_mb", "payload_mb", "lines", "images", "failed"}
+# os.times() ticks in 10 ms steps, so smaller CPU totals are noise
+CPU_NOISE_FLOOR_SECONDS = 0.1
+
+
+def cpu_seconds():
+    # Includes finished child processes, e.g. the decode pool of an end-to-end batch
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage * scale / 1e6
+
+
+def timed(fn, repeat):
+    """Latency percentiles and CPU time over repeat calls, then Python peak memory of one more call."""
+    times = []
+    cpu = cpu_seconds()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    cpu = cpu_seconds() - cpu
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "mean_ms": sum(times) / len(times) * 1000,
+        "p50_ms": quantile(times, 0.5) * 1000,
+        "p95_ms": quantile(times, 0.95) * 1000,
+        "cpu_seconds": cpu,
+        "peak_mb": peak / 1e6,
+    }
+
+
+# --- Fixtures ---
+def photo_like(megapixels, seed=0):
+    # Smooth gradients plus sensor-like noise, so JPEG/PNG sizes resemble real photos
+    width = int((megapixels * 1e6 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 200, y / height * 180, (x + y) / (width + height) * 160], axis=-1)
+    noise = rng.normal(0, 6, size=base.shape)
+    return Image.fromarray(np.clip(base + noise + 30, 0, 255).astype(np.uint8))
+
+
+def make_fixtures(directory, megapixels):
+    img = photo_like(megapixels)
+    paths = {}
+    for name, fmt, kwargs in (("photo.jpg", "JPEG", {"quality": 92}), ("photo.png", "PNG", {})):
+        paths[fmt.lower()] = os.path.join(directory, name)
+        img.save(paths[fmt.lower()], format=fmt, **kwargs)
+    return paths
+
+
+# --- Cases ---
+def bench_load(path, repeat):
+    preprocess = PreprocessOptions.for_model(MODEL)
+    result = timed(lambda: load_image(path, preprocess), repeat)
+    result["source_mb"] = os.path.getsize(path) / 1e6
+    return result
+
+
+def bench_encode(payload, repeat):
+    def build_and_send():
+        body = GenerateRequestBody({"model": MODEL, "prompt": PROMPT, "stream": True}, payload)
+        for _ in iter(lambda: body.read(SEND_BLOCK_SIZE), b""):
+            pass
+
+    result = timed(build_and_send, repeat)
+    result["payload_mb"] = len(payload) / 1e6
+    result["mb_per_second"] = len(payload) / 1e6 / (result["mean_ms"] / 1000)
+    return result
+
+
+def bench_parse(lines, repeat):
+    def parse():
+        parser = StreamParser()
+        for line in lines:
+            parser.feed(line)
+
+    result = timed(parse, repeat)
+    result["lines"] = len(lines)
+    result["lines_per_second"] = len(lines) / (result["mean_ms"] / 1000)
+    return result
+
+
+def stream_lines(tokens):
+    lines = [json.dumps({"model": MODEL, "created_at": "2025-01-01T00:00:00Z", "response": word + " ",
+                         "done": False}).encode()
+             for word in (mock_ollama.WORDS * (tokens // len(mock_ollama.WORDS) + 1))[:tokens]]
+    lines.append(json.dumps({"model": MODEL, "created_at": "2025-01-01T00:00:00Z", "response": "", "done": True,
+                             "eval_count": tokens, "eval_duration": 10 ** 9}).encode())
+    return lines
+
+
+def start_mock_server(args):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_ollama.py"),
+               "--port", "0", "--tokens", str(args.tokens), "--tokens-per-second", str(args.tokens_per_second),
+               "--first-token-seconds", str(args.first_token_seconds), "--parallel", str(args.parallel),
+               "--jitter", str(args.jitter)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def bench_end_to_end(args, directory):
+    paths = []
+    img = photo_like(args.megapixels, seed=1)
+    for i in range(args.images):
+        paths.append(os.path.join(directory, f"batch_{i:04d}.jpg"))
+        img.save(paths[-1], format="JPEG", quality=92)
+
+    server, url = start_mock_server(args)
+    try:
+        with OllamaClient(url, pool_size=args.in_flight) as client:
+            cpu = cpu_seconds()
+            report = analyze_paths(paths, PROMPT, MODEL, decode_workers=args.workers, in_flight=args.in_flight,
+                                   preprocess=PreprocessOptions.for_model(MODEL), client=client)
+            cpu = cpu_seconds() - cpu
+    finally:
+        server.terminate()
+        server.wait()
+    latency = [r.request_seconds for r in report.results if r.ok]
+    ttft = [r.ttft_seconds for r in report.results if r.ttft_seconds is not None]
+    # Lower bound with unlimited client speed: every slot of the server busy all the time
+    per_request = args.first_token_seconds + args.tokens / args.tokens_per_second
+    ideal = args.images * per_request / min(args.parallel, args.in_flight)
+    return {
+        "images": args.images,
+        "failed": report.failed,
+        "wall_seconds": report.wall_seconds,
+        "images_per_second": report.images_per_second,
+        "efficiency": ideal / report.wall_seconds if report.wall_seconds else 0.0,
+        "latency_p50_ms": quantile(latency, 0.5) * 1000,
+        "latency_p90_ms": quantile(latency, 0.9) * 1000,
+        "latency_p99_ms": quantile(latency, 0.99) * 1000,
+        "ttft_p50_ms": quantile(ttft, 0.5) * 1000,
+        "ttft_p99_ms": quantile(ttft, 0.99) * 1000,
+        "cpu_seconds": cpu,
+        "cpu_seconds_per_image": cpu / args.images,
+    }
+
+
+# --- Results ---
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_second") or metric == "efficiency"
+
+
+def comparable(metric, previous):
+    if metric in DESCRIPTIVE_METRICS:
+        return False
+    if metric == "cpu_seconds" and previous < CPU_NOISE_FLOOR_SECONDS:
+        return False
+    return True
+
+
+def compare(old, new, threshold):
+    """Print changes of every shared metric; returns the regressions beyond threshold."""
+    regressions = []
+    print(f"\nCompared with {old.get('commit') or 'unknown commit'} ({old.get('timestamp', '?')}):")
+    print(f"{'case':<14} {'metric':<22} {'before':>12} {'after':>12} {'change':>8}")
+    for case, metrics in new["cases"].items():
+        before = old.get("cases", {}).get(case)
+        if not before:
+            continue
+        for metric, value in metrics.items():
+            previous = before.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+                continue
+            if not comparable(metric, previous):
+                continue
+            change = (value - previous) / previous
+            worse = -change if higher_is_better(metric) else change
+            flag = " !" if worse > threshold else ""
+            if flag:
+                regressions.append((case, metric, change))
+            print(f"{case:<14} {metric:<22} {previous:12.3f} {value:12.3f} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions of each micro case (default: 5).")
+    parser.add_argument("--megapixels", type=float, default=24.0,
+                        help="Size of the synthetic JPEG/PNG fixtures (default: 24).")
+    parser.add_argument("--cr3", action="append", default=[], metavar="PATH",
+                        help="CR3 file to benchmark decoding with (repeatable; skipped when absent).")
+    parser.add_argument("--images", type=int, default=24, help="Images in the end-to-end batch (default: 24).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decode processes in the end-to-end batch (default: CPU count).")
+    parser.add_argument("--in-flight", type=int, default=2, help="Concurrent requests end to end (default: 2).")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the micro benchmarks.")
+    parser.add_argument("--output", help=f"Where to save the results (default: {RESULTS_DIR}/<time>-<commit>.json).")
+    parser.add_argument("--compare", metavar="PATH", help="Earlier results to compare with.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Relative slowdown reported as a regression; exits 1 if any "
+                             f"(default: {DEFAULT_REGRESSION_THRESHOLD}).")
+    mock_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    cases = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = make_fixtures(tmp, args.megapixels)
+        for fmt, path in fixtures.items():
+            print(f"load {fmt}...", file=sys.stderr)
+            cases[f"load_{fmt}"] = bench_load(path, args.repeat)
+        if args.cr3 and rawpy is not None:
+            for i, path in enumerate(args.cr3):
+                print(f"load cr3 {path}...", file=sys.stderr)
+                cases["load_cr3" if i == 0 else f"load_cr3_{i}"] = bench_load(path, args.repeat)
+        elif args.cr3:
+            print("rawpy is not installed, skipping CR3", file=sys.stderr)
+
+        # The original JPEG, as sent with --no-preprocess: large enough for a stable MB/s figure
+        with open(fixtures["jpeg"], "rb") as f:
+            payload = f.read()
+        print("encode...", file=sys.stderr)
+        cases["encode"] = bench_encode(payload, args.repeat * 4)
+        print("parse...", file=sys.stderr)
+        cases["parse"] = bench_parse(stream_lines(5000), args.repeat)
+        if not args.skip_e2e:
+            print("end to end...", file=sys.stderr)
+            cases["end_to_end"] = bench_end_to_end(args, tmp)
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "max_rss_mb": max_rss_mb(),
+        "config": vars(args),
+        "cases": cases,
+    }
+
+    for case, metrics in cases.items():
+        print(f"{case:<14} " + ", ".join(
+            f"{k} {v:.3f}" if isinstance(v, float) else f"{k} {v}" for k, v in metrics.items()
+        ))
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}{'-dirty' if dirty else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
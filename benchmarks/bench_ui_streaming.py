@@ -0,0 +1,109 @@
+"""Tk-thread time spent showing streamed tokens, one callback per chunk vs. a buffer drained per frame.
+
+Needs a display (or Xvfb). Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_ui_streaming.py --tokens 1000 --rate 80
+"""
+import argparse
+import threading
+import time
+import tkinter as tk
+from tkinter import scrolledtext
+
+from photo_analyzer.photo_analyzer_gui import OUTPUT_FRAME_INTERVAL_MS, TextStream
+
+# A typical critique token, including the leading space
+TOKEN = " lighting"
+
+
+class UiTimer:
+    """Accumulates time spent inside Tk callbacks."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wrap(self, fn):
+        def timed():
+            start = time.perf_counter()
+            fn()
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+        return timed
+
+
+def produce(emit, tokens, rate, done):
+    # Stands in for the worker thread reading NDJSON chunks off the socket
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    for i in range(tokens):
+        emit(TOKEN)
+        if interval:
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    done.set()
+
+
+def run_per_chunk(root, box, tokens, rate):
+    # What append_text did before: one after(0) callback per chunk, each inserting and scrolling
+    timer = UiTimer()
+
+    def emit(text):
+        def inner():
+            box.insert(tk.END, text)
+            box.see(tk.END)
+        root.after(0, timer.wrap(inner))
+
+    done = threading.Event()
+    threading.Thread(target=produce, args=(emit, tokens, rate, done), daemon=True).start()
+    while not done.is_set() or timer.calls < tokens:
+        root.update()
+    return timer
+
+
+def run_buffered(root, box, tokens, rate):
+    timer = UiTimer()
+    stream = TextStream()
+    received = []
+
+    def flush():
+        text = stream.drain()
+        if text:
+            received.append(len(text))
+            box.insert(tk.END, text)
+            box.see(tk.END)
+        root.after(OUTPUT_FRAME_INTERVAL_MS, timed_flush)
+
+    timed_flush = timer.wrap(flush)
+    root.after(OUTPUT_FRAME_INTERVAL_MS, timed_flush)
+    done = threading.Event()
+    threading.Thread(target=produce, args=(stream.put, tokens, rate, done), daemon=True).start()
+    while not done.is_set() or sum(received) < tokens * len(TOKEN):
+        root.update()
+    return timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1000, help="Tokens to stream per case (default: 1000).")
+    parser.add_argument("--rate", type=float, default=80.0,
+                        help="Tokens per second from the producer thread; 0 for as fast as possible (default: 80).")
+    args = parser.parse_args()
+
+    root = tk.Tk()
+    root.title("bench_ui_streaming")
+    print(f"{args.tokens} tokens at {args.rate or 'unlimited'} tok/s, frame interval {OUTPUT_FRAME_INTERVAL_MS} ms")
+    print(f"{'case':<28} {'callbacks':>9} {'UI ms':>9} {'UI ms / 1k tokens':>18}")
+    for name, run in (("after(0) per chunk (before)", run_per_chunk), ("buffered per frame (after)", run_buffered)):
+        box = scrolledtext.ScrolledText(root, wrap=tk.WORD)
+        box.pack()
+        timer = run(root, box, args.tokens, args.rate)
+        per_1k = timer.seconds * 1000 * 1000 / args.tokens
+        print(f"{name:<28} {timer.calls:9d} {timer.seconds * 1000:9.1f} {per_1k:18.1f}")
+        box.destroy()
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
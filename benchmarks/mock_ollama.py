@@ -0,0 +1,251 @@
+"""Stand-in Ollama server for benchmarks: streams NDJSON tokens at a configurable rate and latency.
+
+Serves /api/generate, /api/chat and /api/tags like a real server with one model loaded, or
+with --max-loaded-models, one that loads and unloads models as requests ask for them.
+Run it on its own to point the GUI or the batch CLI at it:
+
+    python benchmarks/mock_ollama.py --port 11434 --tokens 120 --tokens-per-second 40
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("golden", "hour", "light", "spills", "across", "the", "wet", "street,", "leading", "the", "eye",
+         "toward", "a", "lone", "figure.", "#streetphotography", "#cinematic", "#urban")
+
+
+@dataclass
+class MockConfig:
+    tokens: int = 120
+    tokens_per_second: float = 50.0
+    # Prompt evaluation time (image included) before the first token
+    first_token_seconds: float = 0.3
+    # Paid by the first request only, like loading a cold model
+    load_seconds: float = 0.0
+    # When set, models are tracked separately: one that is not loaded costs load_seconds and, once
+    # this many are loaded, unloads the least recently used, like OLLAMA_MAX_LOADED_MODELS
+    max_loaded_models: int = 0
+    prompt_tokens: int = 600
+    # Relative random variation of every delay
+    jitter: float = 0.1
+    # Requests generated at the same time, like OLLAMA_NUM_PARALLEL; the rest wait
+    parallel: int = 2
+    # Share of a stream's speed lost to each other stream generating at once, like batching on one GPU
+    contention: float = 0.0
+
+
+def _ns(seconds):
+    return int(seconds * 1e9)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json({"models": [{"name": "llava:latest"}, {"name": "gemma3:latest"}]})
+
+    def do_POST(self):
+        # Decoding the body, base64 image included, is part of what a real server does
+        body = json.loads(self._read_body())
+        server = self.server
+        load = server.take_load(body["model"])
+        if body.get("stream") is False:
+            time.sleep(load)
+            self._send_json({"model": body["model"], "created_at": now(), "response": "", "done": True,
+                             "done_reason": "load", "load_duration": _ns(load)})
+            return
+        with server.slots:
+            server.adjust_active(1)
+            try:
+                self._stream(body, load)
+            finally:
+                server.adjust_active(-1)
+
+    def _stream(self, body, load):
+        config = self.server.config
+        chat = self.path == "/api/chat"
+        started = time.perf_counter()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(record):
+            line = json.dumps(record).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def token_record(text, done=False):
+            record = {"model": body["model"], "created_at": now(), "done": done}
+            if chat:
+                record["message"] = {"role": "assistant", "content": text}
+            else:
+                record["response"] = text
+            return record
+
+        rng = random.Random()
+        prompt_eval = config.first_token_seconds * (1 + rng.uniform(-config.jitter, config.jitter))
+        prompt_eval *= 1 + config.contention * (self.server.active - 1)
+        deadline = started + load + prompt_eval
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second else 0.0
+        try:
+            for i in range(config.tokens):
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                write(token_record(WORDS[i % len(WORDS)] + " "))
+                slowdown = 1 + config.contention * (self.server.active - 1)
+                deadline += interval * slowdown * (1 + rng.uniform(-config.jitter, config.jitter))
+            total = time.perf_counter() - started
+            final = token_record("", done=True)
+            final.update(
+                done_reason="stop", total_duration=_ns(total), load_duration=_ns(load),
+                prompt_eval_count=config.prompt_tokens, prompt_eval_duration=_ns(prompt_eval),
+                eval_count=config.tokens, eval_duration=_ns(max(0.0, total - load - prompt_eval)),
+            )
+            write(final)
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            # The client cancelled the generation
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: MockConfig, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockOllamaHandler)
+        self.config = config
+        self.slots = threading.BoundedSemaphore(max(1, config.parallel))
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self.resident = OrderedDict()
+        self.loads = 0
+        self.active = 0
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections are not errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def adjust_active(self, delta):
+        with self._load_lock:
+            self.active += delta
+
+    def take_load(self, model):
+        with self._load_lock:
+            if not self.config.max_loaded_models:
+                if self._loaded:
+                    return 0.0
+                self._loaded = True
+                self.loads += 1
+                return self.config.load_seconds
+            if model in self.resident:
+                self.resident.move_to_end(model)
+                return 0.0
+            if len(self.resident) >= self.config.max_loaded_models:
+                self.resident.popitem(last=False)
+            self.resident[model] = None
+            self.loads += 1
+            return self.config.load_seconds
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def add_arguments(parser):
+    defaults = MockConfig()
+    parser.add_argument("--tokens", type=int, default=defaults.tokens,
+                        help=f"Tokens per response (default: {defaults.tokens}).")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help=f"Generation rate per stream (default: {defaults.tokens_per_second}).")
+    parser.add_argument("--first-token-seconds", type=float, default=defaults.first_token_seconds,
+                        help="Prompt evaluation time before the first token "
+                             f"(default: {defaults.first_token_seconds}).")
+    parser.add_argument("--load-seconds", type=float, default=defaults.load_seconds,
+                        help="Model load time paid by the first request (default: 0).")
+    parser.add_argument("--max-loaded-models", type=int, default=defaults.max_loaded_models,
+                        help="Load models separately, keeping at most this many, each load costing "
+                             "--load-seconds (default: 0, a single model loaded by the first request).")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter,
+                        help=f"Relative random variation of delays (default: {defaults.jitter}).")
+    parser.add_argument("--parallel", type=int, default=defaults.parallel,
+                        help=f"Requests generated concurrently (default: {defaults.parallel}).")
+    parser.add_argument("--contention", type=float, default=defaults.contention,
+                        help="Share of a stream's speed lost to each other stream generating at once "
+                             f"(default: {defaults.contention}).")
+
+
+def config_from_args(args):
+    return MockConfig(tokens=args.tokens, tokens_per_second=args.tokens_per_second,
+                      first_token_seconds=args.first_token_seconds, load_seconds=args.load_seconds,
+                      max_loaded_models=args.max_loaded_models, jitter=args.jitter, parallel=args.parallel,
+                      contention=args.contention)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=11434, help="Port to listen on; 0 picks a free one.")
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = MockOllamaServer(config_from_args(args), args.host, args.port)
+    # The benchmark suite reads the address from this line
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
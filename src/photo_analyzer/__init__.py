@@ -1 +1,31 @@
-# (empty file)
+from .cache import ResultCache, cache_key
+from .protocol import CancelToken, GenerationResult, OllamaResponse
+
+# Imported when first asked for: loading photo_analyzer.photo_analyzer here would make
+# `python -m photo_analyzer.photo_analyzer` run the module twice, and the HTTP client
+# pulls in requests
+_ENGINE_EXPORTS = (
+    "ImageResult",
+    "BatchReport",
+    "Conversation",
+    "load_image_as_base64",
+    "read_image_bytes",
+    "find_images",
+    "generate",
+    "analyze_image",
+    "analyze_paths",
+    "analyze_directory",
+)
+_CLIENT_EXPORTS = ("OllamaClient", "GenerationTimeout", "GenerationCancelled", "OllamaStreamError")
+
+
+def __getattr__(name):
+    if name in _ENGINE_EXPORTS:
+        from . import photo_analyzer
+
+        return getattr(photo_analyzer, name)
+    if name in _CLIENT_EXPORTS:
+        from . import client
+
+        return getattr(client, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
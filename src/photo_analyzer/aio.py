@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Callable, Dict, Any
+
+# Optional dependencies
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .cache import ResultCache, cache_key
+from .client import OllamaStreamError
+from .protocol import (
+    DEFAULT_BACKOFF,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_FIRST_TOKEN_TIMEOUT,
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_OLLAMA_HOST,
+    DEFAULT_RETRIES,
+    DEFAULT_TOTAL_TIMEOUT,
+    RETRY_STATUS_CODES,
+    GenerateRequestBody,
+    GenerationResult,
+    StreamParser,
+    normalize_host,
+    parse_keep_alive,
+    parse_stream_line,
+)
+from .photo_analyzer import (
+    DEFAULT_DECODE_WORKERS,
+    DEFAULT_RAW_MODE,
+    BatchReport,
+    ImageResult,
+    MissingDependencyError,
+    PreprocessOptions,
+    _decode_job,
+    cached_generation,
+    store_generation,
+)
+
+# --- Constants ---
+AIOHTTP_DEPENDENCY_MESSAGE = "aiohttp is required for the asyncio client.\nInstall with: pip install aiohttp"
+DEFAULT_CONCURRENCY = 8
+
+
+async def _iter_body(body):
+    # aiohttp streams async iterables; each chunk is one base64-encoded slice of the image
+    for chunk in body:
+        yield chunk
+
+
+class AsyncOllamaClient:
+    """asyncio counterpart of OllamaClient: one aiohttp session per event loop, same timeouts and retries."""
+
+    def __init__(self, base_url=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 first_token_timeout=DEFAULT_FIRST_TOKEN_TIMEOUT, total_timeout=DEFAULT_TOTAL_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, limit=DEFAULT_CONCURRENCY,
+                 keep_alive=DEFAULT_KEEP_ALIVE):
+        if aiohttp is None:
+            raise MissingDependencyError(AIOHTTP_DEPENDENCY_MESSAGE)
+        self.base_url = normalize_host(base_url or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST)
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self._session = None
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.connect_timeout, sock_read=self.first_token_timeout
+                ),
+            )
+        return self._session
+
+    async def _post(self, path, make_body):
+        session = self._get_session()
+        attempt = 0
+        while True:
+            body = make_body()
+            data = body if isinstance(body, bytes) else _iter_body(body)
+            try:
+                response = await session.post(
+                    self.url(path),
+                    data=data,
+                    headers={"Content-Type": "application/json", "Content-Length": str(len(body))},
+                )
+            except aiohttp.ClientConnectionError:
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    if response.status >= 400:
+                        response.release()
+                        response.raise_for_status()
+                    return response
+                response.release()
+            await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    async def warm(self, model, keep_alive=None):
+        """Load model into memory without generating anything; returns Ollama's load response."""
+        payload = {"model": model, "stream": False}
+        keep_alive = parse_keep_alive(keep_alive) if keep_alive is not None else self.keep_alive
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        response = await self._post("/api/generate", lambda: json.dumps(payload).encode("utf-8"))
+        async with response:
+            return parse_stream_line(await response.read())
+
+    async def _stream(self, image, prompt, model, bodies, extra, feed):
+        # feed(line) returns (item to yield, whether this was the final record)
+        if self.keep_alive is not None:
+            extra.setdefault("keep_alive", self.keep_alive)
+
+        def make_body():
+            bodies.append(GenerateRequestBody(dict({"model": model, "prompt": prompt}, **extra), image))
+            return bodies[-1]
+
+        response = await self._post("/api/generate", make_body)
+        async with response:
+            # Split NDJSON ourselves: StreamReader's line iterator rejects lines over 64 KiB,
+            # and the final record's context array can be larger than that. Partial lines are
+            # kept as a list of pieces so a long line is joined once, not re-copied per read.
+            pending = []
+            async for data in response.content.iter_any():
+                *lines, tail = data.split(b"\n")
+                if lines:
+                    lines[0] = b"".join(pending) + lines[0]
+                    pending = []
+                pending.append(tail)
+                for line in lines:
+                    if line.strip():
+                        item, done = feed(line)
+                        yield item
+                        if done:
+                            return
+            line = b"".join(pending)
+            if line.strip():
+                yield feed(line)[0]
+
+    async def stream(self, image, prompt, model, **extra):
+        """Async iterator of OllamaResponse chunks; the last one (done=True) carries the timing stats."""
+        def feed(line):
+            resp = parse_stream_line(line)
+            return resp, resp.done
+
+        async for resp in self._stream(image, prompt, model, [], extra, feed):
+            yield resp
+
+    async def _collect(self, image, prompt, model, on_chunk, extra):
+        start = time.monotonic()
+        bodies = []
+        parser = StreamParser()
+        first_token = None
+
+        def feed(line):
+            return parser.feed(line), parser.done
+
+        async for text in self._stream(image, prompt, model, bodies, extra, feed):
+            if first_token is None and (text or parser.done):
+                first_token = time.monotonic() - start
+            if on_chunk:
+                on_chunk(text)
+        parser.finish()
+        encode_seconds = sum(body.encode_seconds for body in bodies)
+        return GenerationResult(text=parser.text, stats=parser.final, encode_seconds=encode_seconds,
+                                first_token_seconds=first_token, wall_seconds=time.monotonic() - start)
+
+    async def analyze(self, image, prompt, model, on_chunk=None, **extra):
+        """Run one generation to completion; raises asyncio.TimeoutError after total_timeout."""
+        return await asyncio.wait_for(
+            self._collect(image, prompt, model, on_chunk, extra), self.total_timeout or None
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def analyze_paths_async(paths, prompt, model, concurrency=DEFAULT_CONCURRENCY,
+                              decode_workers=DEFAULT_DECODE_WORKERS, cache: Optional[ResultCache] = None,
+                              preprocess: Optional[PreprocessOptions] = None, raw_mode=DEFAULT_RAW_MODE,
+                              client: Optional[AsyncOllamaClient] = None,
+                              on_result: Optional[Callable[[ImageResult], None]] = None,
+                              options: Optional[Dict[str, Any]] = None):
+    """Batch runner on the asyncio client: `concurrency` generations in flight without a thread each."""
+    loop = asyncio.get_running_loop()
+    report = BatchReport()
+    start = time.perf_counter()
+    own_client = client is None
+    if own_client:
+        client = AsyncOllamaClient(limit=concurrency)
+    path_iter = iter(paths)
+
+    async def infer(result, image):
+        started = time.perf_counter()
+        try:
+            key = generation = None
+            if cache is not None:
+                key = cache_key(image, model, prompt, options)
+                generation = cached_generation(cache, key)
+            if generation is None:
+                generation = await client.analyze(image, prompt, model, **(options or {}))
+                if cache is not None:
+                    store_generation(cache, key, model, generation)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaStreamError, ValueError) as e:
+            # An error record or a malformed line in the stream fails this image, not the whole gather()
+            result.error = f"Request failed: {e!r}"
+        except OSError as e:
+            # Streamed from disk: the file was deleted or renamed after it was decoded
+            result.error = f"Failed to read image: {e!r}"
+        else:
+            result.record(generation, structured="format" in (options or {}))
+            result.inference_seconds = time.perf_counter() - started - result.encode_seconds
+            return
+        result.inference_seconds = time.perf_counter() - started
+
+    async def worker(decoders):
+        for path in path_iter:
+            result = ImageResult(path=path, model=model)
+            try:
+                loaded = await loop.run_in_executor(decoders, _decode_job, path, preprocess, raw_mode)
+            except Exception as e:
+                result.error = f"Failed to load image: {e}"
+            else:
+                result.decode_seconds = loaded.decode_seconds
+                result.preprocess_seconds = loaded.preprocess_seconds
+                result.source_bytes = loaded.source_bytes
+                result.payload_bytes = loaded.payload_bytes
+                await infer(result, loaded.source)
+            report.results.append(result)
+            if on_result:
+                on_result(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=decode_workers) as decoders:
+            await asyncio.gather(*(worker(decoders) for _ in range(concurrency)))
+    finally:
+        if own_client:
+            await client.close()
+    report.wall_seconds = time.perf_counter() - start
+    return report
+
+
+def run_batch(paths, prompt, model, client: Optional[AsyncOllamaClient] = None, **kwargs):
+    async def run():
+        try:
+            return await analyze_paths_async(paths, prompt, model, client=client, **kwargs)
+        finally:
+            if client is not None:
+                await client.close()
+
+    return asyncio.run(run())
@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+import requests
+
+from .client import (
+    CancelToken,
+    GenerationCancelled,
+    OllamaClient,
+    OllamaResponse,
+    get_default_client,
+    normalize_host,
+)
+
+# --- Constants ---
+BALANCE_STRATEGIES = ("least-outstanding", "latency")
+DEFAULT_BALANCE_STRATEGY = "least-outstanding"
+DEFAULT_HEALTH_INTERVAL = 15
+# Weight of the newest sample in the exponentially weighted latency average
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class NoBackendAvailable(requests.ConnectionError):
+    pass
+
+
+def model_tag(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+@dataclass
+class BackendStats:
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    busy_seconds: float = 0.0
+    eval_count: int = 0
+    eval_seconds: float = 0.0
+    ewma_latency: Optional[float] = None
+
+    @property
+    def mean_latency(self):
+        return self.busy_seconds / self.completed if self.completed else 0.0
+
+    @property
+    def tokens_per_second(self):
+        return self.eval_count / self.eval_seconds if self.eval_seconds else 0.0
+
+
+class Backend:
+    def __init__(self, client: OllamaClient):
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        # None until the first health check has listed the server's models
+        self.models: Optional[Set[str]] = None
+        self.stats = BackendStats()
+
+    @property
+    def url(self):
+        return self.client.base_url
+
+    def has_model(self, model):
+        return self.models is None or model_tag(model) in self.models
+
+    def check_health(self):
+        try:
+            response = self.client.session.get(self.client.url("/api/tags"), timeout=self.client.connect_timeout)
+            response.raise_for_status()
+            self.models = {m.get("name", "") for m in response.json().get("models", [])}
+        except (requests.RequestException, ValueError):
+            self.healthy = False
+        else:
+            self.healthy = True
+        return self.healthy
+
+
+class BackendPool:
+    """Spreads generations over several Ollama servers.
+
+    Requests go to the healthy backend that has the model and the fewest requests in
+    flight ("least-outstanding"), or the lowest expected wait given its recent latency
+    ("latency"). A backend that fails before any output was streamed is marked down and
+    the request fails over to the next one; periodic /api/tags checks bring it back.
+    The pool has the same generate()/close() interface as OllamaClient.
+    """
+
+    def __init__(self, hosts, strategy=DEFAULT_BALANCE_STRATEGY, health_interval=DEFAULT_HEALTH_INTERVAL,
+                 **client_options):
+        if strategy not in BALANCE_STRATEGIES:
+            raise ValueError(f"Unknown balancing strategy: {strategy!r}")
+        if not hosts:
+            raise ValueError("BackendPool needs at least one host")
+        self.backends = [Backend(OllamaClient(host, **client_options)) for host in hosts]
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def check_health(self):
+        for backend in self.backends:
+            backend.check_health()
+
+    def start_health_checks(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._health_thread.start()
+        return self
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.health_interval)
+
+    def warm(self, model, keep_alive=None):
+        """Load model on every healthy backend that has it, in parallel; returns the slowest load response."""
+        return max(self.warm_each(model, keep_alive).values(), key=lambda r: r.load_duration or 0)
+
+    def warm_each(self, model, keep_alive=None) -> Dict[str, OllamaResponse]:
+        """Like warm(), but returns the load response of each backend that loaded the model, by URL."""
+        targets = [b for b in self.backends if b.healthy and b.has_model(model)]
+        responses = [None] * len(targets)
+
+        def warm_one(i, backend):
+            try:
+                responses[i] = backend.client.warm(model, keep_alive)
+            except requests.ConnectionError:
+                backend.healthy = False
+            except requests.RequestException:
+                pass
+
+        threads = [threading.Thread(target=warm_one, args=(i, b), daemon=True) for i, b in enumerate(targets)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        loaded = {b.url: r for b, r in zip(targets, responses) if r is not None}
+        if not loaded:
+            raise NoBackendAvailable(f"Could not load model {model!r} on any backend")
+        return loaded
+
+    def _score(self, backend):
+        # Backends at their adaptive concurrency limit would make the request wait; use them last
+        limiter = backend.client.limiter
+        full = limiter is not None and backend.outstanding >= limiter.current
+        if self.strategy == "latency" and backend.stats.ewma_latency is not None:
+            return full, (backend.outstanding + 1) * backend.stats.ewma_latency, backend.outstanding
+        return full, backend.outstanding, backend.stats.ewma_latency or 0.0
+
+    def acquire(self, model, exclude=(), prefer_host=None):
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude and b.has_model(model)]
+            healthy = [b for b in candidates if b.healthy]
+            # When every candidate is marked down, try them anyway rather than failing outright
+            pool = healthy or candidates
+            if not pool:
+                return None
+            preferred = [b for b in healthy if b.url == prefer_host]
+            backend = preferred[0] if preferred else min(pool, key=self._score)
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend, seconds, generation=None, failed=False, cancelled=False):
+        with self._lock:
+            backend.outstanding -= 1
+            stats = backend.stats
+            if cancelled:
+                stats.cancelled += 1
+                return
+            if failed:
+                stats.failed += 1
+                return
+            stats.completed += 1
+            stats.busy_seconds += seconds
+            if stats.ewma_latency is None:
+                stats.ewma_latency = seconds
+            else:
+                stats.ewma_latency += LATENCY_EWMA_ALPHA * (seconds - stats.ewma_latency)
+            final = generation.stats if generation is not None else None
+            if final is not None and final.eval_count and final.eval_duration:
+                stats.eval_count += final.eval_count
+                stats.eval_seconds += final.eval_duration / 1e9
+
+    def _release_once(self, backend):
+        # A cancelled request frees its slot from the cancelling thread, before the
+        # generating thread gets around to it; whichever comes first wins.
+        start = time.monotonic()
+        lock = threading.Lock()
+        released = []
+
+        def release(generation=None, failed=False, cancelled=False):
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            self.release(backend, time.monotonic() - start, generation, failed, cancelled)
+
+        return release
+
+    def generate(self, image, prompt, model, on_chunk=None, cancel: Optional[CancelToken] = None, prefer_host=None,
+                 **extra):
+        return self._dispatch(
+            model, on_chunk, cancel, prefer_host,
+            lambda client, forward: client.generate(image, prompt, model, on_chunk=forward, cancel=cancel, **extra),
+        )
+
+    def chat(self, messages, model, image, on_chunk=None, cancel: Optional[CancelToken] = None, prefer_host=None,
+             **extra):
+        """Like OllamaClient.chat; prefer_host keeps a conversation on the server that holds its cached prefix."""
+        return self._dispatch(
+            model, on_chunk, cancel, prefer_host,
+            lambda client, forward: client.chat(messages, model, image, on_chunk=forward, cancel=cancel, **extra),
+        )
+
+    def _dispatch(self, model, on_chunk, cancel, prefer_host, request):
+        tried = []
+        last_error = None
+        while True:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            backend = self.acquire(model, tried, prefer_host)
+            if backend is None:
+                raise last_error or NoBackendAvailable(f"No Ollama backend has model {model!r}")
+            tried.append(backend)
+            streamed = []
+
+            def forward(text):
+                streamed.append(True)
+                if on_chunk:
+                    on_chunk(text)
+
+            release = self._release_once(backend)
+            unregister = None
+            if cancel is not None:
+                unregister = cancel.register(lambda release=release: release(cancelled=True))
+            try:
+                generation = request(backend.client, forward)
+            except GenerationCancelled:
+                release(cancelled=True)
+                raise
+            except requests.HTTPError as e:
+                release(failed=True)
+                if e.response is not None and e.response.status_code == 404 and backend.models is not None:
+                    # Model missing on this node: forget it there and try another
+                    backend.models.discard(model_tag(model))
+                    last_error = e
+                    continue
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                release(failed=True)
+                if isinstance(e, requests.ConnectionError):
+                    backend.healthy = False
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                release(failed=True)
+                raise
+            finally:
+                if unregister is not None:
+                    unregister()
+            release(generation)
+            return generation
+
+    def report(self):
+        lines = []
+        for backend in self.backends:
+            stats = backend.stats
+            state = "up" if backend.healthy else "down"
+            lines.append(
+                f"  {backend.url:<32} {state:<4} {stats.completed:5d} ok {stats.failed:4d} failed  "
+                f"mean {stats.mean_latency:6.2f}s  {stats.tokens_per_second:6.1f} tok/s"
+            )
+            if backend.client.limiter is not None:
+                lines.append(f"    concurrency {backend.client.limiter.summary()}")
+        return "\n".join(lines)
+
+    def close(self):
+        self._stop.set()
+        for backend in self.backends:
+            backend.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def hosts_from_env():
+    # OLLAMA_HOSTS is a comma-separated list of servers, e.g. "gpu1:11434,gpu2:11434"
+    value = os.environ.get("OLLAMA_HOSTS", "")
+    return [normalize_host(h) for h in value.split(",") if h.strip()]
+
+
+def client_from_env():
+    hosts = hosts_from_env()
+    if len(hosts) > 1:
+        pool = BackendPool(hosts)
+        pool.start_health_checks()
+        return pool
+    if hosts:
+        return OllamaClient(hosts[0])
+    return get_default_client()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple, Dict, Any
+
+# --- Constants ---
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "photo_analyzer",
+)
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "results.sqlite3")
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+DEFAULT_THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    stats TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access);
+CREATE INDEX IF NOT EXISTS results_model ON results (model);
+"""
+
+
+def image_digest(image):
+    """SHA-256 of an image given as bytes/memoryview or as a file path (hashed without loading it whole)."""
+    if isinstance(image, str):
+        h = hashlib.sha256()
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        return h.digest()
+    return hashlib.sha256(image).digest()
+
+
+def cache_key(image, model, prompt, options=None):
+    """Content address for one generation: image bytes + model + prompt + request options."""
+    h = hashlib.sha256()
+    h.update(image_digest(image))
+    h.update(json.dumps([model, prompt, options or {}], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Persistent SQLite store of generated text and timing stats with size-based LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def get(self, key) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT text, stats FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        text, stats = row
+        return text, json.loads(stats) if stats else None
+
+    def put(self, key, model, text, stats=None):
+        stats_json = json.dumps(stats) if stats else None
+        size = len(text.encode("utf-8")) + len(stats_json or "")
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, model, text, stats, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, text, stats_json, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+
+    def invalidate(self, model=None):
+        """Drop cached results for one model, or everything when model is None."""
+        with self._lock, self._conn:
+            if model is None:
+                cur = self._conn.execute("DELETE FROM results")
+            else:
+                cur = self._conn.execute("DELETE FROM results WHERE model = ?", (model,))
+        return cur.rowcount
+
+    def total_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def thumbnail_key(path, size):
+    """Identifies a thumbnail of a file as it is now: path + mtime + file size + thumbnail size."""
+    st = os.stat(path)
+    ident = json.dumps([os.path.abspath(path), st.st_mtime_ns, st.st_size, list(size)])
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+class ThumbnailCache:
+    """On-disk store of preview thumbnails, one file each, with size-based LRU eviction.
+
+    Files are written with a rename so several worker processes can share the directory.
+    """
+
+    def __init__(self, directory=DEFAULT_THUMBNAIL_DIR, max_bytes=DEFAULT_THUMBNAIL_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes = None
+
+    def _file(self, path, size):
+        return os.path.join(self.directory, thumbnail_key(path, size) + ".png")
+
+    def get(self, path, size) -> Optional[bytes]:
+        try:
+            file = self._file(path, size)
+            with open(file, "rb") as f:
+                data = f.read()
+            # The modification time doubles as the last access time for eviction
+            os.utime(file)
+        except OSError:
+            return None
+        return data
+
+    def put(self, path, size, data):
+        try:
+            file = self._file(path, size)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_file = f"{file}.{os.getpid()}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, file)
+        except OSError:
+            return
+        if self._bytes is None:
+            self._bytes = self.total_bytes()
+        else:
+            self._bytes += len(data)
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".png"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
@@ -0,0 +1,259 @@
+import json
+import os
+import random
+import socket
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .concurrency import AIMDLimiter
+
+# Request-free parts of the protocol, re-exported so existing imports from .client keep working
+from .protocol import (  # noqa: F401
+    DEFAULT_OLLAMA_HOST,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_FIRST_TOKEN_TIMEOUT,
+    DEFAULT_TOTAL_TIMEOUT,
+    DEFAULT_RETRIES,
+    DEFAULT_BACKOFF,
+    DEFAULT_POOL_SIZE,
+    RETRY_STATUS_CODES,
+    DEFAULT_KEEP_ALIVE,
+    BASE64_CHUNK_SIZE,
+    IMAGE_PLACEHOLDER,
+    CancelToken,
+    GenerateRequestBody,
+    GenerationResult,
+    OllamaResponse,
+    StreamParser,
+    base64_size,
+    normalize_host,
+    parse_keep_alive,
+    parse_stream_line,
+)
+
+
+class GenerationTimeout(requests.Timeout):
+    pass
+
+
+class GenerationCancelled(requests.RequestException):
+    pass
+
+
+# The server reported an error mid-stream, or the stream ended without its done record
+class OllamaStreamError(requests.RequestException):
+    pass
+
+
+def _abort_response(response):
+    # Closing the response from another thread does not wake a reader blocked in recv();
+    # shutting the socket down does. The reading thread then closes the response itself.
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class OllamaClient:
+    """Connection-pooled client for one Ollama server.
+
+    Timeouts are split by phase: connect_timeout for establishing the TCP connection,
+    first_token_timeout for the wait until the response starts streaming (model load
+    and prompt evaluation) and for any later stall, and total_timeout for the whole
+    generation. Connection errors and overload responses are retried with exponential
+    backoff as long as no output has been streamed yet.
+
+    Every request carries keep_alive, the policy for how long the server keeps the model
+    loaded afterwards, and warm() loads a model ahead of the first real request.
+
+    generate() takes an optional CancelToken; cancelling it closes the streaming
+    connection and raises GenerationCancelled in the generating thread.
+
+    With adaptive_limit, an AIMDLimiter decides how many generations run on the server at
+    once, between 1 and adaptive_limit; the others wait in the calling thread.
+    """
+
+    def __init__(self, base_url=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 first_token_timeout=DEFAULT_FIRST_TOKEN_TIMEOUT, total_timeout=DEFAULT_TOTAL_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE,
+                 keep_alive=DEFAULT_KEEP_ALIVE, adaptive_limit: Optional[int] = None):
+        self.base_url = normalize_host(base_url or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST)
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.limiter = AIMDLimiter(max_limit=adaptive_limit) if adaptive_limit else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _post(self, path, make_body, cancel=None):
+        attempt = 0
+        while True:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            try:
+                response = self.session.post(
+                    self.url(path),
+                    data=make_body(),
+                    headers={"Content-Type": "application/json"},
+                    stream=True,
+                    timeout=(self.connect_timeout, self.first_token_timeout)
+                )
+            except requests.ConnectionError:
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    try:
+                        response.raise_for_status()
+                    except requests.HTTPError:
+                        response.close()
+                        raise
+                    return response
+                response.close()
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def warm(self, model, keep_alive=None):
+        """Load model into memory without generating anything; returns Ollama's load response."""
+        payload = {"model": model, "stream": False}
+        keep_alive = parse_keep_alive(keep_alive) if keep_alive is not None else self.keep_alive
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        response = self._post("/api/generate", lambda: json.dumps(payload).encode("utf-8"))
+        with response:
+            return parse_stream_line(response.content)
+
+    def generate(self, image, prompt, model, on_chunk=None, cancel: Optional[CancelToken] = None, prefer_host=None,
+                 **extra):
+        """Stream an /api/generate reply; prefer_host is accepted for interface parity with BackendPool."""
+        return self._stream("/api/generate", dict({"model": model, "prompt": prompt}, **extra), image, on_chunk, cancel)
+
+    def chat(self, messages, model, image, on_chunk=None, cancel: Optional[CancelToken] = None, prefer_host=None,
+             **extra):
+        """Stream an /api/chat reply; the message whose images list holds IMAGE_PLACEHOLDER gets the image.
+
+        prefer_host is accepted for interface parity with BackendPool.chat.
+        """
+        return self._stream("/api/chat", dict({"model": model, "messages": messages}, **extra), image, on_chunk, cancel)
+
+    def _stream(self, path, payload, image, on_chunk, cancel):
+        if self.limiter is None:
+            return self._stream_once(path, payload, image, on_chunk, cancel)
+        permit = self.limiter.acquire(cancel)
+        error = None
+        generation = None
+        try:
+            generation = self._stream_once(path, payload, image, on_chunk, cancel)
+            return generation
+        except GenerationCancelled:
+            raise
+        except requests.Timeout:
+            error = "timeout"
+            raise
+        except requests.HTTPError as e:
+            # Overload responses are congestion; a missing model or a bad request is not
+            if e.response is not None and e.response.status_code in RETRY_STATUS_CODES:
+                error = "error"
+            raise
+        except requests.RequestException:
+            error = "error"
+            raise
+        finally:
+            if generation is None and error is None:
+                # Cancelled, or failed in a way that says nothing about load
+                self.limiter.abandon(permit)
+            else:
+                ttft = tokens_per_second = None
+                if generation is not None:
+                    stats = generation.stats
+                    if generation.first_token_seconds is not None:
+                        load = (stats.load_duration or 0) / 1e9 if stats is not None else 0.0
+                        ttft = generation.first_token_seconds - load
+                    if stats is not None and stats.eval_count and stats.eval_duration:
+                        tokens_per_second = stats.eval_count / (stats.eval_duration / 1e9)
+                self.limiter.release(permit, ttft, tokens_per_second, error)
+
+    def _stream_once(self, path, payload, image, on_chunk, cancel):
+        start = time.monotonic()
+        bodies = []
+        if self.keep_alive is not None:
+            payload.setdefault("keep_alive", self.keep_alive)
+
+        def make_body():
+            bodies.append(GenerateRequestBody(payload, image))
+            return bodies[-1]
+
+        response = self._post(path, make_body, cancel)
+        unregister = cancel.register(lambda: _abort_response(response)) if cancel is not None else None
+        parser = StreamParser()
+        first_token = None
+
+        try:
+            with response:
+                for line in response.iter_lines():
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    if line:
+                        text = parser.feed(line)
+                        if first_token is None and (text or parser.done):
+                            first_token = time.monotonic() - start
+                        if on_chunk:
+                            on_chunk(text)
+                        if parser.done:
+                            break
+                    if self.total_timeout and time.monotonic() - start > self.total_timeout:
+                        raise GenerationTimeout(
+                            f"Generation exceeded {self.total_timeout}s total timeout on {self.base_url}"
+                        )
+        except Exception:
+            # Whatever the torn-down connection raised, report it as the cancellation it was
+            if cancel is not None and cancel.cancelled:
+                raise GenerationCancelled("Generation cancelled") from None
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+        if cancel is not None and not parser.done:
+            cancel.raise_if_cancelled()
+        parser.finish()
+        encode_seconds = sum(body.encode_seconds for body in bodies)
+        return GenerationResult(text=parser.text, stats=parser.final, encode_seconds=encode_seconds,
+                                first_token_seconds=first_token, wall_seconds=time.monotonic() - start,
+                                host=self.base_url)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OllamaClient()
+        return _default_client
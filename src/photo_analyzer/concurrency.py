@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .protocol import CancelToken
+
+# --- Constants ---
+DEFAULT_INITIAL_LIMIT = 2
+DEFAULT_MAX_LIMIT = 16
+# Newest sample's weight in the smoothed time to first token and per-stream generation speed
+SIGNAL_EWMA_ALPHA = 0.3
+# Recent requests the best-case time to first token is taken from
+BASELINE_WINDOW = 50
+# A smoothed first token this many times slower than the best recent one means requests queue on the server
+TTFT_TOLERANCE = 2.0
+# Running more requests at once must raise total tokens/s by at least this share over fewer to count as a gain
+MIN_THROUGHPUT_GAIN = 0.05
+# Requests seen at a concurrency level before its throughput is compared with lower levels
+MIN_LEVEL_SAMPLES = 2
+# Multiplicative decrease after errors and timeouts, and after queueing or a throughput plateau
+ERROR_BACKOFF = 0.5
+CONGESTION_BACKOFF = 0.75
+DECISION_HISTORY = 200
+DECISION_REASONS = ("ttft", "throughput", "error", "timeout")
+
+
+@dataclass
+class LimitDecision:
+    at: float
+    old_limit: float
+    new_limit: float
+    # "increase", or the signal that caused a decrease: one of DECISION_REASONS
+    reason: str
+
+
+@dataclass(eq=False)
+class Permit:
+    # Most requests in flight on the backend at any point while this one ran, itself included
+    level: int
+    # Decreases so far; samples from requests started before the last decrease do not cause another
+    epoch: int
+    started: float
+
+
+class AIMDLimiter:
+    """Adaptive limit on the requests one Ollama server works on at once.
+
+    The limit grows by one after each round of requests, i.e. every `limit` completions,
+    that found it full (additive increase). It is
+    multiplied by CONGESTION_BACKOFF when the smoothed time to first token exceeds
+    TTFT_TOLERANCE times the best recent one, i.e. requests are waiting for a free slot on
+    the server, or when the current concurrency does not beat the total tokens/s of any
+    lower one by MIN_THROUGHPUT_GAIN; errors and timeouts multiply it by ERROR_BACKOFF. The limit
+    therefore settles just below the throughput knee and oscillates around it as load
+    changes. At most one decrease happens per round of requests.
+
+    Time to first token is the client-side wait minus the server's model load time, so a
+    cold start does not read as congestion. Every change is kept in `decisions`.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_LIMIT, min_limit=1, max_limit=DEFAULT_MAX_LIMIT):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("limits must satisfy 1 <= min_limit <= max_limit")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.decisions = deque(maxlen=DECISION_HISTORY)
+        self.counts = Counter()
+        self.ttft_ewma: Optional[float] = None
+        self._ttft_window = deque(maxlen=BASELINE_WINDOW)
+        # Concurrency level -> (smoothed per-stream tokens/s, samples)
+        self.level_speed: Dict[int, tuple] = {}
+        self._active = set()
+        self._epoch = 0
+        # Completions since the last increase that found the limit full
+        self._credit = 0
+        self._cond = threading.Condition()
+
+    @property
+    def current(self):
+        """Requests that may run at once right now."""
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def baseline_ttft(self) -> Optional[float]:
+        return min(self._ttft_window) if self._ttft_window else None
+
+    def aggregate_throughput(self, level) -> Optional[float]:
+        """Estimated total tokens/s with `level` requests generating at once."""
+        speed = self.level_speed.get(level)
+        if speed is None or speed[1] < MIN_LEVEL_SAMPLES:
+            return None
+        return level * speed[0]
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def acquire(self, cancel: Optional[CancelToken] = None) -> Permit:
+        """Wait until the backend is below its limit; raises GenerationCancelled if cancel fires first."""
+        unregister = cancel.register(self._wake) if cancel is not None else None
+        try:
+            with self._cond:
+                while self.in_flight >= self.current:
+                    if cancel is not None and cancel.cancelled:
+                        break
+                    self._cond.wait()
+                else:
+                    self.in_flight += 1
+                    permit = Permit(level=self.in_flight, epoch=self._epoch, started=time.monotonic())
+                    for other in self._active:
+                        other.level = max(other.level, self.in_flight)
+                    self._active.add(permit)
+                    return permit
+        finally:
+            if unregister is not None:
+                unregister()
+        cancel.raise_if_cancelled()
+
+    def release(self, permit: Permit, ttft=None, tokens_per_second=None, error=None):
+        """Return a permit with what its request showed; error is None, "error" or "timeout"."""
+        with self._cond:
+            self.in_flight -= 1
+            self._active.discard(permit)
+            self._observe(permit, ttft, tokens_per_second, error)
+            self._cond.notify_all()
+
+    def abandon(self, permit: Permit):
+        """Return the permit of a request that never completed, e.g. a cancelled one, without observing it.
+
+        Its partial timings say nothing about the server, and it must not earn increase credit.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._active.discard(permit)
+            self._cond.notify_all()
+
+    def _observe(self, permit, ttft, tokens_per_second, error):
+        if ttft is not None and ttft <= 0:
+            # Load time covering the whole wait leaves no usable sample; a zero best case would read
+            # every later first token as congestion
+            ttft = None
+        congested = permit.epoch == self._epoch
+        if error is not None:
+            if congested:
+                self._decrease(ERROR_BACKOFF, error)
+            return
+        if tokens_per_second:
+            speed, samples = self.level_speed.get(permit.level, (tokens_per_second, 0))
+            speed += SIGNAL_EWMA_ALPHA * (tokens_per_second - speed)
+            self.level_speed[permit.level] = (speed, samples + 1)
+        if ttft is not None:
+            self._ttft_window.append(ttft)
+        if not congested:
+            return
+        if ttft is not None:
+            self.ttft_ewma = ttft if self.ttft_ewma is None else (
+                self.ttft_ewma + SIGNAL_EWMA_ALPHA * (ttft - self.ttft_ewma))
+        if self.ttft_ewma is not None and self.ttft_ewma > TTFT_TOLERANCE * self.baseline_ttft:
+            self._decrease(CONGESTION_BACKOFF, "ttft")
+            return
+        here = self.aggregate_throughput(permit.level)
+        below = max((self.aggregate_throughput(level) or 0.0 for level in range(1, permit.level)), default=0.0)
+        if here is not None and here < below * (1 + MIN_THROUGHPUT_GAIN):
+            self._decrease(CONGESTION_BACKOFF, "throughput")
+            return
+        # Grow only while the limit is what holds requests back
+        if permit.level >= self.current and self.limit < self.max_limit:
+            self._credit += 1
+            if self._credit >= self.current:
+                self._change(min(self.max_limit, self.limit + 1), "increase")
+
+    def _decrease(self, factor, reason):
+        self._epoch += 1
+        # Measure the new level afresh; the old average is dominated by the congestion
+        self.ttft_ewma = None
+        self._change(max(self.min_limit, self.limit * factor), reason)
+
+    def _change(self, limit, reason):
+        self.decisions.append(LimitDecision(time.time(), self.limit, limit, reason))
+        self.counts[reason] += 1
+        self._credit = 0
+        self.limit = limit
+        self.peak_limit = max(self.peak_limit, limit)
+
+    def export(self, collector, backend):
+        """Put the limit and decision counts on a MetricsCollector, labelled with the backend URL."""
+        with self._cond:
+            collector.set_gauge("concurrency_limit", self.current,
+                                "Requests the adaptive controller lets run at once.", backend=backend)
+            collector.set_gauge("concurrency_in_flight", self.in_flight, "Requests running.", backend=backend)
+            if self.ttft_ewma is not None:
+                collector.set_gauge("concurrency_ttft_seconds", self.ttft_ewma,
+                                    "Smoothed time to first token, model loads excluded.", backend=backend)
+            for reason in ("increase",) + DECISION_REASONS:
+                collector.set_counter("concurrency_decisions_total", self.counts[reason],
+                                      "Adaptive concurrency changes by cause.", backend=backend, reason=reason)
+
+    def summary(self):
+        with self._cond:
+            decreases = ", ".join(f"{reason} {self.counts[reason]}" for reason in DECISION_REASONS
+                                  if self.counts[reason])
+            baseline = self.baseline_ttft
+            ttft = (f", first token {self.ttft_ewma:.2f}s (best {baseline:.2f}s)"
+                    if self.ttft_ewma is not None and baseline is not None else "")
+            best = max(((level, self.aggregate_throughput(level)) for level in self.level_speed),
+                       key=lambda item: item[1] or 0.0, default=(None, None))
+            knee = f", best {best[1]:.1f} tok/s at {best[0]} at once" if best[1] else ""
+            return (
+                f"limit {self.current} ({self.min_limit}-{self.max_limit}, peak {int(self.peak_limit)}), "
+                f"{self.counts['increase']} increase(s), {sum(self.counts[r] for r in DECISION_REASONS)} "
+                f"decrease(s){f' ({decreases})' if decreases else ''}{ttft}{knee}"
+            )
@@ -0,0 +1,160 @@
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Dict, List
+
+from .lazy import lazy_import
+from .photo_analyzer import (
+    DEFAULT_DECODE_WORKERS,
+    DEFAULT_DEDUP_THRESHOLD,
+    DEFAULT_RAW_MODE,
+    PILLOW_DEPENDENCY_MESSAGE,
+    MissingDependencyError,
+    read_image_bytes,
+)
+
+# Optional dependencies
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+# --- Constants ---
+# 8x8 gradient comparisons: a 64-bit hash
+DHASH_SIZE = 8
+NUMPY_DEPENDENCY_MESSAGE = "NumPy is required for duplicate detection.\nInstall with: pip install numpy"
+HASH_CHUNK_SIZE = 16
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def dhash(img_bytes, hash_size=DHASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy."""
+    if np is None:
+        raise MissingDependencyError(NUMPY_DEPENDENCY_MESSAGE)
+    if Image is None:
+        raise MissingDependencyError(PILLOW_DEPENDENCY_MESSAGE)
+    with Image.open(io.BytesIO(img_bytes)) as img:
+        # JPEGs decode at 1/8 scale; the hash only needs a 9x8 image
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _hash_job(path, raw_mode):
+    # Runs in a worker process; an image that cannot be hashed is simply never grouped
+    try:
+        return dhash(read_image_bytes(path, raw_mode))
+    except MissingDependencyError:
+        raise
+    except Exception:
+        return None
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes, for Hamming-distance range queries."""
+
+    def __init__(self):
+        # Nodes are (hash, items, {distance: child})
+        self._root = None
+
+    def add(self, value, item):
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Items whose hash is within radius bits of value."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend(items)
+            # Triangle inequality: only subtrees at distance +- radius can hold matches
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def group_duplicates(hashes, threshold=DEFAULT_DEDUP_THRESHOLD):
+    """Group (path, hash) pairs: each group is a representative and the images within threshold of it.
+
+    Representatives are picked in input order, so a burst is represented by its first frame.
+    """
+    tree = BKTree()
+    for index, (_, value) in enumerate(hashes):
+        tree.add(value, index)
+    assigned = set()
+    groups = {}
+    for index, (path, value) in enumerate(hashes):
+        if index in assigned:
+            continue
+        assigned.add(index)
+        members = sorted(i for i in tree.search(value, threshold) if i not in assigned)
+        assigned.update(members)
+        groups[path] = [hashes[i][0] for i in members]
+    return groups
+
+
+@dataclass
+class DuplicateGroups:
+    # Representative path -> paths that reuse its result, in batch order
+    groups: Dict[str, List[str]] = field(default_factory=dict)
+    hash_seconds: float = 0.0
+
+    @property
+    def representatives(self):
+        return list(self.groups)
+
+    @property
+    def inferences_saved(self):
+        return sum(len(members) for members in self.groups.values())
+
+    def duplicates_of(self, path) -> List[str]:
+        return self.groups.get(path, [])
+
+    def summary(self):
+        clusters = sum(1 for members in self.groups.values() if members)
+        total = len(self.groups) + self.inferences_saved
+        return (
+            f"Hashed {total} image(s) in {self.hash_seconds:.2f}s: {self.inferences_saved} near-duplicate(s) "
+            f"in {clusters} group(s), {len(self.groups)} inference(s) to run, {self.inferences_saved} saved"
+        )
+
+
+def find_duplicates(paths, threshold=DEFAULT_DEDUP_THRESHOLD, workers=DEFAULT_DECODE_WORKERS,
+                    raw_mode=DEFAULT_RAW_MODE):
+    """Hash a batch in worker processes and group near-identical images, e.g. burst shots."""
+    if np is None:
+        raise MissingDependencyError(NUMPY_DEPENDENCY_MESSAGE)
+    start = time.perf_counter()
+    paths = list(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        values = list(pool.map(_hash_job, paths, repeat(raw_mode), chunksize=HASH_CHUNK_SIZE))
+    grouped = group_duplicates([(p, v) for p, v in zip(paths, values) if v is not None], threshold)
+    groups = {}
+    for path, value in zip(paths, values):
+        # Images that could not be hashed still run, and report their own error
+        if value is None:
+            groups[path] = []
+        elif path in grouped:
+            groups[path] = grouped[path]
+    return DuplicateGroups(groups=groups, hash_seconds=time.perf_counter() - start)
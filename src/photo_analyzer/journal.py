@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+# --- Constants ---
+# Runs an image may fail in before reruns stop retrying it
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job, path)
+);
+"""
+
+
+def job_key(**config):
+    """Identifies a batch configuration; results only carry over between runs with the same one."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class JournalPlan:
+    todo: List[str] = field(default_factory=list)
+    done: List[str] = field(default_factory=list)
+    # Failed max_attempts times already; skipped until the journal is reset
+    exhausted: List[str] = field(default_factory=list)
+    retries: int = 0
+
+    def summary(self):
+        return (
+            f"Journal: {len(self.done)} already done, {len(self.todo)} to run "
+            f"({self.retries} retried), {len(self.exhausted)} skipped after repeated failures"
+        )
+
+
+class BatchJournal:
+    """Persistent SQLite record of each image's status, attempts and result within a batch.
+
+    Every result is committed as it arrives, so a batch that dies part way can be rerun
+    and continues where it stopped.
+    """
+
+    def __init__(self, path, job, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.job = job
+        self.max_attempts = max_attempts
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _rows(self):
+        with self._lock:
+            return {
+                path: (status, attempts)
+                for path, status, attempts in self._conn.execute(
+                    "SELECT path, status, attempts FROM jobs WHERE job = ?", (self.job,)
+                )
+            }
+
+    def plan(self, paths) -> JournalPlan:
+        rows = self._rows()
+        plan = JournalPlan()
+        for path in paths:
+            status, attempts = rows.get(path, (None, 0))
+            if status == "done":
+                plan.done.append(path)
+            elif attempts >= self.max_attempts:
+                plan.exhausted.append(path)
+            else:
+                plan.todo.append(path)
+                plan.retries += attempts > 0
+        return plan
+
+    def record(self, result):
+        """Store the outcome of one image (an ImageResult)."""
+        status = "done" if result.complete else "failed"
+        data = json.dumps(result.to_dict(), ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job, path, status, attempts, result, error, updated_at) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (job, path) DO UPDATE SET status = excluded.status, attempts = attempts + 1, "
+                "result = excluded.result, error = excluded.error, updated_at = excluded.updated_at",
+                (self.job, result.path, status, data, result.error, time.time()),
+            )
+
+    def results(self, paths) -> List[Dict[str, Any]]:
+        """Stored results of the given images, in the same order."""
+        with self._lock:
+            stored = dict(self._conn.execute(
+                "SELECT path, result FROM jobs WHERE job = ? AND result IS NOT NULL", (self.job,)
+            ))
+        return [json.loads(stored[path]) for path in paths if path in stored]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+# --- Constants ---
+METRIC_PREFIX = "photo_analyzer"
+TTFT_QUANTILES = (0.5, 0.9, 0.99)
+CLIENT_STAGES = ("decode", "preprocess", "encode", "network")
+
+
+def _seconds(ns):
+    return (ns or 0) / 1e9
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds else 0.0
+
+
+def quantile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@dataclass
+class GenerationMetrics:
+    """Per-request performance numbers: Ollama's server-side timings plus what the client measured."""
+
+    model: str
+    cached: bool = False
+    wall_seconds: float = 0.0
+    ttft_seconds: Optional[float] = None
+    total_seconds: float = 0.0
+    load_seconds: float = 0.0
+    prompt_eval_count: int = 0
+    prompt_eval_seconds: float = 0.0
+    eval_count: int = 0
+    eval_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    preprocess_seconds: float = 0.0
+    encode_seconds: float = 0.0
+
+    @classmethod
+    def from_stats(cls, model, stats, **client_timings):
+        metrics = cls(model=model, **client_timings)
+        if stats is not None:
+            metrics.total_seconds = _seconds(stats.total_duration)
+            metrics.load_seconds = _seconds(stats.load_duration)
+            metrics.prompt_eval_count = stats.prompt_eval_count or 0
+            metrics.prompt_eval_seconds = _seconds(stats.prompt_eval_duration)
+            metrics.eval_count = stats.eval_count or 0
+            metrics.eval_seconds = _seconds(stats.eval_duration)
+        return metrics
+
+    @property
+    def tokens_per_second(self):
+        return _rate(self.eval_count, self.eval_seconds)
+
+    @property
+    def prompt_tokens_per_second(self):
+        return _rate(self.prompt_eval_count, self.prompt_eval_seconds)
+
+    @property
+    def network_seconds(self):
+        # Request time the server did not account for: upload, queueing and streaming overhead
+        if self.cached or not self.total_seconds:
+            return 0.0
+        return max(0.0, self.wall_seconds - self.total_seconds - self.encode_seconds)
+
+    def to_dict(self):
+        data = asdict(self)
+        data["tokens_per_second"] = self.tokens_per_second
+        data["prompt_tokens_per_second"] = self.prompt_tokens_per_second
+        data["network_seconds"] = self.network_seconds
+        return data
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def summary(self):
+        if self.cached:
+            return "Cached result (no model time)"
+        ttft = f"{self.ttft_seconds:.2f}s" if self.ttft_seconds is not None else "n/a"
+        return (
+            f"{self.eval_count} tokens at {self.tokens_per_second:.1f} tok/s, "
+            f"time to first token {ttft}\n"
+            f"prompt eval {self.prompt_eval_count} tokens at {self.prompt_tokens_per_second:.1f} tok/s, "
+            f"model load {self.load_seconds:.2f}s\n"
+            f"client: decode {self.decode_seconds:.2f}s, preprocess {self.preprocess_seconds:.2f}s, "
+            f"encode {self.encode_seconds:.2f}s, network {self.network_seconds:.2f}s"
+        )
+
+
+class MetricsCollector:
+    """Aggregates GenerationMetrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.totals = defaultdict(float)
+        self.ttft = defaultdict(list)
+        self.stage_seconds = defaultdict(float)
+        self.gauges = {}
+
+    def observe(self, metrics: GenerationMetrics, status="ok"):
+        with self._lock:
+            self.requests[(metrics.model, "cached" if metrics.cached and status == "ok" else status)] += 1
+            for stage in CLIENT_STAGES:
+                self.stage_seconds[stage] += getattr(metrics, f"{stage}_seconds")
+            if metrics.cached or status != "ok":
+                return
+            model = metrics.model
+            for name in ("load_seconds", "prompt_eval_count", "prompt_eval_seconds", "eval_count",
+                         "eval_seconds", "wall_seconds"):
+                self.totals[(model, name)] += getattr(metrics, name)
+            if metrics.ttft_seconds is not None:
+                self.ttft[model].append(metrics.ttft_seconds)
+
+    def set_gauge(self, name, value, help_text="", **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = (value, help_text, "gauge")
+
+    def set_counter(self, name, value, help_text="", **labels):
+        """Like set_gauge, for a running total kept elsewhere."""
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = (value, help_text, "counter")
+
+    def set_summary(self, name, values, help_text="", quantiles=TTFT_QUANTILES, **labels):
+        """Export observations kept elsewhere as a summary: quantiles, _sum and _count."""
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = ((list(values), quantiles), help_text, "summary")
+
+    def render_prometheus(self):
+        def metric(name, help_text, kind):
+            full = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        def labels(**kv):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in kv.items()) + "}"
+
+        lines = []
+        with self._lock:
+            name = metric("requests_total", "Generation requests by outcome.", "counter")
+            for (model, status), count in sorted(self.requests.items()):
+                lines.append(f"{name}{labels(model=model, status=status)} {count}")
+
+            for total, help_text in (
+                ("eval_count", "Generated tokens."),
+                ("eval_seconds", "Seconds spent generating tokens."),
+                ("prompt_eval_count", "Prompt tokens evaluated (including image tokens)."),
+                ("prompt_eval_seconds", "Seconds spent evaluating prompts."),
+                ("load_seconds", "Seconds spent loading models."),
+                ("wall_seconds", "Client-side request wall time."),
+            ):
+                name = metric(f"{total}_total", help_text, "counter")
+                for (model, key), value in sorted(self.totals.items()):
+                    if key == total:
+                        lines.append(f"{name}{labels(model=model)} {value:g}")
+
+            name = metric("time_to_first_token_seconds", "Time from request to first streamed token.", "summary")
+            for model, values in sorted(self.ttft.items()):
+                for q in TTFT_QUANTILES:
+                    lines.append(f"{name}{labels(model=model, quantile=q)} {quantile(values, q):g}")
+                lines.append(f"{name}_sum{labels(model=model)} {sum(values):g}")
+                lines.append(f"{name}_count{labels(model=model)} {len(values)}")
+
+            name = metric("client_stage_seconds_total", "Client-side time by stage.", "counter")
+            for stage in CLIENT_STAGES:
+                lines.append(f"{name}{labels(stage=stage)} {self.stage_seconds[stage]:g}")
+
+            for (gauge, label_items), (value, help_text, kind) in sorted(self.gauges.items()):
+                full = f"{METRIC_PREFIX}_{gauge}"
+                if f"# TYPE {full} {kind}" not in lines:
+                    lines.append(f"# HELP {full} {help_text}")
+                    lines.append(f"# TYPE {full} {kind}")
+                if kind == "summary":
+                    values, quantiles = value
+                    for q in quantiles:
+                        lines.append(f"{full}{labels(**dict(label_items), quantile=q)} {quantile(values, q):g}")
+                    plain = labels(**dict(label_items)) if label_items else ""
+                    lines.append(f"{full}_sum{plain} {sum(values):g}")
+                    lines.append(f"{full}_count{plain} {len(values)}")
+                    continue
+                lines.append(f"{full}{labels(**dict(label_items)) if label_items else ''} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Write-then-rename so a node_exporter textfile collector never reads a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
@@ -1,52 +1,50 @@
+import argparse
 import base64
+import io
+import itertools
 import json
-import requests
+import os
+import signal
+import sys
 import threading
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox, scrolledtext
-from dataclasses import dataclass, fields
-from typing import Optional, List, Any
-import io
+import time
+import zlib
+from dataclasses import dataclass, field, asdict, replace
+from typing import TYPE_CHECKING, Optional, List, Any, Callable, Dict
+
+from .cache import ResultCache, cache_key, DEFAULT_CACHE_PATH, DEFAULT_CACHE_MAX_BYTES
+from .journal import DEFAULT_MAX_ATTEMPTS, BatchJournal, job_key
+from .lazy import lazy_import
+from .metrics import GenerationMetrics, MetricsCollector, quantile
+from .protocol import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_FIRST_TOKEN_TIMEOUT,
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_RETRIES,
+    DEFAULT_TOTAL_TIMEOUT,
+    IMAGE_PLACEHOLDER,
+    CancelToken,
+    GenerationResult,
+    OllamaResponse,
+    base64_size,
+)
+
+if TYPE_CHECKING:
+    from .client import OllamaClient
+    from .pipeline import Pipeline
 
-# Optional dependencies
-try:
-    import pyperclip
-except ImportError:
-    pyperclip = None
-
-try:
-    import rawpy
-    import imageio.v2 as imageio
-except ImportError:
-    rawpy = None
-    imageio = None
-
-try:
-    from PIL import Image, ImageTk
-except ImportError:
-    Image = None
-    ImageTk = None
+# Imported on first use so that startup does not pay for them; the optional ones are None when missing
+requests = lazy_import("requests")
+rawpy = lazy_import("rawpy")
+imageio = lazy_import("imageio")
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
 
 # --- Constants ---
-APP_TITLE = "Photo Analyzer Caption & Evaluation"
-WINDOW_SIZE = "1200x800"
-IMG_FRAME_TITLE = "1. Select Image"
-IMG_LABEL_TEXT = "Drag & drop an image here or click 'Select Image'"
-BTN_SELECT_TEXT = "Select Image"
-BTN_SELECT_TOOLTIP = "Open a file dialog to select an image file."
-MODEL_FRAME_TITLE = "2. Choose Model & Mode"
-MODEL_LABEL_TEXT = "Model:"
 MODEL_OPTIONS = ["gemma3", "llava"]
-MODEL_MENU_TOOLTIP = "Choose the Ollama model to use for analysis."
-MODE_LABEL_TEXT = "Mode:"
-MODES = [("Instagram Caption", "caption"), ("Photo Evaluation", "evaluation")]
-PROMPT_FRAME_TITLE = "3. Custom Prompt (optional)"
-PROMPT_ENTRY_TOOLTIP = "Enter a custom prompt for the AI model (leave blank for default)."
-BTN_GENERATE_TEXT = "Generate"
-BTN_GENERATE_TOOLTIP = "Send the image and prompt to Ollama and generate a response."
-BTN_COPY_TEXT = "Copy to Clipboard"
-BTN_COPY_TOOLTIP = "Copy the generated response to the clipboard."
-OUTPUT_FRAME_TITLE = "Output"
+DEFAULT_MODEL = "llava"
+MODES = [("Instagram Caption", "caption"), ("Photo Evaluation", "evaluation"), ("Caption + Evaluation", "both")]
+DEFAULT_MODE = "caption"
 DEFAULT_CAPTION_PROMPT = (
     "Generate an Instagram caption and hashtags for this photo. "
     "Focus on cinematic mood and urban storytelling. Keep it concise and engaging."
@@ -55,373 +53,984 @@ DEFAULT_EVAL_PROMPT = (
     "Critique this image from a photographic perspective. "
     "Focus on composition, mood, lighting, and storytelling."
 )
-PROMPT_DISPLAY_PREFIX = "Prompt to be sent:\n"
-PROMPT_DISPLAY_COLOR = "#555"
-PROMPT_DISPLAY_WRAP = 400
-
-# --- Tooltip helper ---
-class ToolTip:
-    def __init__(self, widget, text):
-        self.widget = widget
-        self.text = text
-        self.tipwindow = None
-        widget.bind("<Enter>", self.show)
-        widget.bind("<Leave>", self.hide)
-
-    def show(self, event=None):
-        if self.tipwindow or not self.text:
-            return
-        x, y, cx, cy = self.widget.bbox("insert") if hasattr(self.widget, "bbox") else (0, 0, 0, 0)
-        x = x + self.widget.winfo_rootx() + 25
-        y = y + self.widget.winfo_rooty() + 20
-        self.tipwindow = tw = tk.Toplevel(self.widget)
-        tw.wm_overrideredirect(True)
-        tw.wm_geometry(f"+{x}+{y}")
-        label = tk.Label(
-            tw,
-            text=self.text,
-            background="#ffffe0",
-            relief="solid",
-            borderwidth=1,
-            font=("tahoma", "9", "normal")
-        )
-        label.pack(ipadx=4)
+DEFAULT_COMBINED_PROMPT = (
+    "Analyze this photo and answer in JSON with two fields. "
+    "\"caption\": an Instagram caption and hashtags, focusing on cinematic mood and urban storytelling, "
+    "concise and engaging. "
+    "\"evaluation\": a critique from a photographic perspective, covering composition, mood, lighting, "
+    "and storytelling."
+)
+# Passed as Ollama's "format" so a single generation returns both outputs as separate fields
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {"caption": {"type": "string"}, "evaluation": {"type": "string"}},
+    "required": ["caption", "evaluation"],
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".cr3")
+CR3_DEPENDENCY_MESSAGE = (
+    "rawpy and imageio are required for CR3 support.\nInstall with: pip install rawpy imageio"
+)
+# CR3 decoding: "preview" uses the embedded JPEG, "half" a half-size render, "full" a full demosaic
+RAW_MODES = ("preview", "half", "full")
+DEFAULT_RAW_MODE = "preview"
+PILLOW_DEPENDENCY_MESSAGE = "Pillow is required to resize and re-encode images.\nInstall with: pip install pillow"
+# Long-edge resolution of each model's vision encoder; larger images are downsampled by the model anyway
+MODEL_VISION_EDGE = {"gemma3": 896, "llava": 672}
+DEFAULT_VISION_EDGE = 1024
+PREPROCESS_FORMATS = ("JPEG", "WEBP")
+DEFAULT_PREPROCESS_FORMAT = "JPEG"
+DEFAULT_PREPROCESS_QUALITY = 85
+# A request whose load_duration exceeds this had to load the model first
+COLD_LOAD_THRESHOLD_NS = 500_000_000
+DEFAULT_DECODE_WORKERS = os.cpu_count() or 1
+# Bits of the 64-bit perceptual hash two images may differ in and still count as near-duplicates
+DEFAULT_DEDUP_THRESHOLD = 6
+DEFAULT_IN_FLIGHT = 2
+# How often a batch fed by an incremental source (e.g. a watched folder) asks it for new paths,
+# and how often waiting pipeline stages check whether the batch was aborted
+SOURCE_POLL_SECONDS = 0.05
+# Bytes of decoded images a batch holds in memory before it stops reading ahead
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+# Watch mode: a file counts as completely written once its size and mtime have not changed for this long
+DEFAULT_SETTLE_SECONDS = 1.0
+# Watch mode: how often the folder is listed when inotify is not available
+DEFAULT_WATCH_POLL_SECONDS = 1.0
+
+
+class MissingDependencyError(RuntimeError):
+    pass
+
+
+def default_prompt(mode):
+    if mode == "evaluation":
+        return DEFAULT_EVAL_PROMPT
+    if mode == "both":
+        return DEFAULT_COMBINED_PROMPT
+    return DEFAULT_CAPTION_PROMPT
+
+
+def resolve_prompt(prompt, mode):
+    prompt = (prompt or "").strip()
+    return prompt or default_prompt(mode)
+
+
+def request_options(mode):
+    """Extra /api/generate fields for a mode."""
+    if mode == "both":
+        return {"format": COMBINED_SCHEMA}
+    return {}
+
+
+def parse_structured(text):
+    """Split a JSON-formatted response into its fields; None when it is not a JSON object."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {k: v if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for k, v in data.items()}
+
+
+# --- Image loading ---
+def is_image_file(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _encode_rgb_jpeg(rgb):
+    buf = io.BytesIO()
+    imageio.v2.imwrite(buf, rgb, format='jpeg')
+    return buf.getvalue()
+
+
+def _render_raw(path, raw_mode):
+    with rawpy.imread(path) as raw:
+        if raw_mode == "preview":
+            try:
+                thumb = raw.extract_thumb()
+            except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+                thumb = None
+            if thumb is not None and thumb.format == rawpy.ThumbFormat.JPEG:
+                # The camera's own JPEG: no demosaic and no re-encode needed
+                return bytes(thumb.data)
+            if thumb is not None and thumb.format == rawpy.ThumbFormat.BITMAP:
+                return _encode_rgb_jpeg(thumb.data)
+            raw_mode = "half"
+        if raw_mode == "half":
+            # Bins each 2x2 Bayer block into one pixel, skipping interpolation entirely
+            rgb = raw.postprocess(half_size=True, use_camera_wb=True)
+        else:
+            rgb = raw.postprocess()
+    return _encode_rgb_jpeg(rgb)
+
+
+def read_image_bytes(path, raw_mode=DEFAULT_RAW_MODE):
+    if path.lower().endswith(".cr3"):
+        if rawpy is None or imageio is None:
+            raise MissingDependencyError(CR3_DEPENDENCY_MESSAGE)
+        if raw_mode not in RAW_MODES:
+            raise ValueError(f"Unknown RAW decode mode: {raw_mode!r}")
+        return _render_raw(path, raw_mode)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_image_as_base64(path, raw_mode=DEFAULT_RAW_MODE):
+    return base64.b64encode(read_image_bytes(path, raw_mode)).decode("utf-8")
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    max_edge: Optional[int] = None
+    image_format: str = DEFAULT_PREPROCESS_FORMAT
+    quality: int = DEFAULT_PREPROCESS_QUALITY
+
+    @classmethod
+    def for_model(cls, model, **kwargs):
+        base_name = model.split(":", 1)[0]
+        return cls(max_edge=MODEL_VISION_EDGE.get(base_name, DEFAULT_VISION_EDGE), **kwargs)
 
-    def hide(self, event=None):
-        tw = self.tipwindow
-        self.tipwindow = None
-        if tw:
-            tw.destroy()
 
 @dataclass
-class OllamaResponse:
-    model: str
-    created_at: str
-    response: str
-    done: bool
-    done_reason: Optional[str] = None
-    context: Optional[List[Any]] = None
-    total_duration: Optional[int] = None
-    load_duration: Optional[int] = None
-    prompt_eval_count: Optional[int] = None
-    prompt_eval_duration: Optional[int] = None
-    eval_count: Optional[int] = None
-    eval_duration: Optional[int] = None
-
-class OllamaApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title(APP_TITLE)
-        self.geometry(WINDOW_SIZE)
-        self.resizable(False, False)
-
-        self.image_path = None
-        self.image_b64 = None
-        self.preview_imgtk = None
-
-        self.model_var = tk.StringVar(value="llava")
-        self.mode_var = tk.StringVar(value="caption")
-
-        self.create_widgets()
-        self.make_drag_and_drop_work()
-
-    def create_widgets(self):
-        # Main container with two columns
-        main_frame = tk.Frame(self)
-        main_frame.pack(fill='both', expand=True, padx=10, pady=10)
-        main_frame.columnconfigure(0, weight=0, minsize=420)
-        main_frame.columnconfigure(1, weight=1)
-
-        # --- Left column: controls ---
-        left_frame = tk.Frame(main_frame)
-        left_frame.grid(row=0, column=0, sticky='nsew', padx=(0, 10))
-
-        # Title
-        title = tk.Label(left_frame, text="Photo Analyzer", font=("Segoe UI", 20, "bold"))
-        title.pack(pady=(12, 0))
-
-        subtitle = tk.Label(
-            left_frame,
-            text="Generate Instagram captions, hashtags, or photo critiques using Ollama AI models.",
-            font=("Segoe UI", 11)
-        )
-        subtitle.pack(pady=(0, 10))
+class LoadedImage:
+    path: str
+    data: Optional[bytes]
+    source_bytes: int
+    decode_seconds: float = 0.0
+    preprocess_seconds: float = 0.0
 
-        # Image selection frame
-        img_frame = ttk.LabelFrame(left_frame, text=IMG_FRAME_TITLE, padding=(10, 8))
-        img_frame.pack(fill='x', pady=8)
+    @property
+    def source(self):
+        # Images that need no conversion are streamed straight from disk
+        return self.path if self.data is None else self.data
 
-        self.img_label = ttk.Label(
-            img_frame,
-            text=IMG_LABEL_TEXT
-        )
-        self.img_label.pack(fill='x', pady=(0, 4))
-
-        btn_select = ttk.Button(img_frame, text=BTN_SELECT_TEXT, command=self.select_image)
-        btn_select.pack(pady=2)
-        ToolTip(btn_select, BTN_SELECT_TOOLTIP)
-
-        # Reserve space for preview using a fixed-size frame
-        preview_frame = tk.Frame(img_frame, width=180, height=260)
-        preview_frame.pack(pady=4)
-        preview_frame.pack_propagate(False)
-
-        self.preview_label = ttk.Label(preview_frame)
-        self.preview_label.pack(expand=True)
-
-        # Model and mode frame
-        options_frame = ttk.LabelFrame(left_frame, text=MODEL_FRAME_TITLE, padding=(10, 8))
-        options_frame.pack(fill='x', pady=8)
-
-        model_frame = ttk.Frame(options_frame)
-        model_frame.pack(fill='x', pady=2)
-        ttk.Label(model_frame, text=MODEL_LABEL_TEXT).pack(side='left')
-        model_menu = ttk.OptionMenu(model_frame, self.model_var, self.model_var.get(), *MODEL_OPTIONS)
-        model_menu.pack(side='left', padx=10)
-        ToolTip(model_menu, MODEL_MENU_TOOLTIP)
-
-        mode_frame = ttk.Frame(options_frame)
-        mode_frame.pack(fill='x', pady=2)
-        ttk.Label(mode_frame, text=MODE_LABEL_TEXT).pack(side='left')
-        for text, val in MODES:
-            rb = ttk.Radiobutton(mode_frame, text=text, variable=self.mode_var, value=val)
-            rb.pack(side='left', padx=10)
-            ToolTip(rb, f"Switch to {text.lower()} mode.")
-
-        # Show the prompt being used
-        self.prompt_display = tk.Label(
-            left_frame,
-            text="",
-            wraplength=PROMPT_DISPLAY_WRAP,
-            justify='left',
-            fg=PROMPT_DISPLAY_COLOR
+    @property
+    def payload_bytes(self):
+        return base64_size(self.source_bytes if self.data is None else len(self.data))
+
+
+def preprocess_image(img_bytes, options: PreprocessOptions):
+    if Image is None:
+        raise MissingDependencyError(PILLOW_DEPENDENCY_MESSAGE)
+    with Image.open(io.BytesIO(img_bytes)) as img:
+        # Bake the EXIF orientation into the pixels before the metadata is dropped
+        img = ImageOps.exif_transpose(img)
+        if options.max_edge and max(img.size) > options.max_edge:
+            img.thumbnail((options.max_edge, options.max_edge), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        # No exif= or icc_profile= arguments, so the re-encoded file carries no metadata
+        img.save(buf, format=options.image_format, quality=options.quality)
+    return buf.getvalue()
+
+
+def load_image(path, preprocess: Optional[PreprocessOptions] = None, raw_mode=DEFAULT_RAW_MODE,
+               stream_from_disk=False):
+    source_bytes = os.path.getsize(path)
+    if stream_from_disk and preprocess is None and not path.lower().endswith(".cr3"):
+        return LoadedImage(path=path, data=None, source_bytes=source_bytes)
+    start = time.perf_counter()
+    img_bytes = read_image_bytes(path, raw_mode)
+    decoded = time.perf_counter()
+    loaded = LoadedImage(path=path, data=img_bytes, source_bytes=source_bytes, decode_seconds=decoded - start)
+    if preprocess is not None:
+        loaded.data = preprocess_image(img_bytes, preprocess)
+        loaded.preprocess_seconds = time.perf_counter() - decoded
+    return loaded
+
+
+def find_images(directory, recursive=True):
+    paths = []
+    if recursive:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files) if is_image_file(name))
+    else:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and is_image_file(name):
+                paths.append(path)
+    return paths
+
+
+def parse_shard(text):
+    """'2/4' -> (1, 4): the second of four shards, as a zero-based index."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, e.g. 1/4, got {text!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, got {text!r}")
+    return index - 1, count
+
+
+def select_shard(paths, index, count, root=None):
+    """One of count disjoint parts of a batch; the split only depends on the paths relative to root."""
+    def shard_of(path):
+        name = os.path.relpath(path, root) if root else path
+        return zlib.crc32(name.replace(os.sep, "/").encode("utf-8")) % count
+
+    return [path for path in paths if shard_of(path) == index]
+
+
+# --- Ollama API ---
+def generate(image, prompt, model, on_chunk=None, client: Optional["OllamaClient"] = None,
+             cancel: Optional[CancelToken] = None, **options):
+    if client is None:
+        from .client import get_default_client
+
+        client = get_default_client()
+    return client.generate(
+        image, prompt, model, on_chunk=on_chunk, cancel=cancel, **options
+    )
+
+
+def warm_model(client, model, keep_alive=None):
+    start = time.perf_counter()
+    resp = client.warm(model, keep_alive)
+    load = (resp.load_duration or 0) / 1e9
+    return f"Loaded {model} in {time.perf_counter() - start:.2f}s (server load_duration {load:.2f}s)"
+
+
+def _stats_to_dict(stats):
+    if stats is None:
+        return None
+    data = asdict(stats)
+    data.pop("context", None)
+    data["response"] = ""
+    return data
+
+
+def cached_generation(cache: ResultCache, key):
+    hit = cache.get(key)
+    if hit is None:
+        return None
+    text, stats = hit
+    return GenerationResult(text=text, stats=OllamaResponse(**stats) if stats else None, cached=True)
+
+
+def store_generation(cache: ResultCache, key, model, generation):
+    # A reply cut short by a network blip or a server error must not be served forever
+    if not generation.complete:
+        return
+    cache.put(key, model, generation.text, _stats_to_dict(generation.stats))
+
+
+def analyze_image(image, prompt, model, cache: Optional[ResultCache] = None, on_chunk=None,
+                  client: Optional["OllamaClient"] = None, cancel: Optional[CancelToken] = None,
+                  options: Optional[Dict[str, Any]] = None):
+    key = None
+    if cache is not None:
+        key = cache_key(image, model, prompt, options)
+        hit = cached_generation(cache, key)
+        if hit is not None:
+            if on_chunk:
+                on_chunk(hit.text)
+            return hit
+
+    generation = generate(image, prompt, model, on_chunk=on_chunk, client=client, cancel=cancel, **(options or {}))
+    if cache is not None:
+        store_generation(cache, key, model, generation)
+    return generation
+
+
+@dataclass
+class FollowUpSavings:
+    prompt_tokens: int
+    reused_tokens: int
+    saved_seconds: float
+
+    def summary(self):
+        return (
+            f"Follow-up evaluated {self.prompt_tokens} prompt tokens; {self.reused_tokens} tokens of the "
+            f"conversation (image included) were reused from the server's cache, saving ~{self.saved_seconds:.2f}s"
         )
-        self.prompt_display.pack(fill='x', padx=4, pady=(2, 8))
-
-        # Prompt frame
-        prompt_frame = ttk.LabelFrame(left_frame, text=PROMPT_FRAME_TITLE, padding=(10, 8))
-        prompt_frame.pack(fill='x', pady=8)
-        self.prompt_entry = ttk.Entry(prompt_frame, width=80)
-        self.prompt_entry.pack(fill='x', padx=2, pady=2)
-        ToolTip(self.prompt_entry, PROMPT_ENTRY_TOOLTIP)
-
-        # Generate and progress
-        action_frame = ttk.Frame(left_frame)
-        action_frame.pack(fill='x', pady=(8, 0))
-
-        self.btn_generate = ttk.Button(action_frame, text=BTN_GENERATE_TEXT, command=self.on_generate)
-        self.btn_generate.pack(side='left', padx=(0, 10))
-        ToolTip(self.btn_generate, BTN_GENERATE_TOOLTIP)
-
-        self.progress = ttk.Label(action_frame, text="", foreground="green")
-        self.progress.pack(side='left', padx=4)
-
-        self.btn_copy = ttk.Button(
-            action_frame,
-            text=BTN_COPY_TEXT,
-            command=self.copy_to_clipboard,
-            state='disabled'
+
+
+class Conversation:
+    """Follow-up questions about one image over /api/chat.
+
+    The image rides on the first message and the whole history is re-sent each turn.
+    Ollama finds the already-evaluated prefix, image included, in its prompt cache, so a
+    follow-up only evaluates the new tokens. Turns stay on the server that answered first.
+    """
+
+    def __init__(self, client, model, image):
+        self.client = client
+        self.model = model
+        self.image = image
+        self.messages = []
+        self.turns: List[GenerationResult] = []
+        self.host = None
+
+    def _user_message(self, prompt):
+        message = {"role": "user", "content": prompt}
+        if not self.messages:
+            message["images"] = [IMAGE_PLACEHOLDER]
+        return message
+
+    def add_turn(self, prompt, generation: GenerationResult):
+        """Record an exchange, e.g. the initial /api/generate analysis, in the history."""
+        self.messages += [self._user_message(prompt), {"role": "assistant", "content": generation.text}]
+        self.turns.append(generation)
+        self.host = self.host or generation.host
+
+    def ask(self, prompt, on_chunk=None, cancel: Optional[CancelToken] = None):
+        generation = self.client.chat(
+            self.messages + [self._user_message(prompt)], self.model, self.image,
+            on_chunk=on_chunk, cancel=cancel, prefer_host=self.host,
         )
-        self.btn_copy.pack(side='right')
-        ToolTip(self.btn_copy, BTN_COPY_TOOLTIP)
-
-        # --- Right column: output ---
-        output_frame = ttk.LabelFrame(main_frame, text=OUTPUT_FRAME_TITLE, padding=(10, 8))
-        output_frame.grid(row=0, column=1, sticky='nsew')
-        output_frame.pack_propagate(True)
-
-        self.output_box = scrolledtext.ScrolledText(
-            output_frame,
-            height=10,
-            wrap='word',
-            font=("Consolas", 11)
+        self.add_turn(prompt, generation)
+        return generation
+
+    def savings(self) -> Optional[FollowUpSavings]:
+        """Prompt evaluation the latest turn skipped by reusing the server's cached prefix."""
+        stats = [turn.stats for turn in self.turns]
+        if len(stats) < 2 or any(s is None for s in stats):
+            return None
+        prefix = sum((s.prompt_eval_count or 0) + (s.eval_count or 0) for s in stats[:-1])
+        evaluated = stats[-1].prompt_eval_count or 0
+        # A server that re-evaluated the whole conversation reports at least the prefix again
+        reused = prefix if evaluated < prefix else 0
+        first = stats[0]
+        first_seconds = (first.prompt_eval_duration or 0) / 1e9
+        rate = (first.prompt_eval_count or 0) / first_seconds if first_seconds else 0.0
+        return FollowUpSavings(evaluated, reused, reused / rate if rate else 0.0)
+
+
+# --- Batch analysis ---
+@dataclass
+class ImageResult:
+    path: str
+    model: Optional[str] = None
+    text: Optional[str] = None
+    # Separate fields of a structured (JSON-formatted) response, e.g. caption and evaluation
+    outputs: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    decode_seconds: float = 0.0
+    preprocess_seconds: float = 0.0
+    encode_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    inference_seconds: float = 0.0
+    ttft_seconds: Optional[float] = None
+    request_seconds: float = 0.0
+    source_bytes: int = 0
+    payload_bytes: int = 0
+    cached: bool = False
+    stats: Optional[OllamaResponse] = None
+    # Set on near-duplicates that reuse another image's result instead of running the model
+    duplicate_of: Optional[str] = None
+    # In watch mode: seconds from the file landing in the folder to its result
+    ingest_seconds: Optional[float] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def complete(self):
+        """Succeeded with a full reply (or reused one); only these count as done in a BatchJournal."""
+        return self.ok and (self.duplicate_of is not None or (self.stats is not None and self.stats.done))
+
+    def as_duplicate(self, path):
+        """This result, reused for a near-identical image; no work was done for it."""
+        return replace(
+            self, path=path, duplicate_of=self.path, stats=None, cached=False, decode_seconds=0.0,
+            preprocess_seconds=0.0, encode_seconds=0.0, queue_seconds=0.0, inference_seconds=0.0,
+            ttft_seconds=None, request_seconds=0.0, source_bytes=0, payload_bytes=0,
         )
-        self.output_box.pack(fill='both', expand=True)
-
-        # Bind events to update prompt display
-        self.prompt_entry.bind("<KeyRelease>", lambda e: self.update_prompt_display())
-        self.mode_var.trace_add("write", lambda *a: self.update_prompt_display())
-
-        # Initialize the prompt display
-        self.update_prompt_display()
-
-    def make_drag_and_drop_work(self):
-        def drop(event):
-            files = self.tk.splitlist(event.data)
-            if files:
-                filepath = files[0]
-                if filepath.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".cr3")):
-                    self.load_image(filepath)
-                else:
-                    messagebox.showerror("Invalid file", "Please drop a valid image file.")
-            return "break"
-
-        self.img_label.drop_target_register = getattr(self.img_label, "drop_target_register", lambda *a: None)
-        self.img_label.drop_target_register('DND_Files')
-        self.img_label.dnd_bind = getattr(self.img_label, "dnd_bind", lambda *a: None)
-        self.img_label.dnd_bind('<<Drop>>', drop)
-
-    def select_image(self):
-        filepath = filedialog.askopenfilename(
-            filetypes=[("Image Files", "*.png *.jpg *.jpeg *.bmp *.gif *.webp *.cr3")]
+
+    def record(self, generation: GenerationResult, structured=False):
+        self.text = generation.text
+        if structured:
+            self.outputs = parse_structured(generation.text)
+        self.stats = generation.stats
+        self.cached = generation.cached
+        self.encode_seconds = generation.encode_seconds
+        self.ttft_seconds = generation.first_token_seconds
+        self.request_seconds = generation.wall_seconds
+
+    def metrics(self):
+        return GenerationMetrics.from_stats(
+            self.model, self.stats,
+            cached=self.cached,
+            wall_seconds=self.request_seconds,
+            ttft_seconds=self.ttft_seconds,
+            decode_seconds=self.decode_seconds,
+            preprocess_seconds=self.preprocess_seconds,
+            encode_seconds=self.encode_seconds,
         )
-        if filepath:
-            self.load_image(filepath)
 
-    def load_image(self, path):
-        self.image_path = path
-        self.img_label.config(text=f"Loaded image: {path}")
+    def to_dict(self):
+        data = asdict(self)
+        if self.stats is not None:
+            data["stats"].pop("context", None)
+        return data
+
+
+@dataclass
+class BatchReport:
+    results: List[ImageResult] = field(default_factory=list)
+    wall_seconds: float = 0.0
+    # Stage queue depths, utilization and memory use of the run, when it went through analyze_paths
+    pipeline: Optional["Pipeline"] = None
+
+    STAGES = ("decode", "preprocess", "encode", "queue", "inference")
+
+    @property
+    def succeeded(self):
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self):
+        return len(self.results) - self.succeeded
+
+    @property
+    def cache_hits(self):
+        return sum(1 for r in self.results if r.cached)
+
+    @property
+    def duplicates(self):
+        return sum(1 for r in self.results if r.duplicate_of is not None)
+
+    @property
+    def images_per_second(self):
+        if self.wall_seconds <= 0:
+            return 0.0
+        return len(self.results) / self.wall_seconds
+
+    def stage_seconds(self, stage):
+        return [getattr(r, f"{stage}_seconds") for r in self.results]
+
+    def summary(self):
+        lines = [
+            f"Processed {len(self.results)} image(s) in {self.wall_seconds:.2f}s "
+            f"({self.images_per_second:.2f} images/sec), "
+            f"{self.succeeded} succeeded, {self.failed} failed, {self.cache_hits} from cache"
+        ]
+        if self.duplicates:
+            lines.append(f"  dedup      {self.duplicates} near-duplicate(s) reused a result, "
+                         f"{self.duplicates} inference(s) saved")
+        for stage in self.STAGES:
+            values = self.stage_seconds(stage)
+            if not values:
+                continue
+            total = sum(values)
+            lines.append(
+                f"  {stage:<10} total {total:8.2f}s  mean {total / len(values):7.3f}s  max {max(values):7.3f}s"
+            )
+        generated = [r.stats for r in self.results if r.stats is not None and not r.cached]
+        if generated:
+            load = sum(s.load_duration or 0 for s in generated) / 1e9
+            cold = sum(1 for s in generated if (s.load_duration or 0) > COLD_LOAD_THRESHOLD_NS)
+            prompt_eval = sum(s.prompt_eval_duration or 0 for s in generated) / 1e9
+            evaluation = sum(s.eval_duration or 0 for s in generated) / 1e9
+            lines.append(
+                f"  model      load {load:.2f}s ({cold} cold start(s)), "
+                f"prompt eval {prompt_eval:.2f}s, eval {evaluation:.2f}s"
+            )
+            tokens = sum(s.eval_count or 0 for s in generated)
+            prompt_tokens = sum(s.prompt_eval_count or 0 for s in generated)
+            ttft = [r.ttft_seconds for r in self.results if r.ttft_seconds is not None and not r.cached]
+            lines.append(
+                f"  tokens     {tokens} generated at {tokens / evaluation if evaluation else 0:.1f} tok/s, "
+                f"prompt eval {prompt_tokens / prompt_eval if prompt_eval else 0:.1f} tok/s, "
+                f"first token p50 {quantile(ttft, 0.5):.2f}s p95 {quantile(ttft, 0.95):.2f}s"
+            )
+        source = sum(r.source_bytes for r in self.results)
+        payload = sum(r.payload_bytes for r in self.results)
+        if source:
+            lines.append(
+                f"  payload    {payload / 1e6:.1f} MB sent for {source / 1e6:.1f} MB of source files "
+                f"({payload / source:.0%})"
+            )
+        if self.pipeline is not None:
+            lines.append(self.pipeline.summary())
+        return "\n".join(lines)
+
+
+def _decode_job(path, preprocess, raw_mode):
+    # Runs in a worker process: the result carries raw bytes, which pickle smaller than base64 text
+    return load_image(path, preprocess, raw_mode, stream_from_disk=True)
+
+
+def _inference_job(result, image, prompt, model, submitted_at, cache, client, cancel, options):
+    started = time.perf_counter()
+    result.queue_seconds = started - submitted_at
+    try:
+        generation = analyze_image(image, prompt, model, cache=cache, client=client, cancel=cancel, options=options)
+    except (requests.RequestException, ValueError) as e:
+        # ValueError: a malformed line in the response stream; it fails this image only
+        result.error = f"Request failed: {e}"
+    except OSError as e:
+        # Streamed from disk: the file was deleted or renamed after it was decoded
+        result.error = f"Failed to read image: {e}"
+    except Exception as e:
+        # Anything else is still this image's failure; the rest of the batch carries on
+        result.error = f"Analysis failed: {e!r}"
+    else:
+        result.record(generation, structured="format" in (options or {}))
+    result.inference_seconds = time.perf_counter() - started - result.encode_seconds
+    return result
+
+
+def analyze_paths(paths, prompt, model, decode_workers=DEFAULT_DECODE_WORKERS,
+                  in_flight=DEFAULT_IN_FLIGHT, cache: Optional[ResultCache] = None,
+                  preprocess: Optional[PreprocessOptions] = None, raw_mode=DEFAULT_RAW_MODE,
+                  client: Optional["OllamaClient"] = None,
+                  on_result: Optional[Callable[[ImageResult], None]] = None,
+                  cancel: Optional[CancelToken] = None, options: Optional[Dict[str, Any]] = None,
+                  memory_budget=DEFAULT_MEMORY_BUDGET, pipeline: Optional["Pipeline"] = None):
+    """Analyze images in a pipeline of stages: scan -> decode -> infer -> persist.
+
+    Stages run concurrently and are connected by bounded queues; decoded images count
+    against memory_budget bytes until their request finishes, and scanning waits while the
+    budget is used up. on_result is the persist stage and runs in the calling thread. Pass
+    a Pipeline to watch queue depths and utilization while the batch runs; it ends up in
+    the report either way. Request bodies are base64-encoded as they are sent, so encoding
+    is part of the infer stage.
+
+    paths may also be an incremental source, such as a FolderWatch, which yields None
+    while it has nothing ready; the batch then keeps asking until the source is exhausted.
+    """
+    # Imported here: concurrent.futures.process pulls in multiprocessing, which most other paths never need
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .client import OllamaClient
+    from .pipeline import Pipeline
+
+    report = BatchReport()
+    cancel = cancel or CancelToken()
+    pipeline = report.pipeline = pipeline or Pipeline(memory_budget)
+    budget = pipeline.budget
+    own_client = client is None
+    if own_client:
+        client = OllamaClient(pool_size=in_flight)
+    start = time.perf_counter()
+
+    def admit(path):
+        # Until it is decoded, assume an image takes as much memory as its file
         try:
-            img_bytes = None
-            if path.lower().endswith(".cr3"):
-                if rawpy is None or imageio is None:
-                    messagebox.showerror(
-                        "Missing dependency",
-                        "rawpy and imageio are required for CR3 support.\nInstall with: pip install rawpy imageio"
-                    )
-                    self.image_b64 = None
-                    self.show_preview(None)
-                    return
-                with rawpy.imread(path) as raw:
-                    rgb = raw.postprocess()
-                buf = io.BytesIO()
-                imageio.imwrite(buf, rgb, format='jpeg')
-                buf.seek(0)
-                img_bytes = buf.getvalue()
-                self.image_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            else:
-                with open(path, "rb") as f:
-                    img_bytes = f.read()
-                    self.image_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            self.show_preview(img_bytes)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load image:\n{e}")
-            self.image_b64 = None
-            self.show_preview(None)
-
-    def show_preview(self, img_bytes):
-        if Image is None or ImageTk is None:
-            self.preview_label.config(text="Pillow not installed, preview unavailable.", image='')
-            return
-        if img_bytes is None:
-            self.preview_label.config(image='', text="No preview available.")
-            self.preview_imgtk = None
-            return
+            reserved = os.path.getsize(path)
+        except OSError:
+            reserved = 0
+        budget.acquire(reserved, pipeline.abort)
+        return path, reserved
+
+    # Decodes not yet collected, so a teardown can cancel them (shutdown(cancel_futures=) needs 3.9)
+    submitted = set()
+
+    def decode(item):
+        path, reserved = item
+        result = ImageResult(path=path, model=model)
+        future = None
         try:
-            img = Image.open(io.BytesIO(img_bytes))
-            img.thumbnail((180, 260))
-            self.preview_imgtk = ImageTk.PhotoImage(img)
-            self.preview_label.config(image=self.preview_imgtk, text='')
+            future = decoders.submit(_decode_job, path, preprocess, raw_mode)
+            submitted.add(future)
+            loaded = future.result()
         except Exception as e:
-            self.preview_label.config(text=f"Preview error: {e}", image='')
-            self.preview_imgtk = None
-
-    def update_prompt_display(self, *args):
-        prompt_text = self.prompt_entry.get().strip()
-        mode = self.mode_var.get()
-        if not prompt_text:
-            if mode == "caption":
-                prompt_text = DEFAULT_CAPTION_PROMPT
-            elif mode == "evaluation":
-                prompt_text = DEFAULT_EVAL_PROMPT
-        self.prompt_display.config(text=f"{PROMPT_DISPLAY_PREFIX}{prompt_text}")
-
-    def on_generate(self):
-        if not self.image_b64:
-            messagebox.showwarning("No image", "Please select or drag & drop an image first.")
-            return
-
-        prompt_text = self.prompt_entry.get().strip()
-        mode = self.mode_var.get()
-
-        # Update prompt display before sending
-        self.update_prompt_display()
-
-        if not prompt_text:
-            if mode == "caption":
-                prompt_text = DEFAULT_CAPTION_PROMPT
-            elif mode == "evaluation":
-                prompt_text = DEFAULT_EVAL_PROMPT
-
-        selected_model = self.model_var.get()
-
-        self.btn_generate.config(state='disabled')
-        self.btn_copy.config(state='disabled')
-        self.progress.config(text="Generating...")
-        self.output_box.delete(1.0, tk.END)
-
-        threading.Thread(
-            target=self.call_ollama_api,
-            args=(self.image_b64, prompt_text, selected_model),
-            daemon=True
-        ).start()
-
-    def call_ollama_api(self, image_b64, prompt, model):
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "images": [image_b64]
-        }
+            budget.release(reserved)
+            result.error = f"Failed to load image: {e}"
+            return result, None, 0, time.perf_counter()
+        finally:
+            submitted.discard(future)
+        # Images streamed from disk are not held in memory
+        held = len(loaded.data) if loaded.data is not None else 0
+        budget.adjust(reserved, held)
+        result.decode_seconds = loaded.decode_seconds
+        result.preprocess_seconds = loaded.preprocess_seconds
+        result.source_bytes = loaded.source_bytes
+        result.payload_bytes = loaded.payload_bytes
+        return result, loaded.source, held, time.perf_counter()
+
+    def infer(item):
+        result, image, held, decoded_at = item
+        if image is None:
+            return result
         try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json=payload,
-                stream=True,
-                timeout=120
-            )
-            response.raise_for_status()
-        except requests.RequestException as e:
-            self.append_text(f"\nRequest failed: {e}\n")
-            self.after(0, lambda: self.progress.config(text=""))
-            self.after(0, lambda: self.btn_generate.config(state='normal'))
-            return
-
-        full_response = ""
-        known_fields = {f.name for f in fields(OllamaResponse)}
-
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode())
-                filtered_data = {k: v for k, v in data.items() if k in known_fields}
-                resp = OllamaResponse(**filtered_data)
-                self.append_text(resp.response)
-                full_response += resp.response
-                if resp.done:
-                    break
-
-        self.append_text("\n\n--- Done ---\n")
-        self.after(0, lambda: self.progress.config(text="Done!"))
-        self.after(0, lambda: self.btn_generate.config(state='normal'))
-        self.after(0, lambda: self.btn_copy.config(state='normal'))
-
-        # Auto-copy if pyperclip is installed
-        if pyperclip:
-            pyperclip.copy(full_response)
-            self.append_text("[Output copied to clipboard]\n")
+            return _inference_job(result, image, prompt, model, decoded_at, cache, client, cancel, options)
+        finally:
+            budget.release(held)
+
+    def finish(result):
+        report.results.append(result)
+        if on_result:
+            on_result(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=decode_workers) as decoders:
+            persist = pipeline.sink("persist", in_flight)
+            infer_queue = pipeline.stage("infer", in_flight, in_flight, infer, persist)
+            decode_queue = pipeline.stage("decode", decode_workers, decode_workers, decode, infer_queue)
+            pipeline.source("scan", paths, decode_queue, admit=admit, stop=lambda: cancel.cancelled)
+            try:
+                pipeline.drain(persist, finish)
+            except BaseException:
+                # On Ctrl+C, tear down in-flight requests instead of waiting for them to finish
+                cancel.cancel()
+                for future in list(submitted):
+                    future.cancel()
+                decoders.shutdown(wait=False)
+                pipeline.join()
+                raise
+    finally:
+        if own_client:
+            client.close()
+    report.wall_seconds = time.perf_counter() - start
+    return report
+
+
+def analyze_directory(directory, prompt, model, recursive=True, **kwargs):
+    return analyze_paths(find_images(directory, recursive), prompt, model, **kwargs)
+
+
+# --- Command line ---
+def build_arg_parser():
+    from .backends import BALANCE_STRATEGIES, DEFAULT_BALANCE_STRATEGY
+
+    parser = argparse.ArgumentParser(
+        description="Caption or evaluate every photo in a folder using a local Ollama vision model."
+    )
+    parser.add_argument("directory", nargs="?", help="Folder containing the images to analyze.")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Ollama model to use (default: {DEFAULT_MODEL}).")
+    parser.add_argument("--mode", choices=[val for _, val in MODES], default=DEFAULT_MODE,
+                        help="Selects the default prompt when --prompt is not given; 'both' returns a caption "
+                             "and an evaluation from a single generation.")
+    parser.add_argument("--prompt", default="", help="Custom prompt (overrides --mode).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_DECODE_WORKERS,
+                        help="Processes used to decode and encode images (default: CPU count).")
+    parser.add_argument("--in-flight", type=int, default=DEFAULT_IN_FLIGHT,
+                        help=f"Concurrent /api/generate requests (default: {DEFAULT_IN_FLIGHT}).")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Adjust each server's concurrent requests between 1 and --in-flight as the run goes, "
+                             "backing off when the first token slows down, total tokens/s stops rising or "
+                             "requests fail.")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Decoded images the batch may hold in memory before it stops reading ahead "
+                             f"(default: {DEFAULT_MEMORY_BUDGET // (1024 * 1024)} MB). Not supported with --async.")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subfolders.")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Record each image's status and result in this SQLite file. Rerunning with the same "
+                             "journal skips finished images and retries failed ones.")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="With --journal, runs an image may fail in before reruns skip it "
+                             f"(default: {DEFAULT_MAX_ATTEMPTS}).")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="Only process the I-th of N disjoint parts of the folder, e.g. 1/3 on the first of "
+                             "three machines.")
+    parser.add_argument("--watch", action="store_true",
+                        help="After the images already in the folder, keep analyzing new or changed ones as they "
+                             "land, until Ctrl+C.")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="With --watch and no inotify, seconds a file's size and mtime must stay unchanged "
+                             f"before it counts as completely written (default: {DEFAULT_SETTLE_SECONDS}). With "
+                             "inotify, a file is ready once its writer closes it.")
+    parser.add_argument("--watch-poll", type=float, default=DEFAULT_WATCH_POLL_SECONDS,
+                        help="With --watch, seconds between folder scans when inotify is not available "
+                             f"(default: {DEFAULT_WATCH_POLL_SECONDS}).")
+    parser.add_argument("--no-inotify", action="store_true",
+                        help="With --watch, scan the folder periodically instead of using inotify.")
+    parser.add_argument("--stop-after-idle", type=float, metavar="SECONDS",
+                        help="With --watch, stop once no new image has landed for this many seconds.")
+    parser.add_argument("--output", help="Write JSON lines to this file instead of stdout.")
+    parser.add_argument("--metrics", dest="metrics_path", metavar="PATH",
+                        help="Write one JSON line of performance metrics per image to this file.")
+    parser.add_argument("--prometheus", dest="prometheus_path", metavar="PATH",
+                        help="Keep Prometheus text-format metrics in this file, e.g. for the node_exporter "
+                             "textfile collector.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run requests on the asyncio client (requires aiohttp) instead of a thread per request.")
+    parser.add_argument("--host", action="append",
+                        help="Ollama server URL (default: $OLLAMA_HOST or http://localhost:11434). "
+                             "Repeat to balance requests across several servers.")
+    parser.add_argument("--balance", choices=BALANCE_STRATEGIES, default=DEFAULT_BALANCE_STRATEGY,
+                        help="How to pick a server when several --host are given "
+                             f"(default: {DEFAULT_BALANCE_STRATEGY}).")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help=f"Seconds to wait for a connection (default: {DEFAULT_CONNECT_TIMEOUT}).")
+    parser.add_argument("--first-token-timeout", type=float, default=DEFAULT_FIRST_TOKEN_TIMEOUT,
+                        help="Seconds to wait for output to start, including model load "
+                             f"(default: {DEFAULT_FIRST_TOKEN_TIMEOUT}).")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TOTAL_TIMEOUT,
+                        help=f"Maximum seconds per generation (default: {DEFAULT_TOTAL_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries on connection errors and overload responses (default: {DEFAULT_RETRIES}).")
+    parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE,
+                        help="How long Ollama keeps the model loaded after each request, e.g. 10m, 1h, "
+                             f"-1 (forever) or 0 (unload immediately) (default: {DEFAULT_KEEP_ALIVE}).")
+    parser.add_argument("--no-warm", action="store_true",
+                        help="Do not load the model before the first image is sent.")
+    parser.add_argument("--max-edge", default="auto",
+                        help="Downscale so the long edge is at most this many pixels before sending; 'auto' matches "
+                             "the model's vision encoder, 0 keeps the original size.")
+    parser.add_argument("--format", dest="image_format", choices=PREPROCESS_FORMATS, default=DEFAULT_PREPROCESS_FORMAT,
+                        help=f"Re-encode format for the request payload (default: {DEFAULT_PREPROCESS_FORMAT}).")
+    parser.add_argument("--quality", type=int, default=DEFAULT_PREPROCESS_QUALITY,
+                        help=f"Re-encode quality, 1-100 (default: {DEFAULT_PREPROCESS_QUALITY}).")
+    parser.add_argument("--raw-mode", choices=RAW_MODES, default=DEFAULT_RAW_MODE,
+                        help="CR3 decoding: embedded JPEG preview (fastest), half-size render, or full demosaic "
+                             f"(default: {DEFAULT_RAW_MODE}).")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Run the model once per group of near-identical images (e.g. burst shots) and copy "
+                             "its result to the others (requires numpy).")
+    parser.add_argument("--dedup-threshold", type=int, default=DEFAULT_DEDUP_THRESHOLD,
+                        help="Bits of the 64-bit perceptual hash two images may differ in to count as "
+                             f"near-duplicates (default: {DEFAULT_DEDUP_THRESHOLD}).")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="Send the original file bytes without resizing or re-encoding.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help=f"Result cache file (default: {DEFAULT_CACHE_PATH}).")
+    parser.add_argument("--no-cache", action="store_true", help="Always query Ollama, never read or write the cache.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Maximum cache size in MB before least recently used results are evicted.")
+    parser.add_argument("--invalidate-model", metavar="MODEL",
+                        help="Remove all cached results for MODEL (use 'all' to clear the cache).")
+    return parser
+
+
+def print_warm(client, model):
+    try:
+        print(warm_model(client, model), file=sys.stderr)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Could not preload {model}: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    from .backends import BackendPool
+    from .client import OllamaClient
+    from .pipeline import Pipeline
+
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.directory is None and not args.invalidate_model:
+        parser.error("a directory is required")
+    if args.use_async and args.memory_budget is not None:
+        # The asyncio runner does not go through the stage pipeline, so nothing would enforce the budget
+        parser.error("--memory-budget cannot be combined with --async")
+    if args.memory_budget is None:
+        args.memory_budget = DEFAULT_MEMORY_BUDGET // (1024 * 1024)
+    if args.workers < 1 or args.in_flight < 1 or args.memory_budget < 1:
+        print("--workers, --in-flight and --memory-budget must be at least 1", file=sys.stderr)
+        return 2
+    if args.use_async and args.host and len(args.host) > 1:
+        parser.error("--async supports a single --host")
+    if args.watch and (args.dedup or args.use_async):
+        parser.error("--watch cannot be combined with --dedup or --async")
+    if args.adaptive and args.use_async:
+        parser.error("--adaptive cannot be combined with --async")
+    if args.directory is not None and not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 2
+
+    preprocess = None
+    if not args.no_preprocess:
+        if args.max_edge == "auto":
+            preprocess = PreprocessOptions.for_model(args.model, image_format=args.image_format, quality=args.quality)
         else:
-            self.append_text("[Install 'pyperclip' to enable automatic clipboard copying]\n")
-
-        self.last_response = full_response
-
-    def copy_to_clipboard(self):
-        text = self.output_box.get(1.0, tk.END).strip()
-        if not text:
-            messagebox.showinfo("Nothing to copy", "No output to copy.")
-            return
-        if pyperclip:
-            pyperclip.copy(text)
-            messagebox.showinfo("Copied", "Output copied to clipboard.")
+            try:
+                max_edge = int(args.max_edge)
+            except ValueError:
+                parser.error("--max-edge must be a number of pixels or 'auto'")
+            preprocess = PreprocessOptions(max_edge=max_edge or None, image_format=args.image_format,
+                                           quality=args.quality)
+
+    cache = None if args.no_cache else ResultCache(args.cache, max_bytes=args.cache_size * 1024 * 1024)
+    if args.invalidate_model:
+        if cache is None:
+            parser.error("--invalidate-model cannot be combined with --no-cache")
+        model = None if args.invalidate_model == "all" else args.invalidate_model
+        removed = cache.invalidate(model)
+        print(f"Removed {removed} cached result(s)", file=sys.stderr)
+        if args.directory is None:
+            cache.close()
+            return 0
+
+    client_options = dict(
+        connect_timeout=args.connect_timeout,
+        first_token_timeout=args.first_token_timeout,
+        total_timeout=args.timeout,
+        retries=args.retries,
+        keep_alive=args.keep_alive,
+    )
+    if args.adaptive:
+        client_options["adaptive_limit"] = args.in_flight
+    prompt = resolve_prompt(args.prompt, args.mode)
+    options = request_options(args.mode) or None
+    journal = None
+    if args.journal:
+        # A different model, prompt or preprocessing starts a fresh job in the same file
+        job = job_key(model=args.model, prompt=prompt, options=options, raw_mode=args.raw_mode,
+                      preprocess=asdict(preprocess) if preprocess else None)
+        journal = BatchJournal(args.journal, job, max_attempts=args.max_attempts)
+    plan = None
+    backend_report = None
+    collector = MetricsCollector()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    metrics_out = open(args.metrics_path, "w", encoding="utf-8") if args.metrics_path else None
+    duplicates = None
+    duplicate_results = []
+    watch = None
+    previous_sigint = None
+    # (host, AIMDLimiter) of each server under --adaptive
+    limiters = []
+    pipeline = Pipeline(args.memory_budget * 1024 * 1024)
+    try:
+        def write_result(result):
+            if journal is not None:
+                journal.record(result)
+            out.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+            out.flush()
+            if result.duplicate_of is not None:
+                status, note = "duplicate", f"same as {result.duplicate_of}"
+            else:
+                status, note = ("ok", "ok") if result.ok else ("error", result.error)
+            metrics = result.metrics()
+            collector.observe(metrics, status=status)
+            if metrics_out is not None:
+                metrics_out.write(json.dumps(dict(path=result.path, ok=result.ok, **metrics.to_dict())) + "\n")
+                metrics_out.flush()
+            if args.prometheus_path:
+                for host, limiter in limiters:
+                    limiter.export(collector, host)
+                if pipeline.stages:
+                    pipeline.export(collector)
+                collector.write_prometheus(args.prometheus_path)
+            if result.ingest_seconds is not None:
+                note += f" ({result.ingest_seconds:.2f}s after landing)"
+            print(f"[{result.inference_seconds:6.2f}s] {result.path}: {note}", file=sys.stderr)
+
+        def on_result(result):
+            if watch is not None:
+                result.ingest_seconds = watch.result_latency(result.path)
+            write_result(result)
+            for path in duplicates.duplicates_of(result.path) if duplicates else ():
+                duplicate = result.as_duplicate(path)
+                duplicate_results.append(duplicate)
+                write_result(duplicate)
+
+        if args.watch:
+            from .watch import FolderWatch
+
+            def in_shard(path):
+                return not args.shard or bool(select_shard([path], *args.shard, root=args.directory))
+
+            # Started before the folder is listed so that nothing landing in between is missed
+            watch = FolderWatch(args.directory, recursive=not args.no_recursive, settle_seconds=args.settle,
+                                poll_seconds=args.watch_poll, use_inotify=not args.no_inotify, accept=in_shard,
+                                stop_after_idle=args.stop_after_idle)
+        paths = find_images(args.directory, recursive=not args.no_recursive)
+        if watch is not None:
+            watch.ignore(paths)
+        if args.shard:
+            paths = select_shard(paths, *args.shard, root=args.directory)
+        if journal is not None:
+            plan = journal.plan(paths)
+            print(plan.summary(), file=sys.stderr)
+            # Keep the output complete: results of earlier runs come first
+            for data in journal.results(plan.done):
+                out.write(json.dumps(data, ensure_ascii=False) + "\n")
+            out.flush()
+            paths = plan.todo
+        if args.dedup:
+            from .dedup import find_duplicates
+
+            try:
+                duplicates = find_duplicates(paths, args.dedup_threshold, workers=args.workers,
+                                             raw_mode=args.raw_mode)
+            except MissingDependencyError as e:
+                print(e, file=sys.stderr)
+                return 2
+            print(duplicates.summary(), file=sys.stderr)
+            paths = duplicates.representatives
+        if watch is not None:
+            def stop_watching(signum, frame):
+                # A second Ctrl+C aborts the images in progress as usual
+                signal.signal(signal.SIGINT, previous_sigint)
+                print("Stopping the watch, finishing images in progress...", file=sys.stderr)
+                watch.stop()
+
+            if threading.current_thread() is threading.main_thread():
+                previous_sigint = signal.signal(signal.SIGINT, stop_watching)
+            print(f"Watching {args.directory} for new images ({watch.backend}), Ctrl+C to stop", file=sys.stderr)
+            paths = itertools.chain(paths, watch)
+        batch_options = dict(
+            decode_workers=args.workers,
+            cache=cache,
+            preprocess=preprocess,
+            raw_mode=args.raw_mode,
+            on_result=on_result,
+            options=options,
+        )
+        if args.use_async:
+            from .aio import AsyncOllamaClient, run_batch
+
+            host = args.host[0] if args.host else None
+            if not args.no_warm:
+                with OllamaClient(host, **client_options) as client:
+                    print_warm(client, args.model)
+            client = AsyncOllamaClient(host, limit=args.in_flight, **client_options)
+            report = run_batch(paths, prompt, args.model, concurrency=args.in_flight, client=client, **batch_options)
+        elif args.host and len(args.host) > 1:
+            # Under --adaptive, --in-flight is the ceiling for each server rather than for all of them
+            in_flight = args.in_flight * len(args.host) if args.adaptive else args.in_flight
+            with BackendPool(args.host, strategy=args.balance, pool_size=args.in_flight, **client_options) as pool:
+                limiters.extend((b.url, b.client.limiter) for b in pool.backends if b.client.limiter is not None)
+                pool.check_health()
+                pool.start_health_checks()
+                if not args.no_warm:
+                    print_warm(pool, args.model)
+                report = analyze_paths(paths, prompt, args.model, in_flight=in_flight, client=pool,
+                                       pipeline=pipeline, **batch_options)
+            backend_report = pool.report()
         else:
-            self.clipboard_clear()
-            self.clipboard_append(text)
-            messagebox.showinfo("Copied", "Output copied to clipboard (using Tkinter).")
+            host = args.host[0] if args.host else None
+            with OllamaClient(host, pool_size=args.in_flight, **client_options) as client:
+                if client.limiter is not None:
+                    limiters.append((client.base_url, client.limiter))
+                if not args.no_warm:
+                    print_warm(client, args.model)
+                report = analyze_paths(paths, prompt, args.model, in_flight=args.in_flight, client=client,
+                                       pipeline=pipeline, **batch_options)
+    finally:
+        if previous_sigint is not None:
+            signal.signal(signal.SIGINT, previous_sigint)
+        if watch is not None:
+            watch.close()
+        if out is not sys.stdout:
+            out.close()
+        if metrics_out is not None:
+            metrics_out.close()
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+
+    report.results.extend(duplicate_results)
+    if args.prometheus_path:
+        collector.set_gauge("batch_images_per_second", report.images_per_second, "Throughput of the last batch.")
+        collector.set_gauge("batch_wall_seconds", report.wall_seconds, "Wall time of the last batch.")
+        if watch is not None and watch.latencies:
+            collector.set_summary("watch_latency_seconds", watch.latencies,
+                                  "Seconds from an image landing in the watched folder to its result.")
+        for host, limiter in limiters:
+            limiter.export(collector, host)
+        if report.pipeline is not None:
+            report.pipeline.export(collector)
+        collector.write_prometheus(args.prometheus_path)
+    print(report.summary(), file=sys.stderr)
+    if watch is not None:
+        print(watch.summary(), file=sys.stderr)
+    if backend_report:
+        print("Backends:\n" + backend_report, file=sys.stderr)
+    elif limiters:
+        host, limiter = limiters[0]
+        print(f"Concurrency on {host}: {limiter.summary()}", file=sys.stderr)
+    if plan is not None and plan.exhausted:
+        print(f"{len(plan.exhausted)} image(s) skipped after failing {args.max_attempts} times", file=sys.stderr)
+        return 1
+    return 0 if report.failed == 0 else 1
 
-    def append_text(self, text):
-        def inner():
-            self.output_box.insert(tk.END, text)
-            self.output_box.see(tk.END)
-        self.after(0, inner)
 
 if __name__ == "__main__":
-    app = OllamaApp()
-    app.mainloop()
\ No newline at end of file
+    sys.exit(main())
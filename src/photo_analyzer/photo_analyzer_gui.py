@@ -1,26 +1,44 @@
-import base64
-import json
+import os
+import queue
 import requests
 import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, scrolledtext
-from dataclasses import dataclass, fields
-from typing import Optional, List, Any
 import io
 
+from .backends import client_from_env
+from .cache import ResultCache, ThumbnailCache
+from .client import GenerationCancelled
+from .metrics import GenerationMetrics
+from .photo_analyzer import (
+    DEFAULT_MODE,
+    DEFAULT_MODEL,
+    IMAGE_EXTENSIONS,
+    MODEL_OPTIONS,
+    MODES,
+    Conversation,
+    MissingDependencyError,
+    PreprocessOptions,
+    analyze_image,
+    base64_size,
+    find_images,
+    is_image_file,
+    parse_structured,
+    preprocess_image,
+    request_options,
+    resolve_prompt,
+)
+from .prefetch import THUMBNAIL_SIZE, Prefetcher
+from .protocol import CancelToken
+from .scheduler import PRIORITY_INTERACTIVE, scheduler_from_env
+
 # Optional dependencies
 try:
     import pyperclip
 except ImportError:
     pyperclip = None
 
-try:
-    import rawpy
-    import imageio.v2 as imageio
-except ImportError:
-    rawpy = None
-    imageio = None
-
 try:
     from PIL import Image, ImageTk
 except ImportError:
@@ -34,30 +52,61 @@ IMG_FRAME_TITLE = "1. Select Image"
 IMG_LABEL_TEXT = "Drag & drop an image here or click 'Select Image'"
 BTN_SELECT_TEXT = "Select Image"
 BTN_SELECT_TOOLTIP = "Open a file dialog to select an image file."
+BTN_OPEN_FOLDER_TEXT = "Open Folder"
+BTN_OPEN_FOLDER_TOOLTIP = "Queue every image in a folder and step through them."
+BTN_PREV_TEXT = "◀"
+BTN_PREV_TOOLTIP = "Previous image in the folder (Page Up)."
+BTN_NEXT_TEXT = "▶"
+BTN_NEXT_TOOLTIP = "Next image in the folder (Page Down). Upcoming images are decoded in the background."
+QUEUE_MENU_TOOLTIP = "Jump to another image in the folder."
+# How often the Tk thread checks whether an image that is still being decoded is ready
+IMAGE_POLL_INTERVAL_MS = 30
 MODEL_FRAME_TITLE = "2. Choose Model & Mode"
 MODEL_LABEL_TEXT = "Model:"
-MODEL_OPTIONS = ["gemma3", "llava"]
 MODEL_MENU_TOOLTIP = "Choose the Ollama model to use for analysis."
 MODE_LABEL_TEXT = "Mode:"
-MODES = [("Instagram Caption", "caption"), ("Photo Evaluation", "evaluation")]
 PROMPT_FRAME_TITLE = "3. Custom Prompt (optional)"
 PROMPT_ENTRY_TOOLTIP = "Enter a custom prompt for the AI model (leave blank for default)."
 BTN_GENERATE_TEXT = "Generate"
 BTN_GENERATE_TOOLTIP = "Send the image and prompt to Ollama and generate a response."
+FOLLOWUP_FRAME_TITLE = "4. Follow-up question"
+FOLLOWUP_ENTRY_TOOLTIP = "Ask more about the same photo; the server reuses the image it has already evaluated."
+BTN_ASK_TEXT = "Ask"
+BTN_ASK_TOOLTIP = "Send the follow-up question about the current photo."
+BTN_CANCEL_TEXT = "Cancel"
+BTN_CANCEL_TOOLTIP = "Stop the running generation and free the Ollama server."
+SUPERSEDE_TEXT = "New request cancels the running one"
+SUPERSEDE_TOOLTIP = "Keep Generate enabled while a response streams; pressing it cancels the running generation."
 BTN_COPY_TEXT = "Copy to Clipboard"
 BTN_COPY_TOOLTIP = "Copy the generated response to the clipboard."
 OUTPUT_FRAME_TITLE = "Output"
-DEFAULT_CAPTION_PROMPT = (
-    "Generate an Instagram caption and hashtags for this photo. "
-    "Focus on cinematic mood and urban storytelling. Keep it concise and engaging."
-)
-DEFAULT_EVAL_PROMPT = (
-    "Critique this image from a photographic perspective. "
-    "Focus on composition, mood, lighting, and storytelling."
-)
+# Panes of the side-by-side view for the combined mode: (title, field of the JSON response)
+COMBINED_FIELDS = [("Caption", "caption"), ("Evaluation", "evaluation")]
 PROMPT_DISPLAY_PREFIX = "Prompt to be sent:\n"
 PROMPT_DISPLAY_COLOR = "#555"
 PROMPT_DISPLAY_WRAP = 400
+# Streamed text is inserted into the output box at most once per frame (~30 per second)
+OUTPUT_FRAME_INTERVAL_MS = 33
+
+# --- Streamed output buffer ---
+class TextStream:
+    """Thread-safe buffer for streamed text; the Tk thread drains it in one piece per frame."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def put(self, text):
+        if text:
+            self._queue.put(text)
+
+    def drain(self):
+        parts = []
+        while True:
+            try:
+                parts.append(self._queue.get_nowait())
+            except queue.Empty:
+                return "".join(parts)
+
 
 # --- Tooltip helper ---
 class ToolTip:
@@ -93,21 +142,6 @@ class ToolTip:
         if tw:
             tw.destroy()
 
-@dataclass
-class OllamaResponse:
-    model: str
-    created_at: str
-    response: str
-    done: bool
-    done_reason: Optional[str] = None
-    context: Optional[List[Any]] = None
-    total_duration: Optional[int] = None
-    load_duration: Optional[int] = None
-    prompt_eval_count: Optional[int] = None
-    prompt_eval_duration: Optional[int] = None
-    eval_count: Optional[int] = None
-    eval_duration: Optional[int] = None
-
 class OllamaApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -116,14 +150,39 @@ class OllamaApp(tk.Tk):
         self.resizable(False, False)
 
         self.image_path = None
-        self.image_b64 = None
+        self.current_image = None
+        self.image_queue = []
+        self.queue_index = 0
+        self.prefetcher = None
+        self.thumbnail_cache = ThumbnailCache()
+        self.loading_future = None
         self.preview_imgtk = None
+        self.output_stream = TextStream()
+        self.generation_token = None
+        self.conversation = None
+        try:
+            self.result_cache = ResultCache()
+        except Exception:
+            self.result_cache = None
+        # Requests from the window go ahead of background work such as warming the next model
+        self.scheduler = scheduler_from_env(client_from_env())
+        self.client = self.scheduler.with_priority(PRIORITY_INTERACTIVE)
 
-        self.model_var = tk.StringVar(value="llava")
-        self.mode_var = tk.StringVar(value="caption")
+        self.model_var = tk.StringVar(value=DEFAULT_MODEL)
+        self.mode_var = tk.StringVar(value=DEFAULT_MODE)
+        self.supersede_var = tk.BooleanVar(value=True)
 
         self.create_widgets()
         self.make_drag_and_drop_work()
+        self.after(OUTPUT_FRAME_INTERVAL_MS, self.flush_output)
+
+        # Load the selected model in the background so the first request doesn't pay for it
+        self.model_var.trace_add("write", lambda *a: self.warm_model())
+        self.after(0, self.warm_model)
+        # Prefetched payloads are sized for the model, so reload the current image when it changes
+        self.model_var.trace_add("write", lambda *a: self.show_queue_item(self.queue_index))
+        self.bind("<Prior>", lambda e: self.step_queue(-1))
+        self.bind("<Next>", lambda e: self.step_queue(1))
 
     def create_widgets(self):
         # Main container with two columns
@@ -157,12 +216,33 @@ class OllamaApp(tk.Tk):
         )
         self.img_label.pack(fill='x', pady=(0, 4))
 
-        btn_select = ttk.Button(img_frame, text=BTN_SELECT_TEXT, command=self.select_image)
-        btn_select.pack(pady=2)
+        select_frame = ttk.Frame(img_frame)
+        select_frame.pack(pady=2)
+        btn_select = ttk.Button(select_frame, text=BTN_SELECT_TEXT, command=self.select_image)
+        btn_select.pack(side='left', padx=4)
         ToolTip(btn_select, BTN_SELECT_TOOLTIP)
+        btn_folder = ttk.Button(select_frame, text=BTN_OPEN_FOLDER_TEXT, command=self.open_folder)
+        btn_folder.pack(side='left', padx=4)
+        ToolTip(btn_folder, BTN_OPEN_FOLDER_TOOLTIP)
+
+        # Folder queue: previous / jump to / next
+        queue_frame = ttk.Frame(img_frame)
+        queue_frame.pack(fill='x', pady=2)
+        self.btn_prev = ttk.Button(queue_frame, text=BTN_PREV_TEXT, width=3, command=lambda: self.step_queue(-1),
+                                   state='disabled')
+        self.btn_prev.pack(side='left')
+        ToolTip(self.btn_prev, BTN_PREV_TOOLTIP)
+        self.btn_next = ttk.Button(queue_frame, text=BTN_NEXT_TEXT, width=3, command=lambda: self.step_queue(1),
+                                   state='disabled')
+        self.btn_next.pack(side='right')
+        ToolTip(self.btn_next, BTN_NEXT_TOOLTIP)
+        self.queue_menu = ttk.Combobox(queue_frame, state='disabled')
+        self.queue_menu.pack(side='left', fill='x', expand=True, padx=4)
+        self.queue_menu.bind("<<ComboboxSelected>>", lambda e: self.show_queue_item(self.queue_menu.current()))
+        ToolTip(self.queue_menu, QUEUE_MENU_TOOLTIP)
 
         # Reserve space for preview using a fixed-size frame
-        preview_frame = tk.Frame(img_frame, width=180, height=260)
+        preview_frame = tk.Frame(img_frame, width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1])
         preview_frame.pack(pady=4)
         preview_frame.pack_propagate(False)
 
@@ -213,6 +293,15 @@ class OllamaApp(tk.Tk):
         self.btn_generate.pack(side='left', padx=(0, 10))
         ToolTip(self.btn_generate, BTN_GENERATE_TOOLTIP)
 
+        self.btn_cancel = ttk.Button(
+            action_frame,
+            text=BTN_CANCEL_TEXT,
+            command=self.cancel_generation,
+            state='disabled'
+        )
+        self.btn_cancel.pack(side='left', padx=(0, 10))
+        ToolTip(self.btn_cancel, BTN_CANCEL_TOOLTIP)
+
         self.progress = ttk.Label(action_frame, text="", foreground="green")
         self.progress.pack(side='left', padx=4)
 
@@ -225,6 +314,21 @@ class OllamaApp(tk.Tk):
         self.btn_copy.pack(side='right')
         ToolTip(self.btn_copy, BTN_COPY_TOOLTIP)
 
+        supersede = ttk.Checkbutton(left_frame, text=SUPERSEDE_TEXT, variable=self.supersede_var)
+        supersede.pack(anchor='w', pady=(4, 0))
+        ToolTip(supersede, SUPERSEDE_TOOLTIP)
+
+        # Follow-up frame
+        followup_frame = ttk.LabelFrame(left_frame, text=FOLLOWUP_FRAME_TITLE, padding=(10, 8))
+        followup_frame.pack(fill='x', pady=8)
+        self.followup_entry = ttk.Entry(followup_frame)
+        self.followup_entry.pack(side='left', fill='x', expand=True, padx=(2, 8))
+        self.followup_entry.bind("<Return>", lambda e: self.on_follow_up())
+        ToolTip(self.followup_entry, FOLLOWUP_ENTRY_TOOLTIP)
+        self.btn_ask = ttk.Button(followup_frame, text=BTN_ASK_TEXT, command=self.on_follow_up, state='disabled')
+        self.btn_ask.pack(side='right')
+        ToolTip(self.btn_ask, BTN_ASK_TOOLTIP)
+
         # --- Right column: output ---
         output_frame = ttk.LabelFrame(main_frame, text=OUTPUT_FRAME_TITLE, padding=(10, 8))
         output_frame.grid(row=0, column=1, sticky='nsew')
@@ -238,6 +342,17 @@ class OllamaApp(tk.Tk):
         )
         self.output_box.pack(fill='both', expand=True)
 
+        # Side-by-side view of a combined caption + evaluation result, shown above the raw output
+        self.combined_frame = ttk.Frame(output_frame)
+        self.combined_boxes = {}
+        for column, (title, key) in enumerate(COMBINED_FIELDS):
+            pane = ttk.LabelFrame(self.combined_frame, text=title, padding=(6, 4))
+            pane.grid(row=0, column=column, sticky='nsew', padx=(0 if column == 0 else 6, 0))
+            self.combined_frame.columnconfigure(column, weight=1, uniform="combined")
+            box = scrolledtext.ScrolledText(pane, height=14, wrap='word', font=("Consolas", 11))
+            box.pack(fill='both', expand=True)
+            self.combined_boxes[key] = box
+
         # Bind events to update prompt display
         self.prompt_entry.bind("<KeyRelease>", lambda e: self.update_prompt_display())
         self.mode_var.trace_add("write", lambda *a: self.update_prompt_display())
@@ -250,7 +365,7 @@ class OllamaApp(tk.Tk):
             files = self.tk.splitlist(event.data)
             if files:
                 filepath = files[0]
-                if filepath.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".cr3")):
+                if is_image_file(filepath):
                     self.load_image(filepath)
                 else:
                     messagebox.showerror("Invalid file", "Please drop a valid image file.")
@@ -263,41 +378,91 @@ class OllamaApp(tk.Tk):
 
     def select_image(self):
         filepath = filedialog.askopenfilename(
-            filetypes=[("Image Files", "*.png *.jpg *.jpeg *.bmp *.gif *.webp *.cr3")]
+            filetypes=[("Image Files", " ".join(f"*{ext}" for ext in IMAGE_EXTENSIONS))]
         )
         if filepath:
             self.load_image(filepath)
 
+    def open_folder(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        paths = find_images(folder, recursive=False)
+        if not paths:
+            messagebox.showinfo("No images", "The selected folder contains no supported images.")
+            return
+        self.set_queue(paths, 0)
+
     def load_image(self, path):
-        self.image_path = path
-        self.img_label.config(text=f"Loaded image: {path}")
+        # Queue the rest of the folder too, so the next photos are decoded before the user gets there
+        path = os.path.abspath(path)
         try:
-            img_bytes = None
-            if path.lower().endswith(".cr3"):
-                if rawpy is None or imageio is None:
-                    messagebox.showerror(
-                        "Missing dependency",
-                        "rawpy and imageio are required for CR3 support.\nInstall with: pip install rawpy imageio"
-                    )
-                    self.image_b64 = None
-                    self.show_preview(None)
-                    return
-                with rawpy.imread(path) as raw:
-                    rgb = raw.postprocess()
-                buf = io.BytesIO()
-                imageio.imwrite(buf, rgb, format='jpeg')
-                buf.seek(0)
-                img_bytes = buf.getvalue()
-                self.image_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            else:
-                with open(path, "rb") as f:
-                    img_bytes = f.read()
-                    self.image_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            self.show_preview(img_bytes)
+            paths = find_images(os.path.dirname(path), recursive=False)
+        except OSError:
+            paths = []
+        if path not in paths:
+            paths = [path]
+        self.set_queue(paths, paths.index(path))
+
+    def set_queue(self, paths, index):
+        self.image_queue = list(paths)
+        self.queue_menu.config(values=[os.path.basename(p) for p in self.image_queue], state='readonly')
+        self.show_queue_item(index)
+
+    def step_queue(self, delta):
+        index = self.queue_index + delta
+        if 0 <= index < len(self.image_queue):
+            self.show_queue_item(index)
+
+    def get_prefetcher(self):
+        # Created on first use, so the worker processes only start once there is something to load
+        if self.prefetcher is None:
+            self.prefetcher = Prefetcher(thumbnail_cache=self.thumbnail_cache)
+        return self.prefetcher
+
+    def show_queue_item(self, index):
+        if not self.image_queue or index < 0:
+            return
+        self.queue_index = index
+        path = self.image_path = self.image_queue[index]
+        self.current_image = None
+        self.queue_menu.current(index)
+        self.btn_prev.config(state='normal' if index > 0 else 'disabled')
+        self.btn_next.config(state='normal' if index < len(self.image_queue) - 1 else 'disabled')
+
+        preprocess = PreprocessOptions.for_model(self.model_var.get())
+        prefetcher = self.get_prefetcher()
+        prefetcher.prefetch(self.image_queue, index, preprocess)
+        future = self.loading_future = prefetcher.get(path, preprocess)
+        if not future.done():
+            self.img_label.config(text=f"Loading image: {path}")
+            # A photo seen before previews at once from the thumbnail cache while it decodes
+            thumbnail = self.thumbnail_cache.get(path, THUMBNAIL_SIZE)
+            if thumbnail is not None:
+                self.show_preview(thumbnail)
+        self.wait_for_image(future)
+
+    def wait_for_image(self, future):
+        # Polled from the Tk thread; a prefetched image is shown immediately
+        if future is not self.loading_future:
+            return
+        if not future.done():
+            self.after(IMAGE_POLL_INTERVAL_MS, lambda: self.wait_for_image(future))
+            return
+        self.loading_future = None
+        try:
+            image = future.result()
+        except MissingDependencyError as e:
+            messagebox.showerror("Missing dependency", str(e))
+            self.show_preview(None)
+            return
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image:\n{e}")
-            self.image_b64 = None
             self.show_preview(None)
+            return
+        self.current_image = image
+        self.img_label.config(text=f"Loaded image: {image.path}")
+        self.show_preview(image.thumbnail or image.payload)
 
     def show_preview(self, img_bytes):
         if Image is None or ImageTk is None:
@@ -309,7 +474,7 @@ class OllamaApp(tk.Tk):
             return
         try:
             img = Image.open(io.BytesIO(img_bytes))
-            img.thumbnail((180, 260))
+            img.thumbnail(THUMBNAIL_SIZE)
             self.preview_imgtk = ImageTk.PhotoImage(img)
             self.preview_label.config(image=self.preview_imgtk, text='')
         except Exception as e:
@@ -317,92 +482,217 @@ class OllamaApp(tk.Tk):
             self.preview_imgtk = None
 
     def update_prompt_display(self, *args):
-        prompt_text = self.prompt_entry.get().strip()
-        mode = self.mode_var.get()
-        if not prompt_text:
-            if mode == "caption":
-                prompt_text = DEFAULT_CAPTION_PROMPT
-            elif mode == "evaluation":
-                prompt_text = DEFAULT_EVAL_PROMPT
+        prompt_text = resolve_prompt(self.prompt_entry.get(), self.mode_var.get())
         self.prompt_display.config(text=f"{PROMPT_DISPLAY_PREFIX}{prompt_text}")
 
     def on_generate(self):
-        if not self.image_b64:
+        if self.current_image is None:
+            if self.loading_future is not None:
+                self.set_idle_status("Still loading the image...")
+                return
             messagebox.showwarning("No image", "Please select or drag & drop an image first.")
             return
 
-        prompt_text = self.prompt_entry.get().strip()
         mode = self.mode_var.get()
+        prompt_text = resolve_prompt(self.prompt_entry.get(), mode)
 
         # Update prompt display before sending
         self.update_prompt_display()
 
-        if not prompt_text:
-            if mode == "caption":
-                prompt_text = DEFAULT_CAPTION_PROMPT
-            elif mode == "evaluation":
-                prompt_text = DEFAULT_EVAL_PROMPT
-
         selected_model = self.model_var.get()
 
-        self.btn_generate.config(state='disabled')
-        self.btn_copy.config(state='disabled')
-        self.progress.config(text="Generating...")
+        token = self.begin_generation()
+        self.conversation = None
+        self.btn_ask.config(state='disabled')
+        # Drop any tail of the previous response that has not been drawn yet
+        self.output_stream.drain()
         self.output_box.delete(1.0, tk.END)
+        self.combined_frame.pack_forget()
 
         threading.Thread(
             target=self.call_ollama_api,
-            args=(self.image_b64, prompt_text, selected_model),
+            args=(self.current_image, prompt_text, selected_model, token, request_options(mode)),
             daemon=True
         ).start()
 
-    def call_ollama_api(self, image_b64, prompt, model):
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "images": [image_b64]
-        }
-        try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json=payload,
-                stream=True,
-                timeout=120
-            )
-            response.raise_for_status()
-        except requests.RequestException as e:
-            self.append_text(f"\nRequest failed: {e}\n")
-            self.after(0, lambda: self.progress.config(text=""))
-            self.after(0, lambda: self.btn_generate.config(state='normal'))
+    def begin_generation(self):
+        if self.generation_token is not None:
+            self.generation_token.cancel()
+        token = self.generation_token = CancelToken()
+
+        if not self.supersede_var.get():
+            self.btn_generate.config(state='disabled')
+            self.btn_ask.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        self.btn_copy.config(state='disabled')
+        self.progress.config(text="Generating...")
+        return token
+
+    def on_follow_up(self):
+        question = self.followup_entry.get().strip()
+        conversation = self.conversation
+        if not question or conversation is None:
+            return
+        if self.generation_token is not None and not self.supersede_var.get():
             return
+        token = self.begin_generation()
+        self.followup_entry.delete(0, tk.END)
+        threading.Thread(
+            target=self.call_follow_up,
+            args=(conversation, question, token),
+            daemon=True
+        ).start()
 
-        full_response = ""
-        known_fields = {f.name for f in fields(OllamaResponse)}
+    def cancel_generation(self):
+        token = self.generation_token
+        if token is None:
+            return
+        token.cancel()
+        self.finish_generation(token, "Cancelled")
+        self.append_text("\n\n--- Cancelled ---\n")
 
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode())
-                filtered_data = {k: v for k, v in data.items() if k in known_fields}
-                resp = OllamaResponse(**filtered_data)
-                self.append_text(resp.response)
-                full_response += resp.response
-                if resp.done:
-                    break
+    def finish_generation(self, token, status, ok=False, conversation=None):
+        # Ignore generations that were cancelled or superseded in the meantime
+        if self.generation_token is not token:
+            return
+        self.generation_token = None
+        if conversation is not None:
+            self.conversation = conversation
+        self.progress.config(text=status)
+        self.btn_generate.config(state='normal')
+        self.btn_cancel.config(state='disabled')
+        self.btn_ask.config(state='normal' if self.conversation is not None else 'disabled')
+        if ok:
+            self.btn_copy.config(state='normal')
+
+    def show_combined(self, token, outputs):
+        if self.generation_token is not token:
+            return
+        for _, key in COMBINED_FIELDS:
+            box = self.combined_boxes[key]
+            box.delete(1.0, tk.END)
+            box.insert(tk.END, outputs.get(key, ""))
+        self.combined_frame.pack(fill='both', expand=True, before=self.output_box, pady=(0, 8))
+
+    def call_ollama_api(self, image, prompt, model, token, options=None):
+        def emit(text):
+            # A cancelled generation must not write into the next one's output
+            if not token.cancelled:
+                self.append_text(text)
+
+        # The prefetcher normally shrank the payload to the model's vision encoder resolution already
+        image_bytes = image.payload
+        preprocess_seconds = image.preprocess_seconds
+        preprocess = PreprocessOptions.for_model(model)
+        if image.preprocess != preprocess:
+            start = time.perf_counter()
+            try:
+                image_bytes = preprocess_image(image_bytes, preprocess)
+            except (MissingDependencyError, OSError):
+                preprocess = None
+            else:
+                preprocess_seconds = time.perf_counter() - start
+        if preprocess is not None:
+            emit(
+                f"[Payload {base64_size(len(image_bytes)) / 1024:.0f} KB, "
+                f"re-encoded in {preprocess_seconds:.2f}s]\n\n"
+            )
+        try:
+            generation = analyze_image(
+                image_bytes, prompt, model, cache=self.result_cache, on_chunk=emit, client=self.client, cancel=token,
+                options=options
+            )
+        except GenerationCancelled:
+            self.after(0, lambda: self.finish_generation(token, "Cancelled"))
+            return
+        except (requests.RequestException, ValueError) as e:
+            emit(f"\nRequest failed: {e}\n")
+            self.after(0, lambda: self.finish_generation(token, ""))
+            return
+        if token.cancelled:
+            return
 
-        self.append_text("\n\n--- Done ---\n")
-        self.after(0, lambda: self.progress.config(text="Done!"))
-        self.after(0, lambda: self.btn_generate.config(state='normal'))
-        self.after(0, lambda: self.btn_copy.config(state='normal'))
+        full_response = generation.text
+        if options:
+            outputs = parse_structured(full_response)
+            if outputs is None:
+                emit("\n\n[Could not split the response into caption and evaluation]")
+            else:
+                self.after(0, lambda: self.show_combined(token, outputs))
+                full_response = "\n\n".join(
+                    f"{title}:\n{outputs.get(key, '')}" for title, key in COMBINED_FIELDS
+                )
+        done_text = "Done (cached)" if generation.cached else "Done!"
+        if generation.stats is not None and not generation.cached:
+            metrics = GenerationMetrics.from_stats(
+                model, generation.stats,
+                wall_seconds=generation.wall_seconds,
+                ttft_seconds=generation.first_token_seconds,
+                decode_seconds=image.decode_seconds,
+                preprocess_seconds=preprocess_seconds,
+                encode_seconds=generation.encode_seconds,
+            )
+            emit(f"\n\n[{metrics.summary()}]")
+            emit(f"\n[{self.scheduler.report()}]")
+        emit("\n\n--- Done ---\n")
+        # Follow-up questions continue from this exchange, with the same preprocessed image
+        conversation = Conversation(self.client, model, image_bytes)
+        conversation.add_turn(prompt, generation)
+        self.after(0, lambda: self.finish_generation(token, done_text, ok=True, conversation=conversation))
 
         # Auto-copy if pyperclip is installed
         if pyperclip:
             pyperclip.copy(full_response)
-            self.append_text("[Output copied to clipboard]\n")
+            emit("[Output copied to clipboard]\n")
         else:
-            self.append_text("[Install 'pyperclip' to enable automatic clipboard copying]\n")
+            emit("[Install 'pyperclip' to enable automatic clipboard copying]\n")
 
         self.last_response = full_response
 
+    def call_follow_up(self, conversation, question, token):
+        def emit(text):
+            if not token.cancelled:
+                self.append_text(text)
+
+        emit(f"\n\n> {question}\n\n")
+        try:
+            generation = conversation.ask(question, on_chunk=emit, cancel=token)
+        except GenerationCancelled:
+            self.after(0, lambda: self.finish_generation(token, "Cancelled"))
+            return
+        except (requests.RequestException, ValueError) as e:
+            emit(f"\nRequest failed: {e}\n")
+            self.after(0, lambda: self.finish_generation(token, ""))
+            return
+        if token.cancelled:
+            return
+
+        savings = conversation.savings()
+        if savings is not None:
+            emit(f"\n\n[{savings.summary()}]")
+        emit("\n\n--- Done ---\n")
+        self.last_response = generation.text
+        self.after(0, lambda: self.finish_generation(token, "Done!", ok=True))
+
+    def warm_model(self):
+        model = self.model_var.get()
+        threading.Thread(target=self._warm_model, args=(model,), daemon=True).start()
+
+    def _warm_model(self, model):
+        self.after(0, lambda: self.set_idle_status(f"Loading {model}..."))
+        try:
+            resp = self.scheduler.warm(model)
+        except (requests.RequestException, ValueError):
+            self.after(0, lambda: self.set_idle_status(""))
+            return
+        load = (resp.load_duration or 0) / 1e9
+        self.after(0, lambda: self.set_idle_status(f"{model} ready (loaded in {load:.1f}s)"))
+
+    def set_idle_status(self, text):
+        # Don't overwrite the status of a generation in progress
+        if self.generation_token is None:
+            self.progress.config(text=text)
+
     def copy_to_clipboard(self):
         text = self.output_box.get(1.0, tk.END).strip()
         if not text:
@@ -416,11 +706,21 @@ class OllamaApp(tk.Tk):
             self.clipboard_append(text)
             messagebox.showinfo("Copied", "Output copied to clipboard (using Tkinter).")
 
+    def destroy(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        super().destroy()
+
     def append_text(self, text):
-        def inner():
+        # Called from worker threads for every streamed chunk; the Tk thread picks it up in flush_output
+        self.output_stream.put(text)
+
+    def flush_output(self):
+        text = self.output_stream.drain()
+        if text:
             self.output_box.insert(tk.END, text)
             self.output_box.see(tk.END)
-        self.after(0, inner)
+        self.after(OUTPUT_FRAME_INTERVAL_MS, self.flush_output)
 
 if __name__ == "__main__":
     app = OllamaApp()
@@ -0,0 +1,311 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from .photo_analyzer import SOURCE_POLL_SECONDS
+
+_DONE = object()
+_MB = 1024 * 1024
+
+
+class ByteBudget:
+    """Bytes of image data a batch may hold in memory at once.
+
+    acquire() blocks while the budget is used up, which holds back the stages that produce
+    images until the ones consuming them catch up. An item larger than the whole budget
+    still gets through once nothing else is held, so the batch cannot stall on it.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit_bytes = limit_bytes
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes, abort: Optional[threading.Event] = None):
+        with self._cond:
+            if self.used and self.used + nbytes > self.limit_bytes:
+                self.waits += 1
+                start = time.perf_counter()
+                while self.used and self.used + nbytes > self.limit_bytes:
+                    if abort is not None and abort.is_set():
+                        break
+                    self._cond.wait(SOURCE_POLL_SECONDS)
+                self.wait_seconds += time.perf_counter() - start
+            self._add(nbytes)
+
+    def adjust(self, reserved, actual):
+        """Replace a reservation with the size the item turned out to have; never blocks."""
+        with self._cond:
+            self._add(actual - reserved)
+            if actual < reserved:
+                self._cond.notify_all()
+
+    def release(self, nbytes):
+        self.adjust(nbytes, 0)
+
+    def _add(self, nbytes):
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+    def summary(self):
+        return (
+            # In the same MB (MiB) as --memory-budget, so the budget reads back as it was given
+            f"  memory     peak {self.peak / _MB:.1f} MB of images held, budget {self.limit_bytes / _MB:.0f} MB, "
+            f"producers waited {self.waits} time(s) for {self.wait_seconds:.2f}s"
+        )
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    # Items the stage's input queue holds at most; 0 for the source, which has no input queue
+    capacity: int = 0
+    processed: int = 0
+    busy_seconds: float = 0.0
+    # Time spent waiting for room in the next stage's queue, i.e. held back by backpressure
+    blocked_seconds: float = 0.0
+    depth: int = 0
+    max_depth: int = 0
+    # Queue depth integrated over time, for the mean depth
+    depth_seconds: float = 0.0
+    _changed_at: float = 0.0
+
+    def utilization(self, wall_seconds):
+        """Share of the stage's worker time spent working."""
+        if wall_seconds <= 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / (self.workers * wall_seconds))
+
+    def mean_depth(self, wall_seconds):
+        return self.depth_seconds / wall_seconds if wall_seconds > 0 else 0.0
+
+    def summary(self, wall_seconds):
+        queue_info = (f"queue mean {self.mean_depth(wall_seconds):4.1f} max {self.max_depth}/{self.capacity}"
+                      if self.capacity else "no input queue")
+        return (
+            f"  stage {self.name:<8} {self.workers:3d} worker(s)  busy {self.utilization(wall_seconds):4.0%}  "
+            f"{queue_info}  blocked {self.blocked_seconds:.2f}s"
+        )
+
+
+class StageQueue:
+    """Bounded queue in front of a stage; put() blocks while it is full."""
+
+    def __init__(self, pipeline: "Pipeline", stats: StageStats, consumers):
+        self.pipeline = pipeline
+        self.stats = stats
+        self.consumers = consumers
+        self._queue = queue.Queue(stats.capacity)
+
+    def _track(self):
+        with self.pipeline.lock:
+            now = time.perf_counter()
+            stats = self.stats
+            stats.depth_seconds += stats.depth * (now - (stats._changed_at or now))
+            stats._changed_at = now
+            stats.depth = self._queue.qsize()
+            stats.max_depth = max(stats.max_depth, stats.depth)
+
+    def put(self, item, producer: StageStats):
+        start = time.perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout=SOURCE_POLL_SECONDS)
+                break
+            except queue.Full:
+                if self.pipeline.abort.is_set():
+                    return
+        with self.pipeline.lock:
+            producer.blocked_seconds += time.perf_counter() - start
+        self._track()
+
+    def get(self):
+        while True:
+            if self.pipeline.abort.is_set():
+                return _DONE
+            try:
+                item = self._queue.get(timeout=SOURCE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            self._track()
+            return item
+
+    def finish(self):
+        # Every consumer stops at its own end marker; they do not count towards the depth
+        for _ in range(self.consumers):
+            while not self.pipeline.abort.is_set():
+                try:
+                    self._queue.put(_DONE, timeout=SOURCE_POLL_SECONDS)
+                    break
+                except queue.Full:
+                    pass
+
+
+class Pipeline:
+    """Stages running in their own threads, connected by bounded queues, sharing one ByteBudget.
+
+    Stages are added from the last to the first: each stage() call takes the queue the
+    stage feeds and returns the queue feeding it. source() starts the first stage, which
+    pulls from an iterable; drain() runs the last stage in the calling thread. A full
+    queue or an exhausted budget makes the stage before it wait, so a fast producer
+    cannot run ahead of a slow consumer. Per-stage busy time, queue depth and time held
+    back are kept in `stages` in pipeline order.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget = ByteBudget(budget_bytes)
+        self.stages: List[StageStats] = []
+        self.lock = threading.Lock()
+        self.abort = threading.Event()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._threads = []
+        self._errors = []
+
+    @property
+    def wall_seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def _start(self, target):
+        thread = threading.Thread(target=self._guard, args=(target,), daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _guard(self, target):
+        try:
+            target()
+        except BaseException as e:
+            # Stop every stage; drain() re-raises in the calling thread
+            self._errors.append(e)
+            self.abort.set()
+
+    def _busy(self, stats, seconds):
+        with self.lock:
+            stats.processed += 1
+            stats.busy_seconds += seconds
+
+    def stage(self, name, workers, capacity, handle: Callable, output: StageQueue) -> StageQueue:
+        """Run handle(item) on `workers` threads and pass what it returns on to output."""
+        stats = StageStats(name, workers, capacity)
+        self.stages.insert(0, stats)
+        inbox = StageQueue(self, stats, workers)
+        running = [workers]
+
+        def work():
+            try:
+                while True:
+                    item = inbox.get()
+                    if item is _DONE:
+                        return
+                    start = time.perf_counter()
+                    out = handle(item)
+                    self._busy(stats, time.perf_counter() - start)
+                    output.put(out, stats)
+            finally:
+                with self.lock:
+                    running[0] -= 1
+                    last = running[0] == 0
+                if last:
+                    output.finish()
+
+        for _ in range(workers):
+            self._start(work)
+        return inbox
+
+    def source(self, name, items, output: StageQueue, admit: Callable = lambda item: item,
+               stop: Callable[[], bool] = lambda: False):
+        """Feed output from items; admit(item) may block, e.g. on the budget. None items mean "nothing yet"."""
+        stats = StageStats(name, 1)
+        self.stages.insert(0, stats)
+        self.started = time.perf_counter()
+
+        def work():
+            try:
+                iterator = iter(items)
+                while not stop() and not self.abort.is_set():
+                    start = time.perf_counter()
+                    item = next(iterator, _DONE)
+                    if item is _DONE:
+                        return
+                    if item is None:
+                        # An incremental source (see watch.py) with nothing ready yet
+                        time.sleep(SOURCE_POLL_SECONDS)
+                        continue
+                    admitting = time.perf_counter()
+                    self._busy(stats, admitting - start)
+                    admitted = admit(item)
+                    with self.lock:
+                        stats.blocked_seconds += time.perf_counter() - admitting
+                    output.put(admitted, stats)
+            finally:
+                output.finish()
+
+        self._start(work)
+
+    def sink(self, name, capacity) -> StageQueue:
+        """Queue for the last stage, which drain() runs in the calling thread."""
+        stats = StageStats(name, 1, capacity)
+        self.stages.append(stats)
+        return StageQueue(self, stats, 1)
+
+    def drain(self, inbox: StageQueue, handle: Callable):
+        """Run the last stage here until every stage has finished; on an error, stop the others and re-raise.
+
+        After an exception, call join() once whatever the stages wait on has been torn down.
+        """
+        stats = inbox.stats
+        try:
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                handle(item)
+                self._busy(stats, time.perf_counter() - start)
+        except BaseException:
+            self.abort.set()
+            raise
+        self.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def bottleneck(self) -> Optional[StageStats]:
+        """The stage that was busiest relative to its workers."""
+        wall = self.wall_seconds
+        return max(self.stages, key=lambda s: s.utilization(wall), default=None)
+
+    def summary(self):
+        wall = self.wall_seconds
+        lines = [stats.summary(wall) for stats in self.stages]
+        bottleneck = self.bottleneck()
+        if bottleneck is not None and bottleneck.busy_seconds:
+            lines.append(f"  bottleneck {bottleneck.name} ({bottleneck.utilization(wall):.0%} busy)")
+        lines.append(self.budget.summary())
+        return "\n".join(lines)
+
+    def export(self, collector):
+        """Put per-stage queue depth and utilization and the budget on a MetricsCollector."""
+        wall = self.wall_seconds
+        with self.lock:
+            for stats in self.stages:
+                if stats.capacity:
+                    collector.set_gauge("stage_queue_depth", stats.depth, "Items waiting in the stage's input queue.",
+                                        stage=stats.name)
+                collector.set_gauge("stage_utilization", stats.utilization(wall),
+                                    "Share of the stage's worker time spent working.", stage=stats.name)
+                collector.set_counter("stage_blocked_seconds_total", stats.blocked_seconds,
+                                      "Seconds the stage waited for room downstream.", stage=stats.name)
+        collector.set_gauge("image_bytes_in_memory", self.budget.used, "Bytes of image data held by the batch.")
+        collector.set_gauge("image_bytes_budget", self.budget.limit_bytes, "Memory budget for image data.")
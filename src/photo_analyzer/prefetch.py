@@ -0,0 +1,166 @@
+import io
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from .cache import ThumbnailCache
+from .lazy import lazy_import
+from .photo_analyzer import (
+    DEFAULT_RAW_MODE,
+    PreprocessOptions,
+    preprocess_image,
+    read_image_bytes,
+)
+
+# Optional dependencies
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+# --- Constants ---
+# Fits the GUI's preview area
+THUMBNAIL_SIZE = (180, 260)
+DEFAULT_PREFETCH_AHEAD = 8
+# Images kept decoded behind the current one, so stepping back is instant too
+DEFAULT_PREFETCH_BEHIND = 1
+DEFAULT_PREFETCH_BUDGET = 256 * 1024 * 1024
+DEFAULT_PREFETCH_WORKERS = min(4, os.cpu_count() or 1)
+
+
+@dataclass
+class PrefetchedImage:
+    path: str
+    # Bytes to send: re-encoded for the model when preprocess is set, else the decoded file
+    payload: bytes
+    thumbnail: Optional[bytes] = None
+    preprocess: Optional[PreprocessOptions] = None
+    decode_seconds: float = 0.0
+    preprocess_seconds: float = 0.0
+
+    @property
+    def nbytes(self):
+        return len(self.payload) + len(self.thumbnail or b"")
+
+
+def make_thumbnail(img_bytes, size=THUMBNAIL_SIZE):
+    """PNG preview of an image, or None when it cannot be rendered."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as img:
+            # JPEGs decode straight at 1/2, 1/4 or 1/8 scale instead of at full resolution
+            img.draft("RGB", size)
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(size)
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+    except (OSError, ValueError):
+        return None
+    return buf.getvalue()
+
+
+def cached_thumbnail(path, img_bytes, size=THUMBNAIL_SIZE, cache: Optional[ThumbnailCache] = None):
+    thumbnail = cache.get(path, size) if cache is not None else None
+    if thumbnail is None:
+        thumbnail = make_thumbnail(img_bytes, size)
+        if thumbnail is not None and cache is not None:
+            cache.put(path, size, thumbnail)
+    return thumbnail
+
+
+def prefetch_image(path, preprocess: Optional[PreprocessOptions] = None, raw_mode=DEFAULT_RAW_MODE,
+                   thumbnail_size=THUMBNAIL_SIZE, thumbnail_cache: Optional[ThumbnailCache] = None):
+    """Decode, preprocess and thumbnail one image; runs in a worker process."""
+    start = time.perf_counter()
+    data = read_image_bytes(path, raw_mode)
+    decoded = time.perf_counter()
+    image = PrefetchedImage(path=path, payload=data, decode_seconds=decoded - start)
+    if Image is None:
+        return image
+    image.thumbnail = cached_thumbnail(path, data, thumbnail_size, thumbnail_cache)
+    if preprocess is not None:
+        start = time.perf_counter()
+        image.payload = preprocess_image(data, preprocess)
+        image.preprocess = preprocess
+        image.preprocess_seconds = time.perf_counter() - start
+    return image
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Prefetcher:
+    """Loads the images around the current position of a queue in a process pool, ahead of the viewer.
+
+    Images outside the window are dropped, and no more are started once the finished and
+    in-flight ones reach the memory budget. Call it from a single thread (the Tk thread).
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_PREFETCH_BUDGET, ahead=DEFAULT_PREFETCH_AHEAD,
+                 behind=DEFAULT_PREFETCH_BEHIND, workers=DEFAULT_PREFETCH_WORKERS, raw_mode=DEFAULT_RAW_MODE,
+                 thumbnail_cache: Optional[ThumbnailCache] = None, executor=None):
+        self.budget_bytes = budget_bytes
+        self.ahead = ahead
+        self.behind = behind
+        self.raw_mode = raw_mode
+        self.thumbnail_cache = thumbnail_cache
+        self._executor = executor or ProcessPoolExecutor(max_workers=workers)
+        self._futures = {}
+
+    def _estimate(self, future, path):
+        if not future.done():
+            # Until it is decoded, assume the image takes as much memory as its file
+            return _file_size(path)
+        if future.cancelled() or future.exception() is not None:
+            return 0
+        return future.result().nbytes
+
+    @property
+    def used_bytes(self):
+        return sum(self._estimate(future, path) for (path, _), future in self._futures.items())
+
+    def _submit(self, key):
+        path, preprocess = key
+        future = self._futures[key] = self._executor.submit(
+            prefetch_image, path, preprocess, self.raw_mode, THUMBNAIL_SIZE, self.thumbnail_cache
+        )
+        return future
+
+    def get(self, path, preprocess: Optional[PreprocessOptions] = None) -> Future:
+        """Future for one image, started now if it was not prefetched."""
+        key = (path, preprocess)
+        future = self._futures.get(key)
+        if future is None or future.cancelled():
+            future = self._submit(key)
+        return future
+
+    def prefetch(self, paths, index, preprocess: Optional[PreprocessOptions] = None):
+        """Keep paths[index] and its neighbours loaded, nearest first; drop everything else."""
+        ahead = paths[index:index + self.ahead + 1]
+        behind = paths[max(0, index - self.behind):index][::-1]
+        wanted = [(path, preprocess) for path in ahead + behind]
+        keep = set(wanted)
+        for key in list(self._futures):
+            if key not in keep:
+                self._futures.pop(key).cancel()
+        used = self.used_bytes
+        for key in wanted:
+            if key in self._futures and not self._futures[key].cancelled():
+                continue
+            estimate = _file_size(key[0])
+            # The current image is always loaded, even when it alone exceeds the budget
+            if key != wanted[0] and used + estimate > self.budget_bytes:
+                break
+            self._submit(key)
+            used += estimate
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,266 @@
+# Ollama wire format: response records, NDJSON stream parsing and streamed request bodies.
+# Nothing here needs an HTTP library, so it loads without importing requests.
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Optional, List, Any
+
+# Optional dependencies
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Constants ---
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_FIRST_TOKEN_TIMEOUT = 120
+DEFAULT_TOTAL_TIMEOUT = 600
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# How long Ollama keeps a model loaded after a request ("30m", "1h", seconds, -1 = forever, 0 = unload)
+DEFAULT_KEEP_ALIVE = "30m"
+# Multiple of 3 so every chunk base64-encodes without padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+# Marks where the streamed image goes in a request payload, e.g. inside a chat message
+IMAGE_PLACEHOLDER = "\x00image\x00"
+# __slots__ on dataclasses needs Python 3.10+
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+@dataclass(**_SLOTS)
+class OllamaResponse:
+    model: str
+    created_at: str
+    response: str
+    done: bool
+    done_reason: Optional[str] = None
+    context: Optional[List[Any]] = None
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[int] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[int] = None
+
+
+@dataclass
+class GenerationResult:
+    text: str
+    stats: Optional[OllamaResponse] = None
+    cached: bool = False
+    encode_seconds: float = 0.0
+    # Client-side timings: request start to first generated text, and to the done record
+    first_token_seconds: Optional[float] = None
+    wall_seconds: float = 0.0
+    # Server that produced the result
+    host: Optional[str] = None
+
+    @property
+    def complete(self):
+        """Whether the done record arrived; only complete generations are cached."""
+        return self.stats is not None and self.stats.done
+
+
+class CancelToken:
+    """Cancels in-flight generations from another thread.
+
+    Generations register callbacks that tear down their connection, so cancel() takes
+    effect at once and the server sees the disconnect and stops generating. One token
+    can be shared by several generations, e.g. every request of a batch.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            callback()
+
+    def register(self, callback):
+        """Run callback on cancel (right away if already cancelled); returns a function that unregisters it."""
+        key = object()
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks[key] = callback
+                return lambda: self._unregister(key)
+        callback()
+        return lambda: None
+
+    def _unregister(self, key):
+        with self._lock:
+            self._callbacks.pop(key, None)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            # The exception derives from requests.RequestException, so it lives with the HTTP client
+            from .client import GenerationCancelled
+
+            raise GenerationCancelled("Generation cancelled")
+
+
+_KNOWN_FIELDS = frozenset(f.name for f in fields(OllamaResponse))
+
+
+def _response_from(data):
+    return OllamaResponse(**{k: v for k, v in data.items() if k in _KNOWN_FIELDS})
+
+
+def parse_stream_line(line):
+    return _response_from(_loads(line))
+
+
+def _stream_error(message):
+    # Like GenerationCancelled, the exception derives from requests.RequestException
+    from .client import OllamaStreamError
+
+    return OllamaStreamError(message)
+
+
+class StreamParser:
+    """Accumulates a streamed /api/generate response.
+
+    Each NDJSON line is decoded to a plain dict; only the final done record, which
+    carries the timing stats, is turned into an OllamaResponse. Understands both
+    /api/generate ("response") and /api/chat ("message") lines. An error record, which
+    Ollama sends when generation fails mid-stream, raises OllamaStreamError.
+    """
+
+    __slots__ = ("_parts", "final")
+
+    def __init__(self):
+        self._parts = []
+        self.final: Optional[OllamaResponse] = None
+
+    def feed(self, line):
+        """Parse one line and return its text."""
+        data = _loads(line)
+        if data.get("error") is not None:
+            raise _stream_error(f"Ollama reported an error mid-stream: {data['error']}")
+        message = data.get("message")
+        text = (message.get("content") if message else data.get("response")) or ""
+        if text:
+            self._parts.append(text)
+        if data.get("done"):
+            data.setdefault("response", "")
+            self.final = _response_from(data)
+        return text
+
+    def finish(self):
+        """Call once the body has ended; raises OllamaStreamError if the done record never came."""
+        if self.final is None:
+            raise _stream_error("Response stream ended before the done record")
+
+    @property
+    def done(self):
+        return self.final is not None
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+
+def parse_keep_alive(value):
+    # Ollama takes either a duration string ("10m") or a number of seconds
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def base64_size(n_bytes):
+    return 4 * ((n_bytes + 2) // 3)
+
+
+def normalize_host(host):
+    # Accepts the same forms as the OLLAMA_HOST environment variable, e.g. "gpu-box:11434"
+    host = host.strip().rstrip("/")
+    if "://" not in host:
+        host = "http://" + host
+    return host
+
+
+class GenerateRequestBody:
+    """File-like JSON request body that base64-encodes the image chunk by chunk as it is sent.
+
+    The image may be bytes, a memoryview or a file path. Neither the base64 text nor the
+    serialized JSON document is ever held in memory as a whole. It goes into a top-level
+    "images" list unless the payload already contains IMAGE_PLACEHOLDER somewhere.
+    """
+
+    def __init__(self, payload, image, chunk_size=BASE64_CHUNK_SIZE):
+        if chunk_size % 3:
+            raise ValueError("chunk_size must be a multiple of 3")
+        self.image = memoryview(image) if not isinstance(image, str) else image
+        self.chunk_size = chunk_size
+        self.encode_seconds = 0.0
+        marker = json.dumps(IMAGE_PLACEHOLDER)[1:-1].encode("utf-8")
+        document = json.dumps(payload).encode("utf-8")
+        if marker not in document:
+            document = json.dumps(dict(payload, images=[IMAGE_PLACEHOLDER])).encode("utf-8")
+        self._prefix, self._suffix = document.split(marker)
+        image_len = os.path.getsize(image) if isinstance(image, str) else self.image.nbytes
+        self._length = len(self._prefix) + base64_size(image_len) + len(self._suffix)
+        self._chunks = None
+        self._pending = b""
+        self._offset = 0
+
+    def __len__(self):
+        return self._length
+
+    def _iter_raw(self):
+        if isinstance(self.image, str):
+            with open(self.image, "rb") as f:
+                yield from iter(lambda: f.read(self.chunk_size), b"")
+        else:
+            for offset in range(0, self.image.nbytes, self.chunk_size):
+                yield self.image[offset:offset + self.chunk_size]
+
+    def __iter__(self):
+        yield self._prefix
+        for raw in self._iter_raw():
+            start = time.perf_counter()
+            encoded = base64.b64encode(raw)
+            self.encode_seconds += time.perf_counter() - start
+            yield encoded
+        yield self._suffix
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = iter(self)
+        if size is None or size < 0:
+            data = self._pending[self._offset:] + b"".join(self._chunks)
+            self._pending, self._offset = b"", 0
+            return data
+        parts = []
+        while size > 0:
+            if self._offset >= len(self._pending):
+                self._pending, self._offset = next(self._chunks, b""), 0
+                if not self._pending:
+                    break
+            piece = self._pending[self._offset:self._offset + size]
+            self._offset += len(piece)
+            size -= len(piece)
+            parts.append(piece)
+        return b"".join(parts)
@@ -0,0 +1,275 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from .photo_analyzer import COLD_LOAD_THRESHOLD_NS
+from .protocol import CancelToken
+
+# --- Constants ---
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+# Requests one backend generates at once, like the server's OLLAMA_NUM_PARALLEL
+DEFAULT_SCHEDULER_SLOTS = 2
+# Models one backend keeps loaded at once, like the server's OLLAMA_MAX_LOADED_MODELS on a GPU with room for one
+DEFAULT_MAX_LOADED_MODELS = 1
+
+
+@dataclass
+class SchedulerStats:
+    requests: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # Times a backend had to unload one model to load another
+    swaps: int = 0
+    # Requests the server reported a model load for, and the time those loads took
+    loads: int = 0
+    load_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    # Interactive requests started ahead of batch requests that were waiting longer
+    preemptions: int = 0
+
+    def summary(self):
+        total = sum(self.requests.values())
+        mean_wait = self.wait_seconds / total if total else 0.0
+        return (
+            f"Scheduler: {total} request(s) for {len(self.requests)} model(s), {self.swaps} model swap(s), "
+            f"{self.loads} load(s) taking {self.load_seconds:.2f}s, mean wait {mean_wait:.2f}s, "
+            f"{self.preemptions} interactive preemption(s)"
+        )
+
+
+class _HostState:
+    def __init__(self, url):
+        self.url = url
+        self.running = defaultdict(int)
+        # Models this backend is believed to have loaded, least recently used first
+        self.resident = OrderedDict()
+
+    @property
+    def in_flight(self):
+        return sum(self.running.values())
+
+
+class _Ticket:
+    __slots__ = ("model", "priority", "seq", "prefer_host", "queued_at", "host", "ready")
+
+    def __init__(self, model, priority, seq, prefer_host):
+        self.model = model
+        self.priority = priority
+        self.seq = seq
+        self.prefer_host = prefer_host
+        self.queued_at = time.monotonic()
+        self.host: Optional[_HostState] = None
+        self.ready = threading.Event()
+
+
+class ModelScheduler:
+    """Orders requests for several models so that Ollama swaps models as rarely as possible.
+
+    A backend keeps taking requests for the models it has loaded. A model that is not
+    loaded only replaces one once that model has no requests running or waiting, so each
+    group of requests for a model drains before the switch. At most `slots` requests run
+    on a backend at once and at most max_loaded_models stay loaded there. Interactive
+    requests start ahead of all batch work and may switch models right away; requests
+    already running are never interrupted.
+
+    Sits in front of an OllamaClient or a BackendPool and has the same interface;
+    with_priority() returns a view whose requests all carry one priority. Through a pool,
+    warm() records the model on every backend that loaded it, and a request the pool
+    failed over to another backend counts as a load there.
+    """
+
+    def __init__(self, client, slots=DEFAULT_SCHEDULER_SLOTS, max_loaded_models=DEFAULT_MAX_LOADED_MODELS):
+        if slots < 1 or max_loaded_models < 1:
+            raise ValueError("slots and max_loaded_models must be at least 1")
+        self.client = client
+        self.slots = slots
+        self.max_loaded_models = max_loaded_models
+        self._backends = {b.url: b for b in getattr(client, "backends", ())}
+        urls = list(self._backends) or [client.base_url]
+        self.hosts = {url: _HostState(url) for url in urls}
+        self.stats = SchedulerStats()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._seq = itertools.count()
+
+    def with_priority(self, priority):
+        return _PriorityView(self, priority)
+
+    def generate(self, image, prompt, model, on_chunk=None, cancel: Optional[CancelToken] = None,
+                 priority=PRIORITY_BATCH, prefer_host=None, **extra):
+        return self._run(
+            model, priority, prefer_host, cancel,
+            lambda host: self.client.generate(image, prompt, model, on_chunk=on_chunk, cancel=cancel,
+                                              prefer_host=host, **extra),
+        )
+
+    def chat(self, messages, model, image, on_chunk=None, cancel: Optional[CancelToken] = None, prefer_host=None,
+             priority=PRIORITY_BATCH, **extra):
+        return self._run(
+            model, priority, prefer_host, cancel,
+            lambda host: self.client.chat(messages, model, image, on_chunk=on_chunk, cancel=cancel,
+                                          prefer_host=host, **extra),
+        )
+
+    def warm(self, model, keep_alive=None, priority=PRIORITY_BATCH):
+        if self._backends:
+            # A pool loads the model on every backend that has it, not on one placed host
+            responses = self.client.warm_each(model, keep_alive)
+            with self._lock:
+                self.stats.requests[model] += 1
+                for url, response in responses.items():
+                    self._make_resident(self.hosts[url], model)
+                    self._count_load(response)
+                self._dispatch()
+            return max(responses.values(), key=lambda r: r.load_duration or 0)
+        return self._run(model, priority, None, None, lambda host: self.client.warm(model, keep_alive),
+                         stats_of=lambda response: response)
+
+    def _run(self, model, priority, prefer_host, cancel, request, stats_of=lambda generation: generation.stats):
+        ticket = _Ticket(model, priority, next(self._seq), prefer_host)
+        with self._lock:
+            self.stats.requests[model] += 1
+            self._pending.append(ticket)
+            self._dispatch()
+        unregister = cancel.register(ticket.ready.set) if cancel is not None else None
+        try:
+            ticket.ready.wait()
+        finally:
+            if unregister is not None:
+                unregister()
+        with self._lock:
+            if ticket.host is None:
+                # Woken by the cancel token before a slot came up
+                self._pending.remove(ticket)
+                self._dispatch()
+            else:
+                self.stats.wait_seconds += time.monotonic() - ticket.queued_at
+        if ticket.host is None:
+            cancel.raise_if_cancelled()
+        result = None
+        try:
+            result = request(ticket.host.url)
+            return result
+        finally:
+            self._finish(ticket, stats_of(result) if result is not None else None, getattr(result, "host", None))
+
+    def _candidates(self, model):
+        if not self._backends:
+            return list(self.hosts.values())
+        serving = [self.hosts[url] for url, b in self._backends.items() if b.healthy and b.has_model(model)]
+        return serving or list(self.hosts.values())
+
+    def _victim(self, host, ticket):
+        # Least recently used idle model; a batch request also leaves models with waiting requests alone
+        for model in host.resident:
+            if host.running[model]:
+                continue
+            if ticket.priority != PRIORITY_INTERACTIVE and any(t.model == model for t in self._pending):
+                continue
+            return model
+        return None
+
+    def _place(self, ticket):
+        free = [h for h in self._candidates(ticket.model) if h.in_flight < self.slots]
+        loaded = [h for h in free if ticket.model in h.resident]
+        if loaded:
+            preferred = [h for h in loaded if h.url == ticket.prefer_host]
+            return (preferred[0] if preferred else min(loaded, key=lambda h: h.in_flight)), None
+        roomy = [h for h in free if len(h.resident) < self.max_loaded_models]
+        if roomy:
+            return min(roomy, key=lambda h: h.in_flight), None
+        for host in sorted(free, key=lambda h: h.in_flight):
+            victim = self._victim(host, ticket)
+            if victim is not None:
+                return host, victim
+        return None
+
+    def _make_resident(self, host, model):
+        # Record a load the scheduler did not place itself, evicting like the server would
+        if model not in host.resident:
+            while len(host.resident) >= self.max_loaded_models:
+                victim = next((m for m in host.resident if not host.running[m]), next(iter(host.resident)))
+                del host.resident[victim]
+                self.stats.swaps += 1
+        host.resident[model] = None
+        host.resident.move_to_end(model)
+
+    def _dispatch(self):
+        # Called with the lock held whenever a request arrives, gives up or finishes
+        for ticket in sorted(self._pending, key=lambda t: (t.priority, t.seq)):
+            placement = self._place(ticket)
+            if placement is None:
+                if ticket.priority == PRIORITY_INTERACTIVE:
+                    # Hold back batch work so the next free slot goes to the interactive request
+                    break
+                continue
+            host, victim = placement
+            if victim is not None:
+                del host.resident[victim]
+                self.stats.swaps += 1
+            host.resident[ticket.model] = None
+            host.resident.move_to_end(ticket.model)
+            host.running[ticket.model] += 1
+            if ticket.priority == PRIORITY_INTERACTIVE and any(
+                    t.priority != PRIORITY_INTERACTIVE and t.seq < ticket.seq for t in self._pending):
+                self.stats.preemptions += 1
+            self._pending.remove(ticket)
+            ticket.host = host
+            ticket.ready.set()
+
+    def _finish(self, ticket, stats, served=None):
+        with self._lock:
+            ticket.host.running[ticket.model] -= 1
+            if served is not None and served != ticket.host.url and served in self.hosts:
+                # The pool failed over to another backend, which has the model loaded now
+                self._make_resident(self.hosts[served], ticket.model)
+            self._count_load(stats)
+            self._dispatch()
+
+    def _count_load(self, stats):
+        if stats is not None and (stats.load_duration or 0) > COLD_LOAD_THRESHOLD_NS:
+            self.stats.loads += 1
+            self.stats.load_seconds += stats.load_duration / 1e9
+
+    def report(self):
+        return self.stats.summary()
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PriorityView:
+    """Client interface onto a ModelScheduler whose requests all carry one priority."""
+
+    def __init__(self, scheduler: ModelScheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def generate(self, *args, **kwargs):
+        return self.scheduler.generate(*args, priority=self.priority, **kwargs)
+
+    def chat(self, *args, **kwargs):
+        return self.scheduler.chat(*args, priority=self.priority, **kwargs)
+
+    def warm(self, model, keep_alive=None):
+        return self.scheduler.warm(model, keep_alive, priority=self.priority)
+
+    def close(self):
+        # The scheduler owns the client
+        pass
+
+
+def scheduler_from_env(client):
+    # Same variables the Ollama server reads, so a local server and the scheduler agree
+    slots = int(os.environ.get("OLLAMA_NUM_PARALLEL") or DEFAULT_SCHEDULER_SLOTS)
+    max_loaded = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS") or DEFAULT_MAX_LOADED_MODELS)
+    return ModelScheduler(client, slots=slots, max_loaded_models=max_loaded)
@@ -0,0 +1,313 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from .metrics import quantile
+from .photo_analyzer import DEFAULT_SETTLE_SECONDS, DEFAULT_WATCH_POLL_SECONDS, is_image_file
+
+# --- Constants ---
+# inotify(7) event flags
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _walk_dirs(root, recursive):
+    yield root
+    if recursive:
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames.sort()
+            for name in dirnames:
+                yield os.path.join(dirpath, name)
+
+
+def _list_files(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.path for entry in entries if entry.is_file()]
+    except OSError:
+        return []
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None when it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+class InotifyWatcher:
+    """Reports files created, written or moved into a folder tree, using Linux inotify through ctypes.
+
+    poll() returns (path, complete) pairs: complete is True once the writer closed the file
+    (IN_CLOSE_WRITE) or it was moved in whole (IN_MOVED_TO), False while it is being
+    written. New subfolders are watched as they appear; files that landed in them before
+    the watch was added are reported too, as is the whole tree after a kernel queue
+    overflow. Those come with complete=None, as nothing is known about their writers.
+    """
+
+    def __init__(self, root, recursive=True):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.root = root
+        self.recursive = recursive
+        self._dirs: Dict[int, str] = {}
+        for directory in _walk_dirs(root, recursive):
+            self._add(directory)
+
+    def _add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = directory
+
+    def poll(self, timeout=0.0):
+        """(path, complete) of files that changed since the last call, waiting up to timeout seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    for directory in _walk_dirs(self.root, self.recursive):
+                        changed.extend((path, None) for path in _list_files(directory))
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        for sub in _walk_dirs(path, True):
+                            self._add(sub)
+                            changed.extend((path, None) for path in _list_files(sub))
+                else:
+                    changed.append((path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Finds new or changed files by comparing folder listings at a fixed interval; works everywhere.
+
+    Like InotifyWatcher.poll(), poll() returns (path, complete) pairs; complete is always
+    None, as a listing cannot tell whether a writer is done.
+    """
+
+    def __init__(self, root, recursive=True, interval=DEFAULT_WATCH_POLL_SECONDS):
+        self.root = root
+        self.recursive = recursive
+        self.interval = interval
+        self._known = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        files = {}
+        for directory in _walk_dirs(self.root, self.recursive):
+            for path in _list_files(directory):
+                files[path] = file_signature(path)
+        return files
+
+    def poll(self, timeout=0.0):
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        self._next_scan = time.monotonic() + self.interval
+        files = self._scan()
+        changed = [(path, None) for path, signature in files.items() if self._known.get(path) != signature]
+        self._known = files
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root, recursive=True, poll_seconds=DEFAULT_WATCH_POLL_SECONDS, use_inotify=True):
+    if use_inotify:
+        try:
+            return InotifyWatcher(root, recursive)
+        except (OSError, AttributeError):
+            # Not Linux, no libc symbol, or out of inotify instances/watches
+            pass
+    return PollingWatcher(root, recursive, poll_seconds)
+
+
+class FolderWatch:
+    """Images that land in a folder, each yielded once it has finished being written.
+
+    With inotify, a file is ready when its writer closes it or it is moved in whole, however
+    long the writer pauses in between. Otherwise, and for files found by listing a folder
+    (a new subfolder, a queue overflow), a file is ready once its size and mtime have not
+    changed for settle_seconds. Files that were already handed out come back only when
+    they change; a rewrite with identical content is recognized by its hash and skipped.
+    Iterating never blocks: it yields None while nothing is ready and stops after stop() is
+    called, or once nothing has landed for stop_after_idle seconds, which makes it a source
+    for analyze_paths. Every path's landing time is kept so the latency to its result can
+    be measured with result_latency().
+    """
+
+    def __init__(self, root, recursive=True, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_seconds=DEFAULT_WATCH_POLL_SECONDS, use_inotify=True, accept=None, stop_after_idle=None):
+        self.watcher = make_watcher(root, recursive, poll_seconds, use_inotify)
+        self.settle_seconds = settle_seconds
+        self.accept = accept
+        self.stop_after_idle = stop_after_idle
+        self._last_activity = time.monotonic()
+        # path -> (signature, time it last changed, whether it waits for its writer to close it)
+        self._pending = {}
+        # path -> (signature, digest) of what was handed out; no digest for files present at the start
+        self._seen = {}
+        self._ready = deque()
+        self.landed_at: Dict[str, float] = {}
+        self.latencies = []
+        self.settle_times = []
+        self.skipped = 0
+        self._stopped = False
+
+    @property
+    def backend(self):
+        return "inotify" if isinstance(self.watcher, InotifyWatcher) else "polling"
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._stopped:
+            raise StopIteration
+        if not self._ready:
+            self.check()
+        if self._ready:
+            self._last_activity = time.monotonic()
+            return self._ready.popleft()
+        if (self.stop_after_idle is not None and not self._pending
+                and time.monotonic() - self._last_activity >= self.stop_after_idle):
+            self.stop()
+            raise StopIteration
+        return None
+
+    def stop(self):
+        self._stopped = True
+
+    def ignore(self, paths):
+        """Treat paths as already handled, e.g. the images that were in the folder at the start."""
+        for path in paths:
+            self._seen[path] = (file_signature(path), None)
+
+    def check(self, timeout=0.0):
+        """Take in file events, waiting up to timeout seconds, and move settled files to the ready queue."""
+        now = time.monotonic()
+        # Ordered and without repeats: a file can be closed several times within one poll
+        closed = {}
+        for path, complete in self.watcher.poll(timeout):
+            if not is_image_file(path) or (self.accept is not None and not self.accept(path)):
+                continue
+            self.landed_at.setdefault(path, now)
+            self._last_activity = now
+            if complete:
+                self._pending.pop(path, None)
+                closed[path] = None
+            else:
+                # Still open for writing (False), or unknown (None): then the settle timer decides
+                self._pending[path] = (None, now, complete is False)
+        now = time.monotonic()
+        for path in closed:
+            current = file_signature(path)
+            if current is None:
+                self.landed_at.pop(path, None)
+            elif path not in self._pending:
+                self._settle(path, current, now)
+        for path, (signature, changed_at, writing) in list(self._pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self._pending[path]
+                self.landed_at.pop(path, None)
+            elif writing:
+                continue
+            elif current != signature:
+                self._pending[path] = (current, now, False)
+            elif now - changed_at >= self.settle_seconds:
+                del self._pending[path]
+                self._settle(path, current, now)
+
+    def _settle(self, path, signature, now):
+        seen = self._seen.get(path)
+        if seen is not None and seen[0] == signature:
+            self.landed_at.pop(path, None)
+            return
+        try:
+            digest = file_digest(path)
+        except OSError:
+            self.landed_at.pop(path, None)
+            return
+        self._seen[path] = (signature, digest)
+        if seen is not None and seen[1] == digest:
+            self.skipped += 1
+            self.landed_at.pop(path, None)
+            return
+        self.settle_times.append(now - self.landed_at[path])
+        self._ready.append(path)
+
+    def result_latency(self, path) -> Optional[float]:
+        """Seconds from path landing in the folder until now, for a path this watch yielded."""
+        landed = self.landed_at.pop(path, None)
+        if landed is None:
+            return None
+        latency = time.monotonic() - landed
+        self.latencies.append(latency)
+        return latency
+
+    def summary(self):
+        if not self.latencies:
+            return f"Watch ({self.backend}): no new images"
+        settle = sum(self.settle_times) / len(self.settle_times) if self.settle_times else 0.0
+        return (
+            f"Watch ({self.backend}): {len(self.latencies)} new image(s), landing to result "
+            f"p50 {quantile(self.latencies, 0.5):.2f}s, p90 {quantile(self.latencies, 0.9):.2f}s, "
+            f"max {max(self.latencies):.2f}s (mean {settle:.2f}s waiting for writes to settle), "
+            f"{self.skipped} unchanged rewrite(s) skipped"
+        )
+
+    def close(self):
+        self.watcher.close()
@@ -0,0 +1,107 @@
+import unittest
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from http.server import ThreadingHTTPServer
+from photo_analyzer.aio import AsyncOllamaClient, run_batch
+from test_client import FakeOllamaHandler
+
+
+class TestAsyncOllamaClient(unittest.TestCase):
+    def setUp(self):
+        FakeOllamaHandler.failures = []
+        FakeOllamaHandler.context = None
+        FakeOllamaHandler.requests_seen = []
+        FakeOllamaHandler.ending = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        FakeOllamaHandler.ending = None
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_client(self, fn):
+        async def run():
+            async with AsyncOllamaClient(self.host, backoff=0) as client:
+                return await fn(client)
+        return asyncio.run(run())
+
+    def test_analyze(self):
+        chunks = []
+        result = self.run_client(lambda c: c.analyze(b"image", "describe", "llava", on_chunk=chunks.append))
+        self.assertEqual(result.text, "A red car")
+        self.assertEqual(result.stats.eval_count, 3)
+        self.assertEqual(chunks, ["A ", "red ", "car", ""])
+        body = FakeOllamaHandler.requests_seen[0][1]
+        self.assertEqual(base64.b64decode(body["images"][0]), b"image")
+
+    def test_warm(self):
+        resp = self.run_client(lambda c: c.warm("llava"))
+        self.assertEqual(resp.done_reason, "load")
+        self.assertEqual(FakeOllamaHandler.requests_seen[0][1]["keep_alive"], "30m")
+
+    def test_stream_handles_long_lines(self):
+        FakeOllamaHandler.context = list(range(50000))
+
+        async def collect(client):
+            return [resp async for resp in client.stream(b"image", "describe", "llava")]
+
+        responses = self.run_client(collect)
+        self.assertEqual([r.response for r in responses], ["A ", "red ", "car", ""])
+        self.assertEqual(len(responses[-1].context), 50000)
+
+    def test_retries_and_concurrency(self):
+        FakeOllamaHandler.failures = [503]
+
+        async def many(client):
+            return await asyncio.gather(*(client.analyze(b"image", "p", "llava") for _ in range(5)))
+
+        results = self.run_client(many)
+        self.assertEqual([r.text for r in results], ["A red car"] * 5)
+        self.assertEqual(len(FakeOllamaHandler.requests_seen), 6)
+
+    def run_batch(self, count):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for i in range(count):
+                paths.append(os.path.join(tmpdir, f"{i}.jpg"))
+                with open(paths[-1], "wb") as f:
+                    f.write(b"image %d" % i)
+            client = AsyncOllamaClient(self.host)
+            return run_batch(paths, "describe", "llava", concurrency=2, decode_workers=1, client=client)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_run_batch(self):
+        report = self.run_batch(4)
+        self.assertEqual(report.succeeded, 4)
+        self.assertEqual({r.text for r in report.results}, {"A red car"})
+        sent = sorted(base64.b64decode(body["images"][0]) for _, body in FakeOllamaHandler.requests_seen)
+        self.assertEqual(sent, [b"image %d" % i for i in range(4)])
+
+    def test_stream_errors_fail_single_images(self):
+        FakeOllamaHandler.ending = "model runner has unexpectedly stopped"
+        report = self.run_batch(3)
+        self.assertEqual((report.succeeded, report.failed), (0, 3))
+        self.assertTrue(all("unexpectedly stopped" in r.error for r in report.results))
+
+
+    def test_vanished_files_fail_single_images(self):
+        async def vanished(client, image, prompt, model, **kwargs):
+            raise FileNotFoundError(2, "No such file or directory", image)
+
+        with mock.patch.object(AsyncOllamaClient, "analyze", vanished):
+            report = self.run_batch(2)
+        self.assertEqual((report.succeeded, report.failed), (0, 2))
+        self.assertTrue(all("Failed to read image" in r.error for r in report.results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+import requests
+from photo_analyzer.backends import BackendPool, NoBackendAvailable
+from photo_analyzer.client import CancelToken, GenerationCancelled
+from test_client import FakeOllamaHandler
+
+
+def start_server(models):
+    handler = type("Handler", (FakeOllamaHandler,), {"models": models, "requests_seen": [], "failures": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestBackendPool(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def make_pool(self, model_lists, dead=0, **kwargs):
+        hosts, handlers = [], []
+        for models in model_lists:
+            server, handler = start_server(models)
+            self.servers.append(server)
+            hosts.append(f"127.0.0.1:{server.server_port}")
+            handlers.append(handler)
+        hosts += [f"127.0.0.1:{unused_port()}" for _ in range(dead)]
+        return BackendPool(hosts, retries=0, connect_timeout=1, **kwargs), handlers
+
+    def test_least_outstanding_spreads_requests(self):
+        pool, handlers = self.make_pool([["llava:latest"], ["llava:latest"]])
+        with pool:
+            held = pool.acquire("llava")
+            pool.generate(b"img", "p", "llava")
+            pool.release(held, 0.0, failed=True)
+        self.assertEqual(len(handlers[0].requests_seen), 0)
+        self.assertEqual(len(handlers[1].requests_seen), 1)
+
+    def test_cancel_frees_backend_slot(self):
+        pool, handlers = self.make_pool([["llava:latest"]])
+        handlers[0].stall = threading.Event()
+        token = CancelToken()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                pool.generate(b"img", "p", "llava", on_chunk=lambda t: started.set(), cancel=token)
+            except GenerationCancelled as e:
+                errors.append(e)
+
+        with pool:
+            worker = threading.Thread(target=run)
+            worker.start()
+            self.assertTrue(started.wait(2))
+            backend = pool.backends[0]
+            self.assertEqual(backend.outstanding, 1)
+            token.cancel()
+            self.assertEqual(backend.outstanding, 0)
+            worker.join(2)
+            handlers[0].stall.set()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(backend.stats.cancelled, 1)
+        self.assertEqual(backend.stats.failed, 0)
+        self.assertTrue(backend.healthy)
+
+    def test_chat_prefers_conversation_host(self):
+        pool, handlers = self.make_pool([["llava:latest"], ["llava:latest"]])
+        with pool:
+            held = pool.acquire("llava", prefer_host=pool.backends[1].url)
+            self.assertIs(held, pool.backends[1])
+            # Sticks to the preferred server even though it is the busier one
+            result = pool.chat([{"role": "user", "content": "p"}], "llava", b"img", prefer_host=held.url)
+            pool.release(held, 0.0, failed=True)
+        self.assertEqual(result.host, pool.backends[1].url)
+        self.assertEqual(len(handlers[0].requests_seen), 0)
+        self.assertEqual(len(handlers[1].requests_seen), 1)
+
+    def test_routes_by_model_availability(self):
+        pool, handlers = self.make_pool([["llava:latest"], ["gemma3:latest"]])
+        with pool:
+            pool.check_health()
+            for _ in range(3):
+                pool.generate(b"img", "p", "gemma3")
+            with self.assertRaises(NoBackendAvailable):
+                pool.generate(b"img", "p", "bakllava")
+        self.assertEqual(len(handlers[0].requests_seen), 0)
+        self.assertEqual(len(handlers[1].requests_seen), 3)
+
+    def test_fails_over_from_dead_backend(self):
+        pool, handlers = self.make_pool([["llava:latest"]], dead=1)
+        with pool:
+            # Make the dead node look idle so it is picked first
+            pool.backends[0].outstanding = 5
+            result = pool.generate(b"img", "p", "llava")
+            pool.backends[0].outstanding = 0
+            self.assertEqual(result.text, "A red car")
+            dead = pool.backends[1]
+            self.assertFalse(dead.healthy)
+            self.assertEqual(dead.stats.failed, 1)
+            self.assertFalse(dead.check_health())
+            self.assertIn("down", pool.report())
+
+    def test_latency_strategy_prefers_fast_backend(self):
+        pool, _ = self.make_pool([["llava:latest"], ["llava:latest"]], strategy="latency")
+        with pool:
+            slow, fast = pool.backends
+            slow.stats.ewma_latency, fast.stats.ewma_latency = 10.0, 1.0
+            fast.outstanding = 3
+            self.assertIs(pool.acquire("llava"), fast)
+            fast.outstanding = 20
+            self.assertIs(pool.acquire("llava"), slow)
+
+    def test_warm_loads_model_on_every_backend(self):
+        pool, handlers = self.make_pool([["llava:latest"], ["llava:latest"], ["gemma3:latest"]])
+        with pool:
+            pool.check_health()
+            resp = pool.warm("llava")
+        self.assertEqual(resp.done_reason, "load")
+        self.assertEqual([len(h.requests_seen) for h in handlers], [1, 1, 0])
+
+    def test_all_backends_down(self):
+        pool, _ = self.make_pool([], dead=2)
+        with pool:
+            with self.assertRaises(requests.ConnectionError):
+                pool.generate(b"img", "p", "llava")
+
+
+if __name__ == "__main__":
+    unittest.main()
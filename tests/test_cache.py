@@ -0,0 +1,112 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from photo_analyzer import GenerationResult, OllamaResponse, analyze_image
+from photo_analyzer.cache import ResultCache, ThumbnailCache, cache_key
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmpdir, "results.sqlite3"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_key_depends_on_image_model_prompt_and_options(self):
+        base = cache_key(b"img", "llava", "caption")
+        self.assertEqual(base, cache_key(b"img", "llava", "caption", {}))
+        self.assertNotEqual(base, cache_key(b"img2", "llava", "caption"))
+        self.assertNotEqual(base, cache_key(b"img", "gemma3", "caption"))
+        self.assertNotEqual(base, cache_key(b"img", "llava", "evaluation"))
+        self.assertNotEqual(base, cache_key(b"img", "llava", "caption", {"temperature": 0}))
+
+    def test_round_trip_and_invalidate_by_model(self):
+        self.cache.put("a", "llava", "hello", {"eval_count": 5})
+        self.cache.put("b", "gemma3", "world")
+        self.assertEqual(self.cache.get("a"), ("hello", {"eval_count": 5}))
+        self.assertEqual(self.cache.get("b"), ("world", None))
+        self.assertEqual(self.cache.invalidate("llava"), 1)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_lru_eviction_by_size(self):
+        self.cache.max_bytes = 25
+        with mock.patch("photo_analyzer.cache.time.time", side_effect=[1, 2, 3, 4, 5]):
+            self.cache.put("a", "llava", "x" * 10)
+            self.cache.put("b", "llava", "y" * 10)
+            self.cache.get("a")
+            self.cache.put("c", "llava", "z" * 10)
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+        self.assertLessEqual(self.cache.total_bytes(), 25)
+
+    def test_analyze_image_uses_cache(self):
+        stats = OllamaResponse(model="llava", created_at="now", response="", done=True, eval_count=7)
+        fake = GenerationResult(text="a caption", stats=stats)
+        with mock.patch("photo_analyzer.photo_analyzer.generate", return_value=fake) as gen:
+            first = analyze_image(b"img", "caption", "llava", cache=self.cache)
+            second = analyze_image(b"img", "caption", "llava", cache=self.cache)
+        self.assertEqual(gen.call_count, 1)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.text, "a caption")
+        self.assertEqual(second.stats.eval_count, 7)
+
+    def test_incomplete_generations_are_not_cached(self):
+        truncated = GenerationResult(text="a capt")
+        with mock.patch("photo_analyzer.photo_analyzer.generate", return_value=truncated) as gen:
+            analyze_image(b"img", "caption", "llava", cache=self.cache)
+            second = analyze_image(b"img", "caption", "llava", cache=self.cache)
+        self.assertEqual(gen.call_count, 2)
+        self.assertFalse(second.cached)
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestThumbnailCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(os.path.join(self.tmpdir, "thumbnails"))
+        self.image = os.path.join(self.tmpdir, "a.jpg")
+        with open(self.image, "wb") as f:
+            f.write(b"jpeg")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip_and_invalidated_by_file_change(self):
+        self.assertIsNone(self.cache.get(self.image, (180, 260)))
+        self.cache.put(self.image, (180, 260), b"png")
+        self.assertEqual(self.cache.get(self.image, (180, 260)), b"png")
+        self.assertIsNone(self.cache.get(self.image, (90, 130)))
+        with open(self.image, "wb") as f:
+            f.write(b"edited jpeg")
+        self.assertIsNone(self.cache.get(self.image, (180, 260)))
+        self.assertIsNone(self.cache.get(os.path.join(self.tmpdir, "missing.jpg"), (180, 260)))
+
+    def test_lru_eviction_by_size(self):
+        self.cache.max_bytes = 25
+        images = []
+        for name in "abc":
+            path = os.path.join(self.tmpdir, f"{name}.jpg")
+            with open(path, "wb") as f:
+                f.write(name.encode())
+            images.append(path)
+        for i, image in enumerate(images[:2]):
+            self.cache.put(image, (180, 260), b"x" * 10)
+            os.utime(self.cache._file(image, (180, 260)), (i + 1, i + 1))
+        # Reading a thumbnail makes it the most recently used
+        self.cache.get(images[0], (180, 260))
+        self.cache.put(images[2], (180, 260), b"z" * 10)
+        self.assertIsNotNone(self.cache.get(images[0], (180, 260)))
+        self.assertIsNone(self.cache.get(images[1], (180, 260)))
+        self.assertIsNotNone(self.cache.get(images[2], (180, 260)))
+        self.assertLessEqual(self.cache.total_bytes(), 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
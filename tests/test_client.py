@@ -0,0 +1,277 @@
+import unittest
+import base64
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+from photo_analyzer.client import (
+    IMAGE_PLACEHOLDER,
+    CancelToken,
+    GenerateRequestBody,
+    GenerationCancelled,
+    GenerationTimeout,
+    OllamaClient,
+    OllamaStreamError,
+    StreamParser,
+)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Status codes to answer with before streaming a real response
+    failures = []
+    tokens = ["A ", "red ", "car"]
+    context = None
+    models = ["llava:latest"]
+    requests_seen = []
+    # When set to an Event, the stream stalls after the first token until it is set
+    stall = None
+    # Replaces the done record: an error message to send instead, or "" to end the stream without one
+    ending = None
+
+    def do_GET(self):
+        data = json.dumps({"models": [{"name": name} for name in self.models]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests_seen.append((self.client_address, body))
+        if self.failures:
+            self.send_response(self.failures.pop(0))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if body.get("stream") is False:
+            data = json.dumps({
+                "model": body["model"], "created_at": "now", "response": "", "done": True,
+                "done_reason": "load", "load_duration": 2_000_000_000,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path == "/api/chat":
+            lines = [
+                {"model": body["model"], "created_at": "now", "message": {"role": "assistant", "content": t},
+                 "done": False} for t in self.tokens
+            ]
+            lines.append({
+                "model": body["model"], "created_at": "now", "message": {"role": "assistant", "content": ""},
+                "done": True, "eval_count": len(self.tokens),
+            })
+        else:
+            lines = [
+                {"model": body["model"], "created_at": "now", "response": t, "done": False} for t in self.tokens
+            ]
+            lines.append({
+                "model": body["model"], "created_at": "now", "response": "", "done": True,
+                "eval_count": len(self.tokens), "context": self.context,
+            })
+        if self.ending is not None:
+            lines[-1:] = [{"error": self.ending}] if self.ending else []
+        encoded = [json.dumps(line).encode() + b"\n" for line in lines]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        if self.stall is None:
+            self.send_header("Content-Length", str(sum(map(len, encoded))))
+            self.end_headers()
+            self.wfile.write(b"".join(encoded))
+            return
+        # Chunked like the real server, so the first token arrives on its own
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, line in enumerate(encoded):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+                if i == 0:
+                    self.stall.wait(5)
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOllamaClient(unittest.TestCase):
+    def setUp(self):
+        FakeOllamaHandler.failures = []
+        FakeOllamaHandler.context = None
+        FakeOllamaHandler.requests_seen = []
+        FakeOllamaHandler.stall = None
+        FakeOllamaHandler.ending = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = OllamaClient(f"127.0.0.1:{self.server.server_port}", backoff=0)
+
+    def tearDown(self):
+        FakeOllamaHandler.ending = None
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_generate_streams_and_reuses_connection(self):
+        chunks = []
+        first = self.client.generate(b"image", "describe", "llava", on_chunk=chunks.append)
+        self.client.generate(b"image", "describe", "llava")
+        self.assertEqual(first.text, "A red car")
+        self.assertEqual(chunks, ["A ", "red ", "car", ""])
+        self.assertEqual(first.stats.eval_count, 3)
+        self.assertIsNotNone(first.first_token_seconds)
+        self.assertGreaterEqual(first.wall_seconds, first.first_token_seconds)
+        (addr1, body), (addr2, _) = FakeOllamaHandler.requests_seen
+        self.assertEqual(base64.b64decode(body["images"][0]), b"image")
+        self.assertEqual(addr1, addr2, "second request should reuse the pooled connection")
+
+    def test_retries_transient_errors(self):
+        FakeOllamaHandler.failures = [503, 502]
+        self.assertEqual(self.client.generate(b"image", "describe", "llava").text, "A red car")
+        self.assertEqual(len(FakeOllamaHandler.requests_seen), 3)
+
+    def test_gives_up_after_retries(self):
+        FakeOllamaHandler.failures = [503, 503, 503]
+        with self.assertRaises(requests.HTTPError):
+            self.client.generate(b"image", "describe", "llava")
+
+    def test_client_errors_are_not_retried(self):
+        FakeOllamaHandler.failures = [404]
+        with self.assertRaises(requests.HTTPError):
+            self.client.generate(b"image", "describe", "llava")
+        self.assertEqual(len(FakeOllamaHandler.requests_seen), 1)
+
+    def test_total_timeout(self):
+        self.client.total_timeout = 1
+        with mock.patch("photo_analyzer.client.time.monotonic", side_effect=[0, 0.5, 2, 3, 4]):
+            with self.assertRaises(GenerationTimeout):
+                self.client.generate(b"image", "describe", "llava")
+
+    def test_error_record_mid_stream_raises(self):
+        FakeOllamaHandler.ending = "model runner has unexpectedly stopped"
+        with self.assertRaisesRegex(OllamaStreamError, "unexpectedly stopped"):
+            self.client.generate(b"image", "describe", "llava")
+
+    def test_stream_without_done_record_raises(self):
+        FakeOllamaHandler.ending = ""
+        with self.assertRaisesRegex(OllamaStreamError, "before the done record"):
+            self.client.generate(b"image", "describe", "llava")
+
+    def test_keep_alive_and_warm(self):
+        self.client.keep_alive = "1h"
+        self.client.generate(b"image", "describe", "llava")
+        warm = self.client.warm("gemma3", keep_alive="-1")
+        self.assertEqual(warm.done_reason, "load")
+        self.assertEqual(warm.load_duration, 2_000_000_000)
+        (_, generate_body), (_, warm_body) = FakeOllamaHandler.requests_seen
+        self.assertEqual(generate_body["keep_alive"], "1h")
+        self.assertEqual(warm_body, {"model": "gemma3", "stream": False, "keep_alive": -1})
+
+    def test_chat_puts_image_in_message(self):
+        messages = [{"role": "user", "content": "describe", "images": [IMAGE_PLACEHOLDER]},
+                    {"role": "assistant", "content": "A red car"},
+                    {"role": "user", "content": "what colour?"}]
+        chunks = []
+        result = self.client.chat(messages, "llava", b"image", on_chunk=chunks.append)
+        self.assertEqual(result.text, "A red car")
+        self.assertEqual(chunks, ["A ", "red ", "car", ""])
+        self.assertEqual(result.stats.eval_count, 3)
+        self.assertEqual(result.host, self.client.base_url)
+        (_, body), = FakeOllamaHandler.requests_seen
+        self.assertNotIn("images", body)
+        self.assertEqual(base64.b64decode(body["messages"][0]["images"][0]), b"image")
+        self.assertEqual(body["messages"][2], {"role": "user", "content": "what colour?"})
+
+    def test_cancel_tears_down_stream(self):
+        FakeOllamaHandler.stall = threading.Event()
+        token = CancelToken()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                self.client.generate(b"image", "describe", "llava", on_chunk=lambda t: started.set(), cancel=token)
+            except GenerationCancelled as e:
+                errors.append(e)
+
+        worker = threading.Thread(target=run)
+        worker.start()
+        self.assertTrue(started.wait(2))
+        token.cancel()
+        worker.join(1)
+        stalled = worker.is_alive()
+        FakeOllamaHandler.stall.set()
+        worker.join()
+        self.assertFalse(stalled, "cancel should unblock the reading thread")
+        self.assertEqual(len(errors), 1)
+        # The torn-down connection is not reused; the next request still works
+        self.assertEqual(self.client.generate(b"image", "describe", "llava").text, "A red car")
+
+    def test_cancelled_token_skips_request(self):
+        token = CancelToken()
+        token.cancel()
+        with self.assertRaises(GenerationCancelled):
+            self.client.generate(b"image", "describe", "llava", cancel=token)
+        self.assertEqual(FakeOllamaHandler.requests_seen, [])
+
+    def test_base_url_from_environment(self):
+        with mock.patch.dict(os.environ, {"OLLAMA_HOST": "gpu-box:11434"}):
+            client = OllamaClient()
+        self.assertEqual(client.url("/api/generate"), "http://gpu-box:11434/api/generate")
+
+
+class TestStreamParser(unittest.TestCase):
+    def test_collects_text_and_keeps_final_stats(self):
+        parser = StreamParser()
+        lines = [json.dumps({"model": "llava", "created_at": "now", "response": t, "done": False}).encode()
+                 for t in ("A ", "red ", "car")]
+        lines.append(json.dumps({
+            "model": "llava", "created_at": "now", "response": "", "done": True,
+            "eval_count": 3, "context": [1, 2], "unknown_field": 1,
+        }).encode())
+        self.assertEqual([parser.feed(line) for line in lines], ["A ", "red ", "car", ""])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.text, "A red car")
+        self.assertEqual(parser.final.eval_count, 3)
+        self.assertEqual(parser.final.context, [1, 2])
+
+    def test_not_done_without_final_record(self):
+        parser = StreamParser()
+        parser.feed('{"model": "llava", "created_at": "now", "response": "A", "done": false}')
+        self.assertFalse(parser.done)
+        self.assertIsNone(parser.final)
+        self.assertEqual(parser.text, "A")
+
+
+class TestGenerateRequestBody(unittest.TestCase):
+    def test_body_is_the_json_document(self):
+        image = os.urandom(3 * 1000 + 2)
+        payload = {"model": "llava", "prompt": "Describe \"this\""}
+        expected = json.dumps(dict(payload, images=[base64.b64encode(image).decode()])).encode()
+        body = GenerateRequestBody(payload, image, chunk_size=300)
+        self.assertEqual(len(body), len(expected))
+        self.assertEqual(json.loads(b"".join(body)), json.loads(expected))
+        streamed = GenerateRequestBody(payload, memoryview(image), chunk_size=300)
+        parts = iter(lambda: streamed.read(1000), b"")
+        self.assertEqual(json.loads(b"".join(parts)), json.loads(expected))
+
+    def test_streams_from_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b"\x00\x01\x02" * 5000)
+        try:
+            body = GenerateRequestBody({"model": "llava"}, f.name, chunk_size=3 * 512)
+            data = body.read()
+            self.assertEqual(len(data), len(body))
+            self.assertEqual(base64.b64decode(json.loads(data)["images"][0]), b"\x00\x01\x02" * 5000)
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
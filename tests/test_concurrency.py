@@ -0,0 +1,164 @@
+import unittest
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import requests
+from photo_analyzer.client import CancelToken, GenerationCancelled, OllamaClient
+from photo_analyzer.concurrency import AIMDLimiter
+from photo_analyzer.metrics import MetricsCollector
+from test_client import FakeOllamaHandler
+
+
+def run_round(limiter, ttft=0.3, tokens_per_second=40.0, error=None):
+    """Start as many requests as the limit allows, then complete them all with the same sample."""
+    permits = [limiter.acquire() for _ in range(limiter.current)]
+    for permit in permits:
+        limiter.release(permit, ttft, tokens_per_second, error)
+    return len(permits)
+
+
+class TestAIMDLimiter(unittest.TestCase):
+    def test_grows_about_one_per_round_while_healthy(self):
+        limiter = AIMDLimiter(initial=1, max_limit=4)
+        self.assertEqual([run_round(limiter) for _ in range(5)], [1, 2, 3, 4, 4])
+        self.assertEqual(limiter.current, 4)
+        self.assertEqual([d.reason for d in limiter.decisions], ["increase"] * 3)
+
+    def test_does_not_grow_when_the_limit_is_not_used(self):
+        limiter = AIMDLimiter(initial=3)
+        for _ in range(10):
+            limiter.release(limiter.acquire(), 0.3, 40.0)
+        self.assertEqual(limiter.current, 3)
+
+    def test_backs_off_once_when_first_tokens_slow_down(self):
+        limiter = AIMDLimiter(initial=4, max_limit=4)
+        run_round(limiter, ttft=0.2)
+        self.assertEqual(limiter.current, 4)
+        # Requests queue on the server: every one of the round sees a slow first token
+        run_round(limiter, ttft=1.0)
+        self.assertEqual(limiter.current, 3)
+        self.assertEqual(limiter.counts["ttft"], 1)
+        run_round(limiter, ttft=0.2)
+        self.assertEqual(limiter.counts["ttft"], 1)
+
+    def test_stops_below_the_throughput_knee(self):
+        limiter = AIMDLimiter(initial=1, max_limit=8)
+        # A GPU with two generation slots: a third request only slows the others down
+        levels = []
+        for _ in range(12):
+            level = limiter.current
+            levels.append(level)
+            run_round(limiter, tokens_per_second=40.0 if level <= 2 else 80.0 / level)
+        # Probes one past the knee and comes back, as AIMD does
+        self.assertEqual(set(levels[4:]), {2, 3})
+        self.assertGreater(limiter.counts["throughput"], 1)
+        self.assertEqual(limiter.aggregate_throughput(2), 80.0)
+        self.assertIn("best 80.0 tok/s at 2 at once", limiter.summary())
+
+    def test_errors_halve_the_limit(self):
+        limiter = AIMDLimiter(initial=8)
+        permits = [limiter.acquire() for _ in range(8)]
+        limiter.release(permits[0], error="timeout")
+        self.assertEqual(limiter.current, 4)
+        # The rest of the round was already running: no further decrease
+        for permit in permits[1:]:
+            limiter.release(permit, error="error")
+        self.assertEqual(limiter.current, 4)
+        self.assertEqual(dict(limiter.counts), {"timeout": 1})
+        decision = limiter.decisions[-1]
+        self.assertEqual((decision.old_limit, decision.new_limit, decision.reason), (8, 4, "timeout"))
+
+    def test_abandoned_permits_are_not_observed(self):
+        limiter = AIMDLimiter(initial=2)
+        for _ in range(5):
+            for permit in [limiter.acquire() for _ in range(2)]:
+                limiter.abandon(permit)
+        self.assertEqual(limiter.current, 2)
+        self.assertEqual((limiter.in_flight, limiter.level_speed, limiter.baseline_ttft), (0, {}, None))
+        self.assertEqual(list(limiter.decisions), [])
+
+    def test_non_positive_first_token_samples_are_dropped(self):
+        limiter = AIMDLimiter(initial=2, max_limit=2)
+        run_round(limiter, ttft=0.0)
+        self.assertIsNone(limiter.baseline_ttft)
+        for _ in range(5):
+            run_round(limiter, ttft=0.3)
+        self.assertEqual(limiter.current, 2)
+        self.assertEqual(limiter.counts["ttft"], 0)
+
+    def test_acquire_waits_for_a_free_slot_and_can_be_cancelled(self):
+        limiter = AIMDLimiter(initial=1)
+        held = limiter.acquire()
+        token = CancelToken()
+        outcome = []
+
+        def wait():
+            try:
+                limiter.acquire(token)
+                outcome.append("acquired")
+            except GenerationCancelled:
+                outcome.append("cancelled")
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(outcome, [])
+        token.cancel()
+        thread.join(2)
+        self.assertEqual(outcome, ["cancelled"])
+        limiter.release(held)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_exports_limit_and_decisions(self):
+        limiter = AIMDLimiter(initial=1)
+        run_round(limiter)
+        collector = MetricsCollector()
+        limiter.export(collector, "http://gpu1:11434")
+        text = collector.render_prometheus()
+        self.assertIn('photo_analyzer_concurrency_limit{backend="http://gpu1:11434"} 2', text)
+        self.assertIn("# TYPE photo_analyzer_concurrency_decisions_total counter", text)
+        self.assertIn('photo_analyzer_concurrency_decisions_total{backend="http://gpu1:11434",reason="increase"} 1',
+                      text)
+
+
+class TestAdaptiveClient(unittest.TestCase):
+    def setUp(self):
+        FakeOllamaHandler.failures = []
+        FakeOllamaHandler.requests_seen = []
+        FakeOllamaHandler.stall = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = OllamaClient(f"127.0.0.1:{self.server.server_port}", backoff=0, retries=0, adaptive_limit=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_feed_the_limiter(self):
+        self.assertEqual(self.client.generate(b"image", "describe", "llava").text, "A red car")
+        limiter = self.client.limiter
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertIsNotNone(limiter.ttft_ewma)
+        FakeOllamaHandler.failures = [503]
+        with self.assertRaises(requests.HTTPError):
+            self.client.generate(b"image", "describe", "llava")
+        self.assertEqual(limiter.counts["error"], 1)
+        self.assertEqual(limiter.in_flight, 0)
+        # A missing model says nothing about load
+        FakeOllamaHandler.failures = [404]
+        with self.assertRaises(requests.HTTPError):
+            self.client.generate(b"image", "describe", "llava")
+        self.assertEqual(limiter.counts["error"], 1)
+
+    def test_cancelled_requests_are_not_observed(self):
+        token = CancelToken()
+        token.cancel()
+        with self.assertRaises(GenerationCancelled):
+            self.client.generate(b"image", "describe", "llava", cancel=token)
+        limiter = self.client.limiter
+        self.assertEqual((limiter.in_flight, limiter.baseline_ttft, limiter.level_speed), (0, None, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
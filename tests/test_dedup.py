@@ -0,0 +1,81 @@
+import unittest
+import io
+import os
+import random
+import tempfile
+from PIL import Image, ImageDraw
+from photo_analyzer.dedup import BKTree, dhash, find_duplicates, group_duplicates, hamming
+from photo_analyzer.photo_analyzer import ImageResult
+
+
+def scene(seed, size=(640, 480), shift=0):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(40, 240), rng.randrange(40, 240)
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle([x + shift, y, x + shift + w, y + h], fill=colour)
+    return img
+
+
+def encode(img, **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", **kwargs)
+    return buf.getvalue()
+
+
+class TestDhash(unittest.TestCase):
+    def test_near_identical_frames_hash_close(self):
+        base = dhash(encode(scene(1), quality=95))
+        self.assertLessEqual(hamming(base, dhash(encode(scene(1), quality=60))), 4)
+        self.assertLessEqual(hamming(base, dhash(encode(scene(1).resize((320, 240))))), 4)
+        self.assertLessEqual(hamming(base, dhash(encode(scene(1, shift=3)))), 6)
+        self.assertGreater(hamming(base, dhash(encode(scene(2)))), 16)
+
+
+class TestBKTree(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(0)
+        values = [rng.getrandbits(64) for _ in range(300)]
+        # Near copies so that some searches have hits
+        values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]
+        tree = BKTree()
+        for i, v in enumerate(values):
+            tree.add(v, i)
+        for query in values[:40]:
+            expected = sorted(i for i, v in enumerate(values) if hamming(query, v) <= 3)
+            self.assertEqual(sorted(tree.search(query, 3)), expected)
+
+    def test_group_duplicates_in_batch_order(self):
+        hashes = [("a", 0b0000), ("b", 0b0001), ("c", 0b1111_0000), ("d", 0b0011), ("e", 0b1111_0001)]
+        self.assertEqual(group_duplicates(hashes, threshold=1), {"a": ["b"], "c": ["e"], "d": []})
+
+
+class TestFindDuplicates(unittest.TestCase):
+    def test_groups_burst_and_keeps_unreadable_images(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, img in (("1.jpg", scene(1)), ("2.jpg", scene(1, shift=2)), ("3.jpg", scene(2))):
+                paths.append(os.path.join(tmp, name))
+                img.save(paths[-1], format="JPEG")
+            paths.append(os.path.join(tmp, "broken.jpg"))
+            with open(paths[-1], "wb") as f:
+                f.write(b"not a jpeg")
+            duplicates = find_duplicates(paths, workers=1)
+        self.assertEqual(duplicates.representatives, [paths[0], paths[2], paths[3]])
+        self.assertEqual(duplicates.duplicates_of(paths[0]), [paths[1]])
+        self.assertEqual(duplicates.inferences_saved, 1)
+        self.assertIn("1 saved", duplicates.summary())
+
+    def test_duplicate_result_copies_output_without_timings(self):
+        result = ImageResult(path="1.jpg", model="llava", text="A burst", decode_seconds=0.5, inference_seconds=3)
+        duplicate = result.as_duplicate("2.jpg")
+        self.assertEqual((duplicate.path, duplicate.text, duplicate.duplicate_of), ("2.jpg", "A burst", "1.jpg"))
+        self.assertEqual(duplicate.inference_seconds, 0)
+        self.assertEqual(duplicate.decode_seconds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
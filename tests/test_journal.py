@@ -0,0 +1,106 @@
+import unittest
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+import requests
+from photo_analyzer import GenerationResult, ImageResult, OllamaResponse
+from photo_analyzer.journal import BatchJournal, job_key
+from photo_analyzer.photo_analyzer import main, parse_shard, select_shard
+
+DONE = OllamaResponse(model="llava", created_at="now", response="", done=True)
+
+
+class TestBatchJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "journal.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan_skips_done_and_caps_retries(self):
+        with BatchJournal(self.path, job_key(model="llava"), max_attempts=2) as journal:
+            journal.record(ImageResult(path="a.jpg", text="done", stats=DONE))
+            journal.record(ImageResult(path="b.jpg", error="Request failed"))
+            journal.record(ImageResult(path="c.jpg", error="Request failed"))
+            journal.record(ImageResult(path="c.jpg", error="Request failed"))
+            # No done record: the reply may have been cut short
+            journal.record(ImageResult(path="e.jpg", text="trunc"))
+        with BatchJournal(self.path, job_key(model="llava"), max_attempts=2) as journal:
+            plan = journal.plan(["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"])
+            self.assertEqual(plan.done, ["a.jpg"])
+            self.assertEqual(plan.todo, ["b.jpg", "d.jpg", "e.jpg"])
+            self.assertEqual(plan.exhausted, ["c.jpg"])
+            self.assertEqual(plan.retries, 2)
+            self.assertEqual([r["text"] for r in journal.results(plan.done)], ["done"])
+
+    def test_other_configuration_is_a_separate_job(self):
+        with BatchJournal(self.path, job_key(model="llava")) as journal:
+            journal.record(ImageResult(path="a.jpg", text="done", stats=DONE))
+        with BatchJournal(self.path, job_key(model="gemma3")) as journal:
+            self.assertEqual(journal.plan(["a.jpg"]).todo, ["a.jpg"])
+
+
+class TestResumableBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.images = os.path.join(self.tmpdir, "images")
+        os.makedirs(self.images)
+        for name in ("a.jpg", "b.jpg", "c.jpg"):
+            with open(os.path.join(self.images, name), "wb") as f:
+                f.write(name.encode())
+        self.output = os.path.join(self.tmpdir, "out.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_batch(self, fake_generate):
+        argv = [self.images, "--journal", os.path.join(self.tmpdir, "journal.sqlite3"), "--output", self.output,
+                "--no-cache", "--no-preprocess", "--no-warm", "--workers", "1", "--in-flight", "1"]
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate) as gen, \
+                mock.patch("sys.stderr"):
+            code = main(argv)
+        with open(self.output, encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+        return code, [os.path.basename(call.args[0]) for call in gen.call_args_list], results
+
+    def test_rerun_only_processes_what_is_left(self):
+        def flaky(image, prompt, model, **kwargs):
+            if image.endswith("b.jpg"):
+                raise requests.ConnectionError("Ollama went away")
+            return GenerationResult(text="ok", stats=DONE)
+
+        code, sent, _ = self.run_batch(flaky)
+        self.assertEqual(code, 1)
+        self.assertEqual(sorted(sent), ["a.jpg", "b.jpg", "c.jpg"])
+
+        code, sent, results = self.run_batch(
+            lambda image, prompt, model, **kwargs: GenerationResult(text="ok", stats=DONE))
+        self.assertEqual(code, 0)
+        self.assertEqual(sent, ["b.jpg"])
+        self.assertEqual(sorted(os.path.basename(r["path"]) for r in results), ["a.jpg", "b.jpg", "c.jpg"])
+        self.assertTrue(all(r["text"] == "ok" for r in results))
+
+
+class TestShards(unittest.TestCase):
+    def test_shards_partition_the_batch(self):
+        paths = [os.path.join("/photos", f"IMG_{i:04d}.jpg") for i in range(200)]
+        shards = [select_shard(paths, i, 3, root="/photos") for i in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), paths)
+        self.assertTrue(all(shards))
+        # The split depends on the relative path, not on where the folder is mounted
+        moved = [p.replace("/photos", "/mnt/nas/photos") for p in paths]
+        self.assertEqual(len(select_shard(moved, 1, 3, root="/mnt/nas/photos")), len(shards[1]))
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (1, 4))
+        for bad in ("0/4", "5/4", "1", "a/b", "1/2/3"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(bad)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import os
+import subprocess
+import sys
+from photo_analyzer.lazy import lazy_import
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_missing_module_is_none(self):
+        self.assertIsNone(lazy_import("photo_analyzer_no_such_module"))
+        self.assertIsNone(lazy_import("photo_analyzer_no_such_package.module"))
+
+    def test_module_runs_on_first_attribute_access(self):
+        sys.modules.pop("colorsys", None)
+        module = lazy_import("colorsys")
+        self.assertEqual(type(module).__name__, "_LazyModule")
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertEqual(type(module).__name__, "module")
+        self.assertIs(lazy_import("colorsys"), module)
+
+    def test_core_import_skips_heavy_dependencies(self):
+        # Modules handed out by lazy_import stay _LazyModule instances until something uses them
+        code = (
+            "import sys, photo_analyzer.photo_analyzer\n"
+            "heavy = ('tkinter', 'requests', 'PIL.Image', 'rawpy', 'imageio', 'numpy', 'multiprocessing')\n"
+            "print(' '.join(name for name in heavy\n"
+            "               if name in sys.modules and type(sys.modules[name]).__name__ != '_LazyModule'))\n"
+        )
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        loaded = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(loaded.stdout.strip(), "")
+
+    def test_cli_module_runs_once(self):
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        run = subprocess.run([sys.executable, "-W", "error::RuntimeWarning", "-m", "photo_analyzer.photo_analyzer",
+                              "--help"], env=env, capture_output=True, text=True)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stderr, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import json
+import os
+import tempfile
+from photo_analyzer.client import OllamaResponse
+from photo_analyzer.metrics import GenerationMetrics, MetricsCollector, quantile
+from photo_analyzer.photo_analyzer import ImageResult
+
+
+def final_stats():
+    return OllamaResponse(
+        model="llava", created_at="now", response="", done=True,
+        total_duration=3 * 10 ** 9, load_duration=5 * 10 ** 8,
+        prompt_eval_count=600, prompt_eval_duration=5 * 10 ** 8,
+        eval_count=100, eval_duration=2 * 10 ** 9,
+    )
+
+
+class TestGenerationMetrics(unittest.TestCase):
+    def test_derived_rates_and_network_time(self):
+        metrics = GenerationMetrics.from_stats(
+            "llava", final_stats(), wall_seconds=3.5, ttft_seconds=1.2, encode_seconds=0.1
+        )
+        self.assertEqual(metrics.tokens_per_second, 50)
+        self.assertEqual(metrics.prompt_tokens_per_second, 1200)
+        self.assertAlmostEqual(metrics.network_seconds, 0.4)
+        data = json.loads(metrics.to_json())
+        self.assertEqual(data["eval_count"], 100)
+        self.assertEqual(data["ttft_seconds"], 1.2)
+        self.assertIn("50.0 tok/s, time to first token 1.20s", metrics.summary())
+
+    def test_image_result_metrics(self):
+        result = ImageResult(path="a.jpg", model="llava", stats=final_stats(), decode_seconds=0.3,
+                             ttft_seconds=0.9, request_seconds=3.2)
+        metrics = result.metrics()
+        self.assertEqual(metrics.model, "llava")
+        self.assertEqual(metrics.decode_seconds, 0.3)
+        self.assertAlmostEqual(metrics.network_seconds, 0.2)
+
+    def test_cached_results_have_no_model_time(self):
+        metrics = GenerationMetrics.from_stats("llava", final_stats(), cached=True, wall_seconds=0)
+        self.assertEqual(metrics.network_seconds, 0)
+        self.assertEqual(metrics.summary(), "Cached result (no model time)")
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def test_prometheus_text(self):
+        collector = MetricsCollector()
+        for ttft in (1.0, 2.0, 3.0):
+            collector.observe(GenerationMetrics.from_stats("llava", final_stats(), ttft_seconds=ttft))
+        collector.observe(GenerationMetrics(model="llava", cached=True))
+        collector.observe(GenerationMetrics(model="llava"), status="error")
+        collector.set_gauge("batch_wall_seconds", 12.5, "Wall time of the last batch.")
+        text = collector.render_prometheus()
+        self.assertIn('photo_analyzer_requests_total{model="llava",status="ok"} 3', text)
+        self.assertIn('photo_analyzer_requests_total{model="llava",status="cached"} 1', text)
+        self.assertIn('photo_analyzer_requests_total{model="llava",status="error"} 1', text)
+        self.assertIn('photo_analyzer_eval_count_total{model="llava"} 300', text)
+        self.assertIn('photo_analyzer_time_to_first_token_seconds{model="llava",quantile="0.5"} 2', text)
+        self.assertIn('photo_analyzer_time_to_first_token_seconds_count{model="llava"} 3', text)
+        self.assertIn("# TYPE photo_analyzer_batch_wall_seconds gauge\nphoto_analyzer_batch_wall_seconds 12.5", text)
+
+    def test_summary_from_observations_kept_elsewhere(self):
+        collector = MetricsCollector()
+        collector.set_summary("watch_latency_seconds", [1.0, 2.0, 4.0], "Landing to result.")
+        text = collector.render_prometheus()
+        self.assertIn("# TYPE photo_analyzer_watch_latency_seconds summary", text)
+        self.assertIn('photo_analyzer_watch_latency_seconds{quantile="0.5"} 2', text)
+        self.assertIn("photo_analyzer_watch_latency_seconds_sum 7", text)
+        self.assertIn("photo_analyzer_watch_latency_seconds_count 3", text)
+
+    def test_write_prometheus_replaces_file(self):
+        collector = MetricsCollector()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "photo_analyzer.prom")
+            collector.write_prometheus(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("# TYPE photo_analyzer_requests_total counter", f.read())
+            self.assertEqual(os.listdir(tmp), ["photo_analyzer.prom"])
+
+    def test_quantile(self):
+        self.assertEqual(quantile([], 0.5), 0.0)
+        self.assertEqual(quantile([3, 1, 2], 0.5), 2)
+        self.assertEqual(quantile([3, 1, 2], 0.99), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,17 @@
 import unittest
 import base64
+import io
 import os
-from photo_analyzer import load_image_as_base64, OllamaResponse
+import shutil
+import tempfile
+from unittest import mock
+import pytest
+from photo_analyzer import load_image_as_base64, OllamaResponse, GenerationResult, find_images, analyze_directory
+from photo_analyzer import BatchReport, ImageResult
+from photo_analyzer.photo_analyzer import PreprocessOptions, load_image, preprocess_image, read_image_bytes
+from photo_analyzer.photo_analyzer import COMBINED_SCHEMA, parse_structured, request_options, resolve_prompt
+from photo_analyzer.photo_analyzer import Conversation
+
 
 class TestPhotoAnalyzer(unittest.TestCase):
     def setUp(self):
@@ -44,5 +54,237 @@ class TestPhotoAnalyzer(unittest.TestCase):
         self.assertTrue(resp.done)
         self.assertEqual(resp.response, "test")
 
+
+class TestPreprocess(unittest.TestCase):
+    def setUp(self):
+        self.Image = pytest.importorskip("PIL.Image")
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "big.jpg")
+        exif = self.Image.Exif()
+        exif[0x010F] = "TestCamera"
+        self.Image.new("RGB", (2000, 1000), (200, 40, 40)).save(self.path, quality=95, exif=exif)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resizes_and_strips_metadata(self):
+        loaded = load_image(self.path, PreprocessOptions(max_edge=500, quality=70))
+        with self.Image.open(io.BytesIO(loaded.data)) as img:
+            self.assertEqual(img.size, (500, 250))
+            self.assertNotIn("exif", img.info)
+        self.assertLess(len(loaded.data), loaded.source_bytes)
+        self.assertEqual(loaded.payload_bytes, len(base64.b64encode(loaded.data)))
+
+    def test_webp_and_model_defaults(self):
+        options = PreprocessOptions.for_model("llava:13b", image_format="WEBP")
+        self.assertEqual(options.max_edge, 672)
+        with open(self.path, "rb") as f:
+            data = preprocess_image(f.read(), options)
+        with self.Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.format, "WEBP")
+            self.assertEqual(max(img.size), 672)
+
+    def test_no_preprocess_keeps_original_bytes(self):
+        with open(self.path, "rb") as f:
+            self.assertEqual(load_image(self.path).data, f.read())
+
+
+class TestRawDecodeModes(unittest.TestCase):
+    def setUp(self):
+        self.numpy = pytest.importorskip("numpy")
+        self.rawpy = pytest.importorskip("rawpy")
+        pytest.importorskip("imageio")
+
+    def fake_raw(self, thumb):
+        raw = mock.MagicMock()
+        raw.__enter__.return_value = raw
+        raw.postprocess.return_value = self.numpy.zeros((4, 6, 3), dtype=self.numpy.uint8)
+        if isinstance(thumb, Exception):
+            raw.extract_thumb.side_effect = thumb
+        else:
+            raw.extract_thumb.return_value = thumb
+        return raw
+
+    def test_preview_uses_embedded_jpeg(self):
+        thumb = mock.Mock(format=self.rawpy.ThumbFormat.JPEG, data=b"embedded-jpeg")
+        raw = self.fake_raw(thumb)
+        with mock.patch("rawpy.imread", return_value=raw):
+            self.assertEqual(read_image_bytes("shot.CR3"), b"embedded-jpeg")
+        raw.postprocess.assert_not_called()
+
+    def test_preview_falls_back_to_half_size(self):
+        raw = self.fake_raw(self.rawpy.LibRawNoThumbnailError())
+        with mock.patch("rawpy.imread", return_value=raw):
+            data = read_image_bytes("shot.cr3")
+        self.assertTrue(data.startswith(b"\xff\xd8"))
+        self.assertTrue(raw.postprocess.call_args.kwargs["half_size"])
+
+    def test_full_mode_demosaics(self):
+        raw = self.fake_raw(None)
+        with mock.patch("rawpy.imread", return_value=raw):
+            read_image_bytes("shot.cr3", raw_mode="full")
+        raw.extract_thumb.assert_not_called()
+        raw.postprocess.assert_called_once_with()
+
+
+class TestConversation(unittest.TestCase):
+    def stats(self, prompt_tokens, eval_tokens, prompt_seconds=1.0):
+        return OllamaResponse(model="llava", created_at="now", response="", done=True,
+                              prompt_eval_count=prompt_tokens, prompt_eval_duration=int(prompt_seconds * 1e9),
+                              eval_count=eval_tokens)
+
+    def test_follow_up_reuses_history(self):
+        client = mock.Mock()
+        client.chat.return_value = GenerationResult(text="Blue.", stats=self.stats(12, 3, 0.01), host="http://b")
+        conversation = Conversation(client, "llava", b"image")
+        conversation.add_turn("describe", GenerationResult(text="A car", stats=self.stats(600, 100, 1.2),
+                                                           host="http://a"))
+        conversation.ask("what colour?")
+
+        messages, model, image = client.chat.call_args.args
+        self.assertEqual(model, "llava")
+        self.assertEqual(image, b"image")
+        self.assertEqual([m["content"] for m in messages], ["describe", "A car", "what colour?"])
+        self.assertIn("images", messages[0])
+        self.assertNotIn("images", messages[2])
+        self.assertEqual(client.chat.call_args.kwargs["prefer_host"], "http://a")
+        self.assertEqual(len(conversation.messages), 4)
+
+        savings = conversation.savings()
+        self.assertEqual(savings.prompt_tokens, 12)
+        self.assertEqual(savings.reused_tokens, 700)
+        self.assertAlmostEqual(savings.saved_seconds, 1.4)
+
+    def test_no_savings_when_server_re_evaluates(self):
+        client = mock.Mock()
+        client.chat.return_value = GenerationResult(text="Blue.", stats=self.stats(712, 3))
+        conversation = Conversation(client, "llava", b"image")
+        self.assertIsNone(conversation.savings())
+        conversation.add_turn("describe", GenerationResult(text="A car", stats=self.stats(600, 100)))
+        conversation.ask("what colour?")
+        self.assertEqual(conversation.savings().reused_tokens, 0)
+
+
+class TestBatchAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, "sub"))
+        for name in ("b.jpg", "a.PNG", "notes.txt", os.path.join("sub", "c.webp")):
+            with open(os.path.join(self.tmpdir, name), "wb") as f:
+                f.write(name.encode())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_images(self):
+        names = [os.path.relpath(p, self.tmpdir) for p in find_images(self.tmpdir)]
+        self.assertEqual(names, ["a.PNG", "b.jpg", os.path.join("sub", "c.webp")])
+        self.assertEqual(len(find_images(self.tmpdir, recursive=False)), 2)
+
+    def test_analyze_directory(self):
+        def fake_generate(image, prompt, model, **kwargs):
+            # Unconverted images are streamed from disk, so the request gets the path
+            with open(image, "rb") as f:
+                return GenerationResult(text=f.read().decode() + "|" + model)
+
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_directory(self.tmpdir, "describe", "llava", decode_workers=2, in_flight=2)
+
+        self.assertEqual(report.succeeded, 3)
+        self.assertEqual(report.failed, 0)
+        texts = sorted(r.text for r in report.results)
+        self.assertEqual(texts, ["a.PNG|llava", "b.jpg|llava", os.path.join("sub", "c.webp") + "|llava"])
+        self.assertGreater(report.images_per_second, 0)
+        self.assertIn("images/sec", report.summary())
+
+    def test_malformed_response_fails_only_that_image(self):
+        def fake_generate(image, prompt, model, **kwargs):
+            if image.endswith("b.jpg"):
+                raise ValueError("unexpected character: line 1 column 1")
+            return GenerationResult(text="ok")
+
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_directory(self.tmpdir, "describe", "llava", decode_workers=1, in_flight=2)
+
+        self.assertEqual((report.succeeded, report.failed), (2, 1))
+        failed, = [r for r in report.results if not r.ok]
+        self.assertTrue(failed.path.endswith("b.jpg"))
+        self.assertIn("unexpected character", failed.error)
+
+    def test_vanished_file_fails_only_that_image(self):
+        def fake_generate(image, prompt, model, **kwargs):
+            if image.endswith("b.jpg"):
+                os.remove(image)
+            with open(image, "rb") as f:
+                return GenerationResult(text=f.read().decode())
+
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_directory(self.tmpdir, "describe", "llava", decode_workers=1, in_flight=2)
+
+        self.assertEqual((report.succeeded, report.failed), (2, 1))
+        failed, = [r for r in report.results if not r.ok]
+        self.assertTrue(failed.path.endswith("b.jpg"))
+        self.assertIn("Failed to read image", failed.error)
+
+    def test_unexpected_errors_fail_only_that_image(self):
+        def fake_generate(image, prompt, model, **kwargs):
+            if image.endswith("b.jpg"):
+                raise RuntimeError("boom")
+            return GenerationResult(text="ok")
+
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_directory(self.tmpdir, "describe", "llava", decode_workers=1, in_flight=2)
+
+        self.assertEqual((report.succeeded, report.failed), (2, 1))
+        failed, = [r for r in report.results if not r.ok]
+        self.assertIn("boom", failed.error)
+
+    def test_owned_client_closed_when_batch_aborts(self):
+        def stop(result):
+            raise KeyboardInterrupt
+
+        with mock.patch("photo_analyzer.client.OllamaClient") as client_cls, \
+                mock.patch("photo_analyzer.photo_analyzer.generate", return_value=GenerationResult(text="ok")):
+            with self.assertRaises(KeyboardInterrupt):
+                analyze_directory(self.tmpdir, "describe", "llava", decode_workers=1, in_flight=1, on_result=stop)
+
+        client_cls.return_value.close.assert_called_once_with()
+
+    def test_combined_mode_single_request(self):
+        calls = []
+
+        def fake_generate(image, prompt, model, **kwargs):
+            calls.append(kwargs)
+            return GenerationResult(text='{"caption": "Neon nights #city", "evaluation": "Strong leading lines."}')
+
+        options = request_options("both")
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_directory(self.tmpdir, resolve_prompt("", "both"), "llava", recursive=False,
+                                       decode_workers=1, in_flight=1, options=options)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0]["format"], COMBINED_SCHEMA)
+        outputs = report.results[0].outputs
+        self.assertEqual(outputs, {"caption": "Neon nights #city", "evaluation": "Strong leading lines."})
+        self.assertEqual(report.results[0].to_dict()["outputs"]["caption"], "Neon nights #city")
+
+    def test_parse_structured(self):
+        self.assertEqual(parse_structured('{"caption": "a", "score": 7}'), {"caption": "a", "score": "7"})
+        self.assertIsNone(parse_structured("not json"))
+        self.assertIsNone(parse_structured("[1, 2]"))
+        self.assertEqual(request_options("caption"), {})
+
+    def test_summary_reports_cold_starts(self):
+        def stats(load):
+            return OllamaResponse(model="llava", created_at="now", response="", done=True, load_duration=load,
+                                  prompt_eval_duration=10 ** 8, eval_duration=10 ** 9)
+
+        report = BatchReport(results=[
+            ImageResult(path="a.jpg", stats=stats(3 * 10 ** 9)),
+            ImageResult(path="b.jpg", stats=stats(10 ** 7)),
+        ], wall_seconds=5)
+        self.assertIn("model      load 3.01s (1 cold start(s)), prompt eval 0.20s, eval 2.00s", report.summary())
+
+
 if __name__ == "__main__":
     unittest.main()
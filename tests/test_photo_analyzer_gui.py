@@ -15,5 +15,17 @@ class TestPhotoAnalyzerGUI(unittest.TestCase):
         t.join(timeout=2)
         self.assertFalse(t.is_alive(), "GUI did not close as expected")
 
+    def test_text_stream_coalesces_chunks(self):
+        from src.photo_analyzer.photo_analyzer_gui import TextStream
+        stream = TextStream()
+        threads = [threading.Thread(target=lambda: [stream.put("ab") for _ in range(100)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stream.put("")
+        self.assertEqual(stream.drain(), "ab" * 400)
+        self.assertEqual(stream.drain(), "")
+
 if __name__ == "__main__":
     unittest.main()
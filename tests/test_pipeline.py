@@ -0,0 +1,112 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+import pytest
+from photo_analyzer import GenerationResult
+from photo_analyzer.photo_analyzer import PreprocessOptions, analyze_paths, main
+from photo_analyzer.metrics import MetricsCollector
+from photo_analyzer.pipeline import ByteBudget, Pipeline
+
+
+class TestByteBudget(unittest.TestCase):
+    def test_acquire_waits_for_room(self):
+        budget = ByteBudget(100)
+        budget.acquire(60)
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (budget.acquire(60), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        budget.adjust(60, 30)
+        self.assertTrue(acquired.wait(2))
+        thread.join()
+        self.assertEqual((budget.used, budget.peak, budget.waits), (90, 90, 1))
+
+    def test_item_larger_than_the_budget_goes_alone(self):
+        budget = ByteBudget(100)
+        budget.acquire(500)
+        self.assertEqual(budget.used, 500)
+
+
+    def test_summary_reports_the_budget_as_given(self):
+        budget = ByteBudget(512 * 1024 * 1024)
+        budget.acquire(3 * 1024 * 1024)
+        self.assertIn("peak 3.0 MB of images held, budget 512 MB", budget.summary())
+
+class TestPipeline(unittest.TestCase):
+    def test_slow_stage_holds_back_the_others(self):
+        pipeline = Pipeline(budget_bytes=10 ** 6)
+        done = []
+        sink = pipeline.sink("persist", 2)
+        slow = pipeline.stage("slow", 1, 2, lambda n: (time.sleep(0.02), n)[1], sink)
+        fast = pipeline.stage("fast", 2, 2, lambda n: n * 10, slow)
+        pipeline.source("scan", range(20), fast)
+        pipeline.drain(sink, done.append)
+
+        self.assertEqual(sorted(done), [n * 10 for n in range(20)])
+        self.assertEqual([s.name for s in pipeline.stages], ["scan", "fast", "slow", "persist"])
+        stats = {s.name: s for s in pipeline.stages}
+        self.assertEqual(stats["slow"].max_depth, 2)
+        self.assertGreater(stats["fast"].blocked_seconds, 0.1)
+        self.assertEqual(pipeline.bottleneck().name, "slow")
+        self.assertIn("bottleneck slow", pipeline.summary())
+        collector = MetricsCollector()
+        pipeline.export(collector)
+        self.assertIn('photo_analyzer_stage_utilization{stage="slow"}', collector.render_prometheus())
+
+    def test_stage_errors_reach_the_caller(self):
+        pipeline = Pipeline(budget_bytes=10 ** 6)
+        sink = pipeline.sink("persist", 1)
+        broken = pipeline.stage("broken", 2, 1, lambda n: 1 / (n - 3), sink)
+        pipeline.source("scan", range(100), broken)
+        with self.assertRaises(ZeroDivisionError):
+            pipeline.drain(sink, lambda item: None)
+
+
+class TestBatchMemoryBudget(unittest.TestCase):
+    def setUp(self):
+        Image = pytest.importorskip("PIL.Image")
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(6):
+            path = os.path.join(self.tmpdir, f"{i}.png")
+            # Noise: the PNG is larger than the JPEG it is re-encoded to, like a photo
+            Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_decoded_images_stay_within_the_budget(self):
+        held = []
+        budget = 2 * max(os.path.getsize(path) for path in self.paths)
+        pipeline = Pipeline(budget_bytes=budget)
+
+        def fake_generate(image, prompt, model, **kwargs):
+            held.append(pipeline.budget.used)
+            time.sleep(0.05)
+            return GenerationResult(text="ok")
+
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate):
+            report = analyze_paths(self.paths, "describe", "llava", decode_workers=2, in_flight=4,
+                                   preprocess=PreprocessOptions(max_edge=64), pipeline=pipeline)
+
+        self.assertEqual(report.succeeded, 6)
+        self.assertIs(report.pipeline, pipeline)
+        # Four request slots, but decoded images waiting for them never exceed the budget
+        self.assertLessEqual(max(held), budget)
+        self.assertEqual(pipeline.budget.used, 0)
+        self.assertGreater(pipeline.budget.waits, 0)
+        self.assertIn("stage infer", report.summary())
+
+    def test_budget_is_rejected_with_async(self):
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit) as exit_:
+            main([self.tmpdir, "--async", "--memory-budget", "64"])
+        self.assertEqual(exit_.exception.code, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
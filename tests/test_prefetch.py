@@ -0,0 +1,94 @@
+import unittest
+import io
+import os
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+from PIL import Image
+from photo_analyzer.cache import ThumbnailCache
+from photo_analyzer.photo_analyzer import PreprocessOptions
+from photo_analyzer.prefetch import THUMBNAIL_SIZE, Prefetcher, prefetch_image
+
+
+class FakeExecutor:
+    """Records submissions and leaves them pending until the test resolves them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, path, *args):
+        future = Future()
+        self.submitted.append((path, future))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(6):
+            path = os.path.join(self.tmp.name, f"{i}.jpg")
+            Image.new("RGB", (1200, 800), (i * 40, 0, 0)).save(path, format="JPEG")
+            self.paths.append(path)
+        self.size = os.path.getsize(self.paths[0])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_prefetch_image_preprocesses_and_thumbnails(self):
+        image = prefetch_image(self.paths[0], PreprocessOptions(max_edge=600))
+        with Image.open(io.BytesIO(image.payload)) as img:
+            self.assertEqual(img.size, (600, 400))
+        with Image.open(io.BytesIO(image.thumbnail)) as thumb:
+            self.assertLessEqual(thumb.size[0], THUMBNAIL_SIZE[0])
+            self.assertLessEqual(thumb.size[1], THUMBNAIL_SIZE[1])
+        self.assertEqual(image.nbytes, len(image.payload) + len(image.thumbnail))
+
+    def test_thumbnail_comes_from_cache_the_second_time(self):
+        cache = ThumbnailCache(os.path.join(self.tmp.name, "thumbnails"))
+        first = prefetch_image(self.paths[0], thumbnail_cache=cache)
+        with mock.patch("photo_analyzer.prefetch.make_thumbnail") as make:
+            second = prefetch_image(self.paths[0], thumbnail_cache=cache)
+        make.assert_not_called()
+        self.assertEqual(second.thumbnail, first.thumbnail)
+        self.assertEqual(len(cache), 1)
+
+    def test_loads_in_worker_processes(self):
+        prefetcher = Prefetcher(workers=1)
+        try:
+            prefetcher.prefetch(self.paths, 0)
+            image = prefetcher.get(self.paths[0]).result(timeout=30)
+        finally:
+            prefetcher.close()
+        self.assertEqual(image.path, self.paths[0])
+        with open(self.paths[0], "rb") as f:
+            self.assertEqual(image.payload, f.read())
+
+    def test_window_nearest_first_within_budget(self):
+        executor = FakeExecutor()
+        prefetcher = Prefetcher(budget_bytes=int(self.size * 3.5), ahead=4, behind=1, executor=executor)
+        prefetcher.prefetch(self.paths, 2)
+        self.assertEqual([p for p, _ in executor.submitted], self.paths[2:5])
+
+        # Moving on drops images that left the window and frees budget for new ones
+        prefetcher.prefetch(self.paths, 4)
+        cancelled = [p for p, f in executor.submitted if f.cancelled()]
+        self.assertEqual(cancelled, [self.paths[2]])
+        self.assertEqual([p for p, _ in executor.submitted[3:]], [self.paths[5]])
+
+    def test_current_image_ignores_budget_and_get_reuses_future(self):
+        executor = FakeExecutor()
+        prefetcher = Prefetcher(budget_bytes=1, executor=executor)
+        prefetcher.prefetch(self.paths, 0)
+        self.assertEqual(len(executor.submitted), 1)
+        self.assertIs(prefetcher.get(self.paths[0]), executor.submitted[0][1])
+        # A different preprocessing is a different image
+        prefetcher.get(self.paths[0], PreprocessOptions(max_edge=600))
+        self.assertEqual(len(executor.submitted), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
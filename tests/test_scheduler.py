@@ -0,0 +1,138 @@
+import unittest
+import threading
+import time
+from photo_analyzer.backends import BackendPool
+from photo_analyzer.client import CancelToken, GenerationCancelled
+from photo_analyzer.protocol import GenerationResult, OllamaResponse
+from photo_analyzer.scheduler import PRIORITY_INTERACTIVE, ModelScheduler
+from test_backends import start_server, unused_port
+
+
+class FakeClient:
+    """Stands in for an OllamaClient on a server that keeps one model loaded; loading takes 2 s."""
+
+    base_url = "http://fake:11434"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.order = []
+        self.loaded = None
+        self._lock = threading.Lock()
+
+    def generate(self, image, prompt, model, on_chunk=None, cancel=None, prefer_host=None, **extra):
+        with self._lock:
+            self.order.append(model)
+            load = 2 * 10 ** 9 if model != self.loaded else 0
+            self.loaded = model
+        self.release.wait(5)
+        stats = OllamaResponse(model=model, created_at="now", response="", done=True, load_duration=load)
+        return GenerationResult(text=prompt, stats=stats, host=self.base_url)
+
+    def close(self):
+        pass
+
+
+class TestModelScheduler(unittest.TestCase):
+    def run_queued(self, scheduler, client, requests):
+        """Start the first request, queue the rest behind it, then let them all run."""
+        threads = []
+        for i, (model, view) in enumerate(requests):
+            thread = threading.Thread(target=view.generate, args=(b"img", str(i), model))
+            thread.start()
+            threads.append(thread)
+            deadline = time.monotonic() + 2
+            while len(client.order) + len(scheduler._pending) <= i and time.monotonic() < deadline:
+                time.sleep(0.001)
+        client.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    def test_groups_requests_by_model(self):
+        client = FakeClient()
+        scheduler = ModelScheduler(client, slots=1, max_loaded_models=1)
+        self.run_queued(scheduler, client, [(model, scheduler) for model in ["llava", "gemma3"] * 4])
+        self.assertEqual(client.order, ["llava"] * 4 + ["gemma3"] * 4)
+        self.assertEqual(scheduler.stats.swaps, 1)
+        self.assertEqual(scheduler.stats.loads, 2)
+        self.assertEqual(scheduler.stats.load_seconds, 4)
+        self.assertEqual(scheduler.stats.requests, {"llava": 4, "gemma3": 4})
+        self.assertIn("8 request(s) for 2 model(s), 1 model swap(s), 2 load(s) taking 4.00s", scheduler.report())
+
+    def test_interactive_request_goes_first(self):
+        client = FakeClient()
+        scheduler = ModelScheduler(client, slots=1, max_loaded_models=1)
+        interactive = scheduler.with_priority(PRIORITY_INTERACTIVE)
+        requests = [("llava", scheduler)] * 4 + [("gemma3", interactive)]
+        self.run_queued(scheduler, client, requests)
+        self.assertEqual(client.order, ["llava", "gemma3", "llava", "llava", "llava"])
+        self.assertEqual(scheduler.stats.swaps, 2)
+        self.assertEqual(scheduler.stats.preemptions, 1)
+
+    def test_models_share_a_backend_within_the_limit(self):
+        client = FakeClient()
+        scheduler = ModelScheduler(client, slots=1, max_loaded_models=2)
+        self.run_queued(scheduler, client, [(model, scheduler) for model in ["llava", "gemma3"] * 2])
+        self.assertEqual(client.order, ["llava", "gemma3"] * 2)
+        self.assertEqual(scheduler.stats.swaps, 0)
+
+    def test_cancel_while_waiting(self):
+        client = FakeClient()
+        scheduler = ModelScheduler(client, slots=1)
+        running = threading.Thread(target=scheduler.generate, args=(b"img", "p", "llava"))
+        running.start()
+        token = CancelToken()
+        errors = []
+
+        def wait():
+            try:
+                scheduler.generate(b"img", "p", "llava", cancel=token)
+            except GenerationCancelled as e:
+                errors.append(e)
+
+        waiting = threading.Thread(target=wait)
+        waiting.start()
+        deadline = time.monotonic() + 2
+        while not scheduler._pending and time.monotonic() < deadline:
+            time.sleep(0.001)
+        token.cancel()
+        waiting.join(2)
+        client.release.set()
+        running.join(2)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(client.order, ["llava"])
+        self.assertEqual(scheduler._pending, [])
+        self.assertEqual(scheduler.hosts[client.base_url].in_flight, 0)
+
+
+
+class TestSchedulerOverPool(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        self.hosts = []
+        for _ in range(2):
+            server, _ = start_server(["llava:latest"])
+            self.servers.append(server)
+            self.hosts.append(f"http://127.0.0.1:{server.server_port}")
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_warm_records_the_model_on_every_backend(self):
+        with ModelScheduler(BackendPool(self.hosts, retries=0)) as scheduler:
+            self.assertEqual(scheduler.warm("llava").done_reason, "load")
+            self.assertEqual([list(scheduler.hosts[url].resident) for url in self.hosts], [["llava"], ["llava"]])
+            self.assertEqual(scheduler.stats.loads, 2)
+
+    def test_failover_moves_the_model_to_the_serving_backend(self):
+        dead = f"http://127.0.0.1:{unused_port()}"
+        live = self.hosts[0]
+        with ModelScheduler(BackendPool([dead, live], retries=0, connect_timeout=1)) as scheduler:
+            self.assertEqual(scheduler.generate(b"img", "p", "llava").host, live)
+            self.assertIn("llava", scheduler.hosts[live].resident)
+            self.assertEqual(scheduler.hosts[dead].in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
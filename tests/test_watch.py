@@ -0,0 +1,160 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from photo_analyzer import GenerationResult
+from photo_analyzer.photo_analyzer import main
+from photo_analyzer.watch import FolderWatch, InotifyWatcher
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def next_ready(watch, timeout=3):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        path = next(watch)
+        if path is not None:
+            return path
+        time.sleep(0.01)
+    return None
+
+
+class TestFolderWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_waits_for_writes_to_settle(self):
+        write(os.path.join(self.tmpdir, "old.jpg"), b"old")
+        watch = FolderWatch(self.tmpdir, settle_seconds=0.3, poll_seconds=0.02, use_inotify=False)
+        path = os.path.join(self.tmpdir, "new.jpg")
+        with open(path, "wb") as f:
+            f.write(b"first half")
+            f.flush()
+            time.sleep(0.1)
+            self.assertIsNone(next(watch))
+            f.write(b" second half")
+        write(os.path.join(self.tmpdir, "notes.txt"), b"not an image")
+        started = time.monotonic()
+        self.assertEqual(next_ready(watch), path)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+        self.assertIsNone(next_ready(watch, timeout=0.5))
+        self.assertGreater(watch.result_latency(path), 0.3)
+        self.assertIn("1 new image(s)", watch.summary())
+        watch.stop()
+        with self.assertRaises(StopIteration):
+            next(watch)
+
+    def test_changed_files_come_back_unless_content_is_the_same(self):
+        watch = FolderWatch(self.tmpdir, settle_seconds=0.05, poll_seconds=0.02, use_inotify=False)
+        path = os.path.join(self.tmpdir, "a.jpg")
+        write(path, b"version 1")
+        self.assertEqual(next_ready(watch), path)
+        # Same bytes, new mtime: recognized by the hash
+        os.utime(path, ns=(time.time_ns() + 10 ** 9, time.time_ns() + 10 ** 9))
+        self.assertIsNone(next_ready(watch, timeout=0.5))
+        self.assertEqual(watch.skipped, 1)
+        write(path, b"version 2")
+        self.assertEqual(next_ready(watch), path)
+
+    def test_ignored_paths_and_idle_stop(self):
+        path = os.path.join(self.tmpdir, "a.jpg")
+        watch = FolderWatch(self.tmpdir, settle_seconds=0.05, poll_seconds=0.02, use_inotify=False,
+                            stop_after_idle=0.3)
+        write(path, b"listed at the start")
+        watch.ignore([path])
+        with self.assertRaises(StopIteration):
+            while True:
+                self.assertIsNone(next(watch))
+                time.sleep(0.01)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux-only")
+    def test_inotify_reports_files_and_new_subfolders(self):
+        watcher = InotifyWatcher(self.tmpdir)
+        try:
+            write(os.path.join(self.tmpdir, "a.jpg"), b"a")
+            sub = os.path.join(self.tmpdir, "card", "DCIM")
+            os.makedirs(sub)
+            write(os.path.join(sub, "b.jpg"), b"b")
+            seen = set()
+            deadline = time.monotonic() + 2
+            while len(seen) < 2 and time.monotonic() < deadline:
+                seen.update(os.path.relpath(p, self.tmpdir) for p, _ in watcher.poll(0.1))
+        finally:
+            watcher.close()
+        self.assertEqual(seen, {"a.jpg", os.path.join("card", "DCIM", "b.jpg")})
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux-only")
+    def test_inotify_waits_for_the_writer_to_close_the_file(self):
+        watch = FolderWatch(self.tmpdir, settle_seconds=0.05)
+        self.assertEqual(watch.backend, "inotify")
+        path = os.path.join(self.tmpdir, "slow.jpg")
+        try:
+            with open(path, "wb") as f:
+                f.write(b"first half")
+                f.flush()
+                # The writer pauses far longer than the settle time
+                self.assertIsNone(next_ready(watch, timeout=0.4))
+                f.write(b" second half")
+            self.assertEqual(next_ready(watch), path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"first half second half")
+            # A file moved in whole is ready at once
+            moved = os.path.join(self.tmpdir, "moved.jpg")
+            write(os.path.join(self.tmpdir, "moved.tmp"), b"done")
+            os.rename(os.path.join(self.tmpdir, "moved.tmp"), moved)
+            self.assertEqual(next_ready(watch), moved)
+        finally:
+            watch.close()
+
+
+class TestWatchMode(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.images = os.path.join(self.tmpdir, "images")
+        os.makedirs(self.images)
+        write(os.path.join(self.images, "a.jpg"), b"a")
+        self.output = os.path.join(self.tmpdir, "out.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_analyzes_existing_then_new_images(self):
+        started = threading.Event()
+
+        def fake_generate(image, prompt, model, **kwargs):
+            started.set()
+            return GenerationResult(text="ok")
+
+        def land():
+            started.wait(5)
+            write(os.path.join(self.images, "b.jpg"), b"b")
+
+        argv = [self.images, "--watch", "--settle", "0.1", "--stop-after-idle", "1", "--output", self.output,
+                "--no-cache", "--no-preprocess", "--no-warm", "--workers", "1", "--in-flight", "1"]
+        thread = threading.Thread(target=land)
+        thread.start()
+        with mock.patch("photo_analyzer.photo_analyzer.generate", side_effect=fake_generate), \
+                mock.patch("sys.stderr"):
+            code = main(argv)
+        thread.join()
+        with open(self.output, encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual(code, 0)
+        self.assertEqual([os.path.basename(r["path"]) for r in results], ["a.jpg", "b.jpg"])
+        self.assertIsNone(results[0]["ingest_seconds"])
+        self.assertGreater(results[1]["ingest_seconds"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()